@@ -4,9 +4,12 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_login import LoginManager
 from datetime import datetime
+from app.cache import AppCache
+from app.database import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 migrate = Migrate()
+cache = AppCache()
 login_manager = LoginManager()
 login_manager.login_view = 'auth.login' # Tên blueprint.tên_hàm_view
 login_manager.login_message = 'Vui lòng đăng nhập để truy cập trang này.'
@@ -17,15 +20,36 @@ def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
 
+    # Profile engine (WAL, PRAGMA, pool...) xem app/database.py
+    from app.database import configure_engine_options, install_sqlite_pragmas
+    configure_engine_options(app)
     db.init_app(app)
+    install_sqlite_pragmas(app, db)
+    # Đo thời gian/số câu SQL theo request, xem /admin/performance (app/instrumentation.py)
+    from app.instrumentation import instrumentation
+    instrumentation.init_app(app, db)
     migrate.init_app(app, db)
     login_manager.init_app(app)
+    cache.init_app(app)
+
+    # Cần import sau khi db được khởi tạo để tránh circular import
+    from app.services.identity import load_identity
 
-    from app.models import User # Cần import sau khi db được khởi tạo để tránh circular import
-    
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        # Danh tính rút gọn, cache theo user id (xem app/services/identity.py)
+        return load_identity(int(user_id))
+
+    from app.services.search import search_index
+    search_index.init_app(app)
+    from app.services.notifications import notification_dispatcher
+    notification_dispatcher.init_app(app)
+    from app.services.events import event_bus
+    event_bus.init_app(app)
+    from app.services.media import media_pipeline
+    media_pipeline.init_app(app)
+    from app.services.stats import stats_collector
+    stats_collector.init_app(app)
 
     # Đăng ký Blueprints
     from app.routes.auth_routes import bp as auth_bp
@@ -37,6 +61,10 @@ def create_app(config_class=Config):
     from app.routes.admin_routes import bp as admin_bp
     app.register_blueprint(admin_bp, url_prefix='/admin')
 
+    # Đăng ký các lệnh CLI (flask recount-post-counters, ...)
+    from app.commands import register_commands
+    register_commands(app)
+
     # Context processor để inject biến vào tất cả templates
     @app.context_processor
     def inject_current_user_role():
@@ -0,0 +1,365 @@
+import bisect
+import json
+import math
+import os
+import platform
+import sqlite3
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from itertools import accumulate
+from sqlalchemy import event, insert, func
+from app import db
+from app.models import User, Post, Genre, PostLike, Comment, Friendship, Notification, post_genres_table
+
+# Bộ benchmark toàn ứng dụng, chạy qua `flask benchmark-app`.
+#
+# 1. Sinh dữ liệu: một DB SQLite riêng (không đụng DB thật) được nạp bằng INSERT hàng loạt
+#    trên các model sẵn có. Khối lượng ở --scale 1.0 là FULL_VOLUMES (100k user, 1M bài,
+#    10M like...). Số bài/like/bình luận/thông báo của mỗi người và số bạn bè đều theo phân
+#    phối đuôi dài (Pareto): số ít người và bài rất "nóng", phần lớn thì ít hoạt động. Các cột
+#    đếm (like_count, comment_count, friend_count, unread_notifications) được tính luôn lúc
+#    sinh nên khớp với dữ liệu. Cùng --seed thì ra cùng dữ liệu và cùng chuỗi request.
+#    feed_entries và chỉ mục tìm kiếm không được nạp vì bảng tin bạn bè và tìm kiếm không
+#    nằm trong kịch bản đo.
+# 2. Đo: gửi request qua test client tới các route trong SCENARIOS, với người dùng đã đăng
+#    nhập và bài/hồ sơ được chọn lệch về phía "nóng" (HOT_SHARE). Mỗi kịch bản cho p50/p90/p99,
+#    số câu SQL mỗi request và thông lượng (request/giây, một luồng); kết quả ghi ra JSON để
+#    so với lần chạy trước (--compare).
+
+FULL_VOLUMES = {
+    'users': 100_000,
+    'posts': 1_000_000,
+    'likes': 10_000_000,
+    'comments': 2_000_000,
+    'friendships': 1_000_000,
+    'notifications': 2_000_000,
+}
+GENRES = 20
+PARETO_ALPHA = 1.5  # càng nhỏ thì đuôi càng dài
+HISTORY_DAYS = 365
+CHUNK_SIZE = 5000  # số bài mỗi lô INSERT/commit
+HOT_SHARE = 0.8  # tỉ lệ request nhắm vào nhóm bài/hồ sơ nóng
+HOT_SET_SIZE = 1000
+UNREAD_SHARE = 0.3  # phần thông báo mới nhất của mỗi người còn chưa đọc
+BENCHMARK_PASSWORD = 'benchmark-password'
+SCENARIOS = ('home', 'view_post', 'profile', 'friends_list', 'notifications', 'like_post', 'login')
+
+_WORDS = ('anime', 'manga', 'tập', 'mới', 'hay', 'quá', 'nhân', 'vật', 'cốt', 'truyện', 'mùa', 'phim',
+          'chương', 'cảnh', 'đánh', 'nhau', 'tình', 'cảm', 'hài', 'hước', 'studio', 'op', 'ed', 'review')
+
+
+def volumes_for(scale):
+    return {name: max(1, int(count * scale)) for name, count in FULL_VOLUMES.items()}
+
+
+def _username(user_id):
+    return f'user{user_id}'
+
+
+def _sentence(rng, words):
+    return ' '.join(rng.choice(_WORDS) for _ in range(words))
+
+
+def _pareto_counts(rng, n, total, cap=None):
+    """Chia total cho n phần tử theo phân phối Pareto; cap là giới hạn của mỗi phần tử."""
+    raw = [rng.paretovariate(PARETO_ALPHA) for _ in range(n)]
+    factor = total / sum(raw)
+    counts = [int(value * factor + rng.random()) for value in raw]
+    if cap is not None:
+        counts = [min(count, cap) for count in counts]
+    return counts
+
+
+class _WeightedPicker:
+    """Chọn id (1..n) theo trọng số, dùng bisect trên tổng tích lũy."""
+
+    def __init__(self, rng, weights):
+        self.rng = rng
+        self.cumulative = list(accumulate(weights))
+        self.total = self.cumulative[-1]
+
+    def pick(self):
+        return bisect.bisect_right(self.cumulative, self.rng.random() * self.total) + 1
+
+    def distinct(self, k, exclude=None):
+        n = len(self.cumulative)
+        if k > n // 10:
+            # Gần như cả tập: chọn đều không lặp cho nhanh và đủ số lượng
+            ids = self.rng.sample(range(1, n + 1), min(k, n))
+            return [i for i in ids if i != exclude]
+        chosen = {self.pick() for _ in range(k)}
+        chosen.discard(exclude)
+        return list(chosen)
+
+
+# --- Sinh dữ liệu ---
+
+def generate_dataset(rng, volumes, echo=print):
+    """Nạp dữ liệu giả vào DB hiện tại (đã create_all, còn trống); trả về số dòng thực tế của mỗi bảng."""
+    from werkzeug.security import generate_password_hash
+    from app.models import password_hash_method
+
+    n_users, n_posts = volumes['users'], volumes['posts']
+    now = datetime.utcnow()
+    start = now - timedelta(days=HISTORY_DAYS)
+    span = (now - start).total_seconds()
+
+    # Mức hoạt động của từng user: ai đăng nhiều thì cũng thích/bình luận nhiều
+    activity = [rng.paretovariate(PARETO_ALPHA) for _ in range(n_users)]
+    users = _WeightedPicker(rng, activity)
+
+    # Quan hệ bạn bè: bậc theo Pareto, nối ưu tiên với người có bậc cao (mỗi cặp một dòng)
+    degrees = _pareto_counts(rng, n_users, volumes['friendships'] * 2, cap=n_users - 1)
+    partners = _WeightedPicker(rng, [degree + 1 for degree in degrees])
+    pairs = set()
+    for user_id, degree in enumerate(degrees, start=1):
+        for friend_id in partners.distinct(degree // 2, exclude=user_id):
+            low, high = min(user_id, friend_id), max(user_id, friend_id)
+            pairs.add(low * (n_users + 1) + high)
+    friend_count = [0] * (n_users + 1)
+    for key in pairs:
+        low, high = divmod(key, n_users + 1)
+        friend_count[low] += 1
+        friend_count[high] += 1
+
+    notification_counts = _pareto_counts(rng, n_users, volumes['notifications'])
+
+    # Băm mật khẩu một lần cho mọi user: băm 100k lần riêng sẽ chiếm gần hết thời gian sinh
+    password_hash = generate_password_hash(BENCHMARK_PASSWORD, method=password_hash_method())
+    echo(f'Đang tạo {n_users} user...')
+    for offset in range(0, n_users, CHUNK_SIZE * 4):
+        db.session.execute(insert(User), [
+            dict(id=user_id, username=_username(user_id), email=f'{_username(user_id)}@example.invalid',
+                 password_hash=password_hash, created_at=start - timedelta(days=1), updated_at=start,
+                 friend_count=friend_count[user_id],
+                 unread_notifications=int(notification_counts[user_id - 1] * UNREAD_SHARE))
+            for user_id in range(offset + 1, min(offset + CHUNK_SIZE * 4, n_users) + 1)
+        ])
+    db.session.execute(insert(Genre), [dict(id=i, name=f'Thể loại {i}') for i in range(1, GENRES + 1)])
+    db.session.commit()
+
+    echo(f'Đang tạo {len(pairs)} quan hệ bạn bè...')
+    rows = []
+    for key in pairs:
+        low, high = divmod(key, n_users + 1)
+        rows.append(dict(user_id=low, friend_id=high, status='accepted', created_at=start, updated_at=start))
+        if len(rows) >= CHUNK_SIZE * 4:
+            db.session.execute(insert(Friendship), rows)
+            rows = []
+    if rows:
+        db.session.execute(insert(Friendship), rows)
+    db.session.commit()
+    del pairs
+
+    # Bài viết theo thứ tự thời gian (id tăng cùng created_at); độ "nóng" của bài quyết định
+    # số like và bình luận của nó
+    like_counts = _pareto_counts(rng, n_posts, volumes['likes'], cap=n_users)
+    ratio = volumes['comments'] / max(1, sum(like_counts))
+    comment_counts = [int(count * ratio + rng.random()) for count in like_counts]
+    echo(f'Đang tạo {n_posts} bài viết kèm like và bình luận...')
+    for offset in range(0, n_posts, CHUNK_SIZE):
+        posts, post_genres, likes, comments = [], [], [], []
+        for post_id in range(offset + 1, min(offset + CHUNK_SIZE, n_posts) + 1):
+            created_at = start + timedelta(seconds=span * post_id / (n_posts + 1))
+            liked_by = users.distinct(like_counts[post_id - 1])
+            n_comments = comment_counts[post_id - 1]
+            posts.append(dict(id=post_id, title=_sentence(rng, 5).capitalize(), content=_sentence(rng, 40),
+                              author_id=users.pick(), created_at=created_at, updated_at=created_at,
+                              like_count=len(liked_by), comment_count=n_comments))
+            for genre_id in rng.sample(range(1, GENRES + 1), rng.randint(1, 3)):
+                post_genres.append(dict(post_id=post_id, genre_id=genre_id))
+            remaining = (now - created_at).total_seconds()
+            for user_id in liked_by:
+                likes.append(dict(user_id=user_id, post_id=post_id,
+                                  created_at=created_at + timedelta(seconds=rng.random() * remaining)))
+            for _ in range(n_comments):
+                at = created_at + timedelta(seconds=rng.random() * remaining)
+                comments.append(dict(post_id=post_id, author_id=users.pick(), content=_sentence(rng, 12),
+                                     created_at=at, updated_at=at))
+        db.session.execute(insert(Post), posts)
+        db.session.execute(insert(post_genres_table), post_genres)
+        if likes:
+            db.session.execute(insert(PostLike), likes)
+        if comments:
+            db.session.execute(insert(Comment), comments)
+        db.session.commit()
+        if (offset // CHUNK_SIZE) % 20 == 19:
+            echo(f'  {offset + len(posts)}/{n_posts} bài')
+
+    echo(f'Đang tạo {sum(notification_counts)} thông báo...')
+    rows = []
+    types = ('new_like', 'new_comment', 'friend_request')
+    for user_id, count in enumerate(notification_counts, start=1):
+        unread = int(count * UNREAD_SHARE)
+        for index in range(count):
+            post_id = rng.randint(1, n_posts)
+            # Các thông báo mới nhất (index nhỏ) là chưa đọc
+            rows.append(dict(user_id=user_id, actor_id=users.pick(), type=rng.choice(types),
+                             content=_sentence(rng, 8), link=f'/post/{post_id}', source_entity_id=post_id,
+                             source_entity_type='post', is_read=index >= unread,
+                             created_at=now - timedelta(seconds=span * (index + rng.random()) / (count + 1))))
+        if len(rows) >= CHUNK_SIZE * 4:
+            db.session.execute(insert(Notification), rows)
+            db.session.commit()
+            rows = []
+    if rows:
+        db.session.execute(insert(Notification), rows)
+    db.session.commit()
+    # INSERT hàng loạt không qua listener của ORM: đếm lại để dashboard admin đúng
+    from app.services.stats import refresh_counts, roll_up_daily_stats
+    refresh_counts()
+    roll_up_daily_stats(backfill_days=HISTORY_DAYS)
+    return table_counts()
+
+
+def table_counts():
+    return {name: db.session.query(func.count()).select_from(model).scalar()
+            for name, model in (('users', User), ('posts', Post), ('likes', PostLike), ('comments', Comment),
+                                ('friendships', Friendship), ('notifications', Notification))}
+
+
+# --- Đo ---
+
+class _Targets:
+    """Chọn bài/hồ sơ cho request: HOT_SHARE từ nhóm nóng nhất, còn lại chọn đều."""
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.max_post_id = db.session.query(func.max(Post.id)).scalar() or 1
+        self.max_user_id = db.session.query(func.max(User.id)).scalar() or 1
+        self.hot_posts = [row[0] for row in db.session.query(Post.id)
+                          .order_by(Post.like_count.desc()).limit(HOT_SET_SIZE)]
+        self.hot_users = [row[0] for row in db.session.query(User.id)
+                          .order_by(User.friend_count.desc()).limit(HOT_SET_SIZE)]
+
+    def post_id(self):
+        if self.hot_posts and self.rng.random() < HOT_SHARE:
+            return self.rng.choice(self.hot_posts)
+        return self.rng.randint(1, self.max_post_id)
+
+    def user_id(self):
+        if self.hot_users and self.rng.random() < HOT_SHARE:
+            return self.rng.choice(self.hot_users)
+        return self.rng.randint(1, self.max_user_id)
+
+
+def _login(client, user_id):
+    return client.post('/auth/login', data={'username_or_email': _username(user_id), 'password': BENCHMARK_PASSWORD})
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    # Nearest-rank: phần tử thứ ceil(q * n)
+    index = min(len(sorted_values) - 1, max(0, math.ceil(q * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def run_scenarios(app, rng, requests, warmup=10, sessions=20, scenarios=SCENARIOS, echo=print):
+    """Chạy từng kịch bản requests lần (sau warmup lần không tính); gọi ngoài app context."""
+    counter = {'active': False, 'queries': 0}
+
+    def count_query(conn, cursor, statement, parameters, context, executemany):
+        if counter['active']:
+            counter['queries'] += 1
+
+    # Các request phải chạy ngoài app context: trong một context đang mở, Flask dùng chung
+    # g và db.session cho mọi request (flask-login giữ luôn user của request đầu tiên)
+    with app.app_context():
+        engines = list(db.engines.values())
+        targets = _Targets(rng)
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', count_query)
+
+    # Một nhóm phiên đã đăng nhập, thiên về những người hoạt động nhiều
+    clients = []
+    for _ in range(sessions):
+        client = app.test_client()
+        _login(client, targets.user_id())
+        clients.append(client)
+
+    def request_for(name):
+        client = rng.choice(clients)
+        if name == 'home':
+            return client.get('/')
+        if name == 'view_post':
+            return client.get(f'/post/{targets.post_id()}')
+        if name == 'profile':
+            return client.get(f'/profile/{_username(targets.user_id())}')
+        if name == 'friends_list':
+            return client.get('/friends')
+        if name == 'notifications':
+            return client.get('/notifications')
+        if name == 'like_post':
+            return client.post(f'/post/{targets.post_id()}/like')
+        if name == 'login':
+            return _login(app.test_client(), targets.user_id())
+        raise ValueError(f'Không có kịch bản {name}')
+
+    results = {}
+    for name in scenarios:
+        for _ in range(warmup):
+            request_for(name)
+        latencies, queries, errors = [], [], Counter()
+        for _ in range(requests):
+            counter['queries'] = 0
+            counter['active'] = True
+            started = time.perf_counter()
+            response = request_for(name)
+            elapsed = time.perf_counter() - started
+            counter['active'] = False
+            latencies.append(elapsed * 1000)
+            queries.append(counter['queries'])
+            if response.status_code >= 400:
+                errors[response.status_code] += 1
+        latencies.sort()
+        results[name] = dict(
+            requests=requests, errors=sum(errors.values()),
+            error_statuses={str(status): count for status, count in sorted(errors.items())},
+            p50_ms=_percentile(latencies, 0.5), p90_ms=_percentile(latencies, 0.9),
+            p99_ms=_percentile(latencies, 0.99), mean_ms=sum(latencies) / len(latencies),
+            max_ms=latencies[-1], queries_per_request=sum(queries) / len(queries), max_queries=max(queries),
+            throughput_rps=len(latencies) / (sum(latencies) / 1000))
+        echo(format_result(name, results[name]))
+
+    for engine in engines:
+        event.remove(engine, 'before_cursor_execute', count_query)
+    return results
+
+
+def format_result(name, result):
+    line = (f'{name:<14} p50 {result["p50_ms"]:8.2f} ms  p99 {result["p99_ms"]:8.2f} ms  '
+            f'{result["queries_per_request"]:5.1f} SQL/req  {result["throughput_rps"]:8.1f} req/s  '
+            f'{result["errors"]} lỗi')
+    if result['errors']:
+        line += ' (' + ', '.join(f'HTTP {status}: {count}' for status, count in result['error_statuses'].items()) + ')'
+    return line
+
+
+def environment():
+    from sqlalchemy import __version__ as sqlalchemy_version
+    return dict(python=platform.python_version(), sqlite=sqlite3.sqlite_version,
+                sqlalchemy=sqlalchemy_version, machine=platform.machine(), cpus=os.cpu_count())
+
+
+def compare(results, baseline, max_regression):
+    """So với kết quả lần trước; trả về danh sách (kịch bản, chỉ số, cũ, mới) bị chậm/tăng quá ngưỡng (%)."""
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get('results', {}).get(name)
+        if previous is None:
+            continue
+        for metric in ('p50_ms', 'p99_ms', 'queries_per_request'):
+            old, new = previous[metric], result[metric]
+            if old and (new - old) / old * 100 > max_regression:
+                regressions.append((name, metric, old, new))
+    return regressions
+
+
+def save_results(path, payload):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
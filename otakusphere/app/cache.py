@@ -0,0 +1,174 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Tầng cache của ứng dụng. Backend mặc định là LRU trong tiến trình có TTL;
+# mọi backend chỉ cần get/set/delete/clear nên có thể thay bằng backend dùng chung
+# (Redis, memcached...) sau này mà không đổi code gọi.
+#
+# Khóa được gom theo namespace ('genres', 'admin_stats', ...). Hủy một namespace
+# bằng cách tăng số phiên bản của nó thay vì duyệt xóa từng khóa, nên cách làm này
+# vẫn đúng với backend dùng chung không hỗ trợ xóa theo tiền tố.
+
+_MISSING = object()
+_NAMESPACE_PREFIX = '__ns__:'
+
+
+class LRUCacheBackend:
+    """Cache trong tiến trình, giới hạn số mục (LRU) và hết hạn theo TTL. Thread-safe."""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        # Phiên bản namespace để riêng, không bị LRU đẩy ra (nếu mất, dữ liệu cũ sẽ "sống lại")
+        self._versions = {}
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            if key.startswith(_NAMESPACE_PREFIX):
+                return self._versions.get(key, _MISSING)
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return _MISSING
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                return _MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            if key.startswith(_NAMESPACE_PREFIX):
+                self._versions[key] = value
+                return
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+            self._versions.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._versions.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class NullCacheBackend:
+    """Backend không lưu gì (CACHE_BACKEND = 'null'), hữu ích khi test hoặc debug."""
+
+    def get(self, key):
+        return _MISSING
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+    def __len__(self):
+        return 0
+
+
+class AppCache:
+    """Extension cache theo kiểu Flask: khởi tạo rỗng rồi gắn vào app bằng init_app."""
+
+    def __init__(self, app=None):
+        self.backend = NullCacheBackend()
+        self.default_ttl = None
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CACHE_BACKEND', 'lru')
+        app.config.setdefault('CACHE_MAX_ENTRIES', 1024)
+        app.config.setdefault('CACHE_DEFAULT_TTL', 300)
+        backend = app.config['CACHE_BACKEND']
+        if backend == 'lru':
+            self.backend = LRUCacheBackend(max_entries=app.config['CACHE_MAX_ENTRIES'])
+        elif backend == 'null':
+            self.backend = NullCacheBackend()
+        else:
+            # Cho phép truyền thẳng một đối tượng backend tự viết
+            self.backend = backend
+        self.default_ttl = app.config['CACHE_DEFAULT_TTL']
+        self._stats = {}
+        app.extensions['app_cache'] = self
+
+    # --- Khóa và phiên bản namespace ---
+    def namespace_version(self, namespace):
+        """Số phiên bản hiện tại của namespace, tăng mỗi lần invalidate()."""
+        version = self.backend.get(_NAMESPACE_PREFIX + namespace)
+        return 0 if version is _MISSING else version
+
+    def _key(self, namespace, key):
+        return f'{namespace}:{self.namespace_version(namespace)}:{key}'
+
+    def _record(self, namespace, hit):
+        with self._stats_lock:
+            stats = self._stats.setdefault(namespace, {'hits': 0, 'misses': 0})
+            stats['hits' if hit else 'misses'] += 1
+
+    # --- API chính ---
+    def get(self, namespace, key, default=None):
+        value = self.backend.get(self._key(namespace, key))
+        self._record(namespace, value is not _MISSING)
+        return default if value is _MISSING else value
+
+    def set(self, namespace, key, value, ttl=None):
+        self.backend.set(self._key(namespace, key), value, ttl if ttl is not None else self.default_ttl)
+
+    def get_or_set(self, namespace, key, factory, ttl=None):
+        full_key = self._key(namespace, key)
+        value = self.backend.get(full_key)
+        self._record(namespace, value is not _MISSING)
+        if value is _MISSING:
+            value = factory()
+            self.backend.set(full_key, value, ttl if ttl is not None else self.default_ttl)
+        return value
+
+    def delete(self, namespace, key):
+        self.backend.delete(self._key(namespace, key))
+
+    def invalidate(self, namespace):
+        """Hủy toàn bộ khóa trong namespace (các mục cũ sẽ bị LRU/TTL dọn dần)."""
+        # Không đặt TTL cho khóa phiên bản để namespace không bị "hồi sinh" dữ liệu cũ
+        self.backend.set(_NAMESPACE_PREFIX + namespace, self.namespace_version(namespace) + 1, None)
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        """Thống kê hit/miss theo namespace và số mục đang lưu của backend."""
+        with self._stats_lock:
+            namespaces = {ns: dict(values) for ns, values in self._stats.items()}
+        hits = sum(values['hits'] for values in namespaces.values())
+        misses = sum(values['misses'] for values in namespaces.values())
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': hits / total if total else 0.0,
+            'entries': len(self.backend),
+            'evictions': getattr(self.backend, 'evictions', 0),
+            'expirations': getattr(self.backend, 'expirations', 0),
+            'namespaces': namespaces,
+        }
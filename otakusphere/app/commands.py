@@ -0,0 +1,361 @@
+import click
+from flask.cli import with_appcontext
+
+# Các lệnh bảo trì chạy qua `flask <lệnh>`, được đăng ký trong create_app
+
+
+@click.command('recount-post-counters')
+@click.option('--batch-size', default=1000, show_default=True, help='Số bài viết mỗi lô UPDATE.')
+@with_appcontext
+def recount_post_counters_command(batch_size):
+    """Tính lại like_count và comment_count của mọi bài viết."""
+    from app.models import Post
+    updated = Post.recount_counters(batch_size=batch_size)
+    click.echo(f'Đã đồng bộ bộ đếm cho {updated} bài viết.')
+
+
+@click.command('recount-unread-notifications')
+@click.option('--batch-size', default=1000, show_default=True, help='Số người dùng mỗi lô UPDATE.')
+@with_appcontext
+def recount_unread_notifications_command(batch_size):
+    """Tính lại bộ đếm thông báo chưa đọc của mọi người dùng."""
+    from app.models import User
+    updated = User.recount_unread_notifications(batch_size=batch_size)
+    click.echo(f'Đã đồng bộ bộ đếm thông báo cho {updated} người dùng.')
+
+
+@click.command('recount-friend-counts')
+@click.option('--batch-size', default=1000, show_default=True, help='Số người dùng mỗi lô UPDATE.')
+@with_appcontext
+def recount_friend_counts_command(batch_size):
+    """Tính lại friend_count của mọi người dùng và bù bảng tin cho tác giả vừa về dưới ngưỡng fan-out."""
+    from flask import current_app
+    from app import db
+    from app.models import User
+    from app.services import timeline
+    threshold = current_app.config['TIMELINE_FANOUT_THRESHOLD']
+
+    def high_fanout_ids():
+        return {row[0] for row in db.session.query(User.id).filter(User.friend_count > threshold)}
+
+    before = high_fanout_ids()
+    updated = User.recount_friend_counts(batch_size=batch_size)
+    # Trước đây được lấy lúc đọc, từ nay fan-out khi ghi: bài cũ của họ chưa có trong bảng tin bạn bè
+    backfilled = 0
+    for user_id in sorted(before - high_fanout_ids()):
+        backfilled += timeline.backfill_author(user_id)
+        db.session.commit()
+    click.echo(f'Đã đồng bộ số bạn bè cho {updated} người dùng, thêm {backfilled} mục bảng tin.')
+
+
+@click.command('rebuild-search-index')
+@click.option('--batch-size', default=1000, show_default=True, help='Số bản ghi mỗi lô khi đọc dữ liệu.')
+@with_appcontext
+def rebuild_search_index_command(batch_size):
+    """Dựng lại chỉ mục tìm kiếm cho toàn bộ bài viết và bình luận."""
+    from app import db
+    from app.services.search import search_index
+    backend = search_index.rebuild(batch_size=batch_size)
+    db.session.commit()
+    click.echo(f'Đã dựng lại chỉ mục tìm kiếm (backend: {backend}).')
+
+
+@click.command('compact-notifications')
+@click.option('--days', type=int, default=None, help='Số ngày giữ lại (mặc định NOTIFICATION_RETENTION_DAYS).')
+@click.option('--archive/--delete', default=None, help='Lưu trữ thay vì xóa (mặc định NOTIFICATION_RETENTION_MODE).')
+@click.option('--batch-size', default=1000, show_default=True, help='Số thông báo mỗi lô DELETE.')
+@with_appcontext
+def compact_notifications_command(days, archive, batch_size):
+    """Xóa hoặc lưu trữ các thông báo đã đọc quá hạn."""
+    from flask import current_app
+    from app.services.notifications import compact_notifications
+    if days is None:
+        days = current_app.config['NOTIFICATION_RETENTION_DAYS']
+    if archive is None:
+        archive = current_app.config['NOTIFICATION_RETENTION_MODE'] == 'archive'
+    removed = compact_notifications(days, archive=archive, batch_size=batch_size)
+    click.echo(f'Đã {"lưu trữ" if archive else "xóa"} {removed} thông báo đã đọc cũ hơn {days} ngày.')
+
+
+@click.command('benchmark-mark-read')
+@click.option('--rows', default=10000, show_default=True, help='Số thông báo chưa đọc dùng để đo.')
+@with_appcontext
+def benchmark_mark_read_command(rows):
+    """So sánh đánh dấu đã đọc kiểu cũ (từng dòng qua ORM) với một câu UPDATE.
+
+    Dữ liệu thử được tạo trong một transaction và rollback sau mỗi lần đo, nên có thể chạy
+    trên DB thật mà không để lại gì.
+    """
+    import time
+    from sqlalchemy import insert
+    from app import db
+    from app.models import User, Notification
+    from app.services.notifications import mark_read
+
+    def seed():
+        user = User(username='__benchmark_mark_read__', email='benchmark-mark-read@example.invalid',
+                    password_hash='!', unread_notifications=rows)
+        db.session.add(user)
+        db.session.flush()
+        db.session.execute(insert(Notification), [
+            dict(user_id=user.id, type='new_like' if i % 2 else 'new_comment', content=f'benchmark {i}', is_read=False)
+            for i in range(rows)
+        ])
+        return user
+
+    def legacy(user):
+        # Cách cũ: nạp mọi thông báo chưa đọc, đổi cờ trong vòng lặp, flush từng UPDATE
+        for notification in Notification.query.filter_by(user_id=user.id, is_read=False).all():
+            notification.is_read = True
+        user.reset_unread_notifications()
+        db.session.flush()
+
+    results = {}
+    for label, action in (('ORM từng dòng', legacy), ('UPDATE một câu', mark_read)):
+        user = seed()
+        started = time.perf_counter()
+        action(user)
+        results[label] = time.perf_counter() - started
+        remaining = Notification.query.filter_by(user_id=user.id, is_read=False).count()
+        db.session.rollback()
+        click.echo(f'{label:<16} {results[label] * 1000:10.1f} ms  (còn {remaining} chưa đọc)')
+    legacy_time, bulk_time = results.values()
+    click.echo(f'{rows} thông báo: nhanh hơn {legacy_time / bulk_time:.1f} lần.' if bulk_time else '')
+
+
+@click.command('sync-sqlite-replicas')
+@with_appcontext
+def sync_sqlite_replicas_command():
+    """Chép DB SQLite chính sang các replica SQLite (dùng để chạy thử định tuyến replica ở máy local)."""
+    import sqlite3
+    from flask import current_app
+    from app import db
+    from app.database import replica_bind_keys
+    # URL của engine: Flask-SQLAlchemy đã đổi đường dẫn SQLite tương đối thành đường dẫn trong instance/
+    primary = db.engine.url
+    if primary.get_backend_name() != 'sqlite' or not primary.database:
+        raise click.ClickException('Chỉ hỗ trợ khi DB chính là một file SQLite.')
+    source = sqlite3.connect(primary.database)
+    try:
+        for key in replica_bind_keys(current_app):
+            replica = db.engines[key].url
+            if replica.get_backend_name() != 'sqlite' or not replica.database:
+                click.echo(f'Bỏ qua {replica}: không phải file SQLite.')
+                continue
+            # Backup API chép nhất quán kể cả khi DB chính đang được ghi
+            target = sqlite3.connect(replica.database)
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+            click.echo(f'Đã đồng bộ {replica.database}.')
+    finally:
+        source.close()
+
+
+@click.command('audit-queries')
+@click.option('--min-rows', default=1000, show_default=True,
+              help='Quét toàn bảng trên bảng lớn hơn ngưỡng này bị coi là lỗi.')
+@click.option('--verbose', is_flag=True, help='In cả câu SQL của từng lần quét.')
+@with_appcontext
+def audit_queries_command(min_rows, verbose):
+    """Chạy EXPLAIN QUERY PLAN cho các truy vấn nóng, thoát với mã lỗi nếu có quét toàn bảng lớn."""
+    from app.query_audit import run_audit, registered_queries
+    try:
+        findings, skipped = run_audit()
+    except RuntimeError as exc:
+        raise click.ClickException(str(exc))
+    for name, missing in skipped.items():
+        click.echo(f'[bỏ qua] {name}: DB chưa có dữ liệu mẫu ({", ".join(missing)}).')
+    failures = [f for f in findings if f.is_failure(min_rows)]
+    for finding in findings:
+        if finding.is_failure(min_rows):
+            status = 'LỖI'
+        elif finding.allowed:
+            status = 'cho phép'
+        else:
+            status = 'bảng nhỏ'
+        click.echo(f'[{status}] {finding.query_name}: {finding.detail} ({finding.rows} dòng)')
+        if verbose:
+            click.echo(f'    {finding.statement}')
+    click.echo(f'Đã kiểm tra {len(registered_queries()) - len(skipped)} nhóm truy vấn, '
+               f'{len(failures)} lần quét toàn bảng vượt ngưỡng.')
+    if failures:
+        raise SystemExit(1)
+
+
+@click.command('benchmark-login')
+@click.option('--attempts', default=20, show_default=True, help='Số lần đăng nhập đo cho mỗi thuật toán.')
+@click.option('--method', 'methods', multiple=True,
+              help='Thuật toán băm cần so sánh (lặp lại được); mặc định PASSWORD_HASH_METHOD và vài mức phổ biến.')
+@with_appcontext
+def benchmark_login_command(attempts, methods):
+    """Đo thông lượng đăng nhập: tra cứu user (2 câu cũ so với 1 câu OR) và chi phí kiểm tra mật khẩu."""
+    import time
+    from sqlalchemy import or_, case
+    from werkzeug.security import generate_password_hash, check_password_hash
+    from app import db
+    from app.models import User, password_hash_method
+
+    # Tra cứu user: chạy trong transaction rồi rollback nên không để lại dữ liệu
+    user = User(username='__benchmark_login__', email='benchmark-login@example.invalid', password_hash='!')
+    db.session.add(user)
+    db.session.flush()
+    identifier = user.email
+    lookups = {
+        '2 câu (cũ)': lambda: User.query.filter_by(username=identifier).first()
+                               or User.query.filter_by(email=identifier).first(),
+        '1 câu OR': lambda: User.query.filter(or_(User.username == identifier, User.email == identifier))
+                                     .order_by(case((User.username == identifier, 0), else_=1)).first(),
+    }
+    for label, lookup in lookups.items():
+        started = time.perf_counter()
+        for _ in range(attempts * 50):
+            db.session.expire_all()
+            lookup()
+        elapsed = (time.perf_counter() - started) / (attempts * 50)
+        click.echo(f'Tra cứu {label:<12} {elapsed * 1000:8.3f} ms/lần')
+    db.session.rollback()
+
+    # Kiểm tra mật khẩu: phần chiếm CPU chính khi có nhiều lượt đăng nhập cùng lúc
+    methods = list(methods) or list(dict.fromkeys([password_hash_method(), 'scrypt:32768:8:1',
+                                                   'scrypt:16384:8:1', 'pbkdf2:sha256:600000',
+                                                   'pbkdf2:sha256:260000']))
+    for method in methods:
+        hashed = generate_password_hash('benchmark-password', method=method)
+        started = time.perf_counter()
+        for _ in range(attempts):
+            check_password_hash(hashed, 'benchmark-password')
+        elapsed = (time.perf_counter() - started) / attempts
+        marker = ' (đang dùng)' if method == password_hash_method() else ''
+        click.echo(f'{method:<24} {elapsed * 1000:8.1f} ms/lần  ~{1 / elapsed:7.1f} lần đăng nhập/giây/lõi{marker}')
+
+
+@click.command('benchmark-app')
+@click.option('--db', 'db_path', type=click.Path(dir_okay=False),
+              help='File SQLite riêng cho benchmark (mặc định instance/benchmark.db, không dùng DB của ứng dụng).')
+@click.option('--scale', default=0.01, show_default=True,
+              help='Tỉ lệ so với khối lượng đầy đủ (100k user, 1M bài, 10M like...).')
+@click.option('--seed', default=42, show_default=True, help='Seed cho dữ liệu và chuỗi request.')
+@click.option('--regenerate', is_flag=True, help='Sinh lại dữ liệu kể cả khi DB đã có với cùng scale/seed.')
+@click.option('--requests', 'requests_per_scenario', default=200, show_default=True,
+              help='Số request đo cho mỗi kịch bản.')
+@click.option('--warmup', default=10, show_default=True, help='Số request chạy trước, không tính vào kết quả.')
+@click.option('--sessions', default=20, show_default=True, help='Số người dùng đăng nhập luân phiên gửi request.')
+@click.option('--scenario', 'scenarios', multiple=True, help='Chỉ chạy các kịch bản này (lặp lại được).')
+@click.option('--output', type=click.Path(dir_okay=False), help='Ghi kết quả ra file JSON.')
+@click.option('--compare', 'baseline_path', type=click.Path(exists=True, dir_okay=False),
+              help='File JSON của lần chạy trước để so sánh.')
+@click.option('--max-regression', default=20.0, show_default=True,
+              help='Phần trăm tăng tối đa của p50/p99/số SQL so với --compare trước khi báo lỗi.')
+@with_appcontext
+def benchmark_app_command(db_path, scale, seed, regenerate, requests_per_scenario, warmup, sessions,
+                          scenarios, output, baseline_path, max_regression):
+    """Sinh dữ liệu giả quy mô lớn rồi đo độ trễ, số câu SQL và thông lượng của các route chính."""
+    import json
+    import os
+    import random
+    import time
+    from datetime import datetime
+    from flask import current_app
+    from config import Config
+    from app import create_app, db
+    from app import benchmark
+
+    scenarios = list(scenarios) or list(benchmark.SCENARIOS)
+    unknown = set(scenarios) - set(benchmark.SCENARIOS)
+    if unknown:
+        raise click.ClickException(f'Không có kịch bản: {", ".join(sorted(unknown))}')
+    if db_path is None:
+        os.makedirs(current_app.instance_path, exist_ok=True)
+        db_path = os.path.join(current_app.instance_path, 'benchmark.db')
+    db_path = os.path.abspath(db_path)
+    meta_path = db_path + '.json'
+    volumes = benchmark.volumes_for(scale)
+    meta = None
+    if os.path.exists(meta_path) and os.path.exists(db_path):
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+    if regenerate or meta is None or meta.get('scale') != scale or meta.get('seed') != seed:
+        meta = None
+        for suffix in ('', '-wal', '-shm', '.json'):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+
+    # App riêng trỏ vào DB benchmark; thông báo gửi đồng bộ để số SQL của request là đầy đủ,
+    # tắt job nền số liệu dashboard để nó không chạy chen vào lúc đo
+    config_class = type('BenchmarkConfig', (Config,), dict(
+        SQLALCHEMY_DATABASE_URI=f'sqlite:///{db_path}', SQLALCHEMY_BINDS={}, DATABASE_REPLICA_URIS=[],
+        WTF_CSRF_ENABLED=False, NOTIFICATION_DISPATCH='sync', STATS_ROLLUP_INTERVAL=0))
+    app = create_app(config_class)
+    with app.app_context():
+        if meta is None:
+            db.create_all()
+            started = time.perf_counter()
+            counts = benchmark.generate_dataset(random.Random(seed), volumes, echo=click.echo)
+            meta = dict(scale=scale, seed=seed, counts=counts, generated_at=datetime.utcnow().isoformat(),
+                        generation_seconds=round(time.perf_counter() - started, 1))
+            with open(meta_path, 'w', encoding='utf-8') as f:
+                json.dump(meta, f, indent=2)
+            click.echo(f'Đã sinh dữ liệu trong {meta["generation_seconds"]} giây.')
+        else:
+            click.echo(f'Dùng lại dữ liệu có sẵn trong {db_path}.')
+        click.echo(', '.join(f'{name}: {count}' for name, count in meta['counts'].items()))
+    results = benchmark.run_scenarios(app, random.Random(seed), requests_per_scenario, warmup=warmup,
+                                      sessions=sessions, scenarios=scenarios, echo=click.echo)
+
+    payload = dict(started_at=datetime.utcnow().isoformat(), scale=scale, seed=seed, counts=meta['counts'],
+                   requests=requests_per_scenario, environment=benchmark.environment(), results=results)
+    if output:
+        benchmark.save_results(output, payload)
+        click.echo(f'Đã ghi kết quả vào {output}.')
+    regressions = []
+    if baseline_path:
+        with open(baseline_path, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('counts') != meta['counts']:
+            click.echo('Lưu ý: lần chạy trước dùng bộ dữ liệu khác, so sánh chỉ mang tính tham khảo.')
+        regressions = benchmark.compare(results, baseline, max_regression)
+        for name, metric, old, new in regressions:
+            click.echo(f'[CHẬM HƠN] {name} {metric}: {old:.2f} -> {new:.2f}')
+        if not regressions:
+            click.echo(f'Không kịch bản nào tệ hơn quá {max_regression:g}% so với {baseline_path}.')
+    # Request lỗi (4xx/5xx) thường nhanh bất thường và làm số liệu đẹp giả, nên coi cả lần chạy là hỏng
+    failed = [name for name, result in results.items() if result['errors']]
+    for name in failed:
+        click.echo(f'[LỖI] {name}: {results[name]["errors"]}/{results[name]["requests"]} request lỗi.', err=True)
+    if regressions or failed:
+        raise SystemExit(1)
+
+
+@click.command('rollup-stats')
+@click.option('--rebuild', is_flag=True, help='Xóa và tính lại toàn bộ daily_stats trong --days ngày.')
+@click.option('--days', type=int, default=None, help='Số ngày backfill (mặc định STATS_BACKFILL_DAYS).')
+@with_appcontext
+def rollup_stats_command(rebuild, days):
+    """Tổng hợp số liệu theo ngày và đếm lại bộ đếm của dashboard admin (việc của job nền)."""
+    from flask import current_app
+    from app import db
+    from app.models import DailyStat
+    from app.services.stats import roll_up_daily_stats, refresh_counts
+    if rebuild:
+        DailyStat.query.delete()
+        db.session.commit()
+    rows = roll_up_daily_stats(backfill_days=days or current_app.config['STATS_BACKFILL_DAYS'])
+    counts = refresh_counts()
+    click.echo(f'Đã tổng hợp {rows} dòng số liệu theo ngày.')
+    click.echo(', '.join(f'{name}: {count}' for name, count in counts.items()))
+
+
+def register_commands(app):
+    app.cli.add_command(recount_post_counters_command)
+    app.cli.add_command(recount_unread_notifications_command)
+    app.cli.add_command(recount_friend_counts_command)
+    app.cli.add_command(rebuild_search_index_command)
+    app.cli.add_command(compact_notifications_command)
+    app.cli.add_command(benchmark_mark_read_command)
+    app.cli.add_command(sync_sqlite_replicas_command)
+    app.cli.add_command(audit_queries_command)
+    app.cli.add_command(benchmark_login_command)
+    app.cli.add_command(benchmark_app_command)
+    app.cli.add_command(rollup_stats_command)
@@ -0,0 +1,184 @@
+import random
+import time
+from functools import wraps
+from flask import current_app, request, has_request_context, session as flask_session
+from flask_sqlalchemy.session import Session as FlaskSession
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.sql import Select, TextClause
+
+# Cấu hình engine theo DATABASE_PROFILE, áp dụng trong create_app.
+#
+#   - 'tuned' (mặc định): với SQLite bật WAL (người đọc không bị chặn bởi người ghi),
+#     synchronous=NORMAL (an toàn với WAL, bớt fsync mỗi commit), cache/mmap lớn hơn,
+#     busy_timeout để chờ khóa thay vì lỗi "database is locked" ngay, và foreign_keys=ON
+#     để các ràng buộc ondelete='CASCADE'/'SET NULL' trong models thực sự có hiệu lực
+#     (SQLite tắt kiểm tra khóa ngoại theo mặc định). Với MySQL/PostgreSQL: pool có
+#     pre-ping và recycle để không dùng lại kết nối đã bị server đóng.
+#   - 'none': để nguyên mặc định của SQLAlchemy/SQLite.
+#
+# SQLALCHEMY_ENGINE_OPTIONS và SQLITE_PRAGMAS trong config được ưu tiên hơn giá trị của profile.
+#
+# Định tuyến đọc sang replica (DATABASE_REPLICA_URIS): mỗi replica là một bind 'replica_<n>'.
+# Chỉ các route GET được đánh dấu @read_replica mới đọc từ replica; mọi câu ghi (flush,
+# INSERT/UPDATE/DELETE, DDL) luôn đi vào primary, và từ lúc session đã ghi thì các câu đọc
+# sau đó trong cùng session cũng về primary. Sau khi một request commit có ghi, client được
+# "dính" vào primary thêm DATABASE_REPLICA_STICKY_SECONDS giây (lưu trong cookie session)
+# để đọc được chính dữ liệu vừa ghi dù replica còn trễ, ví dụ like_post rồi chuyển hướng
+# về view_post.
+
+_USE_REPLICA = 'use_replica'
+_WROTE = 'wrote_to_primary'
+_STICKY_KEY = '_db_primary_until'
+REPLICA_BIND_PREFIX = 'replica_'
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'foreign_keys': 'ON',
+    'busy_timeout': 5000,  # mili giây
+    'cache_size': -64000,  # số âm: đơn vị KiB, tức ~64 MB mỗi kết nối
+    'mmap_size': 268435456,  # 256 MB
+    'temp_store': 'MEMORY',
+}
+
+SERVER_ENGINE_OPTIONS = {
+    'pool_size': 10,
+    'max_overflow': 20,
+    'pool_timeout': 30,
+    'pool_recycle': 1800,  # nhỏ hơn wait_timeout mặc định của MySQL
+    'pool_pre_ping': True,
+}
+
+
+def _is_sqlite(uri):
+    return make_url(uri).get_backend_name() == 'sqlite'
+
+
+def _is_memory_sqlite(uri):
+    return make_url(uri).database in (None, '', ':memory:')
+
+
+def engine_options(app, uri):
+    """Tùy chọn create_engine cho một URI theo profile hiện tại."""
+    if app.config['DATABASE_PROFILE'] == 'none':
+        return {}
+    if not _is_sqlite(uri):
+        return dict(SERVER_ENGINE_OPTIONS)
+    if _is_memory_sqlite(uri):
+        # sqlite:// dùng pool riêng của SQLAlchemy (một kết nối mỗi luồng), giữ nguyên
+        return {}
+    # File SQLite: dùng chung kết nối giữa các luồng của pool; timeout khớp busy_timeout
+    busy_timeout = sqlite_pragmas(app).get('busy_timeout', 5000)
+    return {
+        'pool_size': 10,
+        'max_overflow': 10,
+        'connect_args': {'check_same_thread': False, 'timeout': busy_timeout / 1000},
+    }
+
+
+def sqlite_pragmas(app):
+    if app.config['DATABASE_PROFILE'] == 'none':
+        return dict(app.config.get('SQLITE_PRAGMAS') or {})
+    return {**SQLITE_PRAGMAS, **(app.config.get('SQLITE_PRAGMAS') or {})}
+
+
+def configure_engine_options(app):
+    """Ghép tùy chọn của profile vào SQLALCHEMY_ENGINE_OPTIONS và khai báo bind replica; gọi trước db.init_app."""
+    app.config.setdefault('DATABASE_PROFILE', 'tuned')
+    app.config.setdefault('DATABASE_REPLICA_URIS', [])
+    app.config.setdefault('DATABASE_REPLICA_STICKY_SECONDS', 5)
+    options = engine_options(app, app.config['SQLALCHEMY_DATABASE_URI'])
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    for index, uri in enumerate(app.config['DATABASE_REPLICA_URIS']):
+        # SQLALCHEMY_ENGINE_OPTIONS vẫn áp dụng cho mọi bind; đây chỉ là phần riêng theo URI
+        binds[f'{REPLICA_BIND_PREFIX}{index}'] = {'url': uri, **engine_options(app, uri)}
+    app.config['SQLALCHEMY_BINDS'] = binds
+
+
+def replica_bind_keys(app):
+    return [f'{REPLICA_BIND_PREFIX}{index}' for index in range(len(app.config['DATABASE_REPLICA_URIS']))]
+
+
+def install_sqlite_pragmas(app, db):
+    """Chạy các PRAGMA trên mỗi kết nối SQLite mới của mọi engine; gọi sau db.init_app."""
+    pragmas = sqlite_pragmas(app)
+    if not pragmas:
+        return
+    with app.app_context():
+        engines = list(db.engines.values())
+    for engine in engines:
+        if engine.dialect.name != 'sqlite':
+            continue
+        memory = _is_memory_sqlite(str(engine.url))
+
+        @event.listens_for(engine, 'connect')
+        def _set_pragmas(dbapi_connection, connection_record, memory=memory):
+            cursor = dbapi_connection.cursor()
+            for name, value in pragmas.items():
+                if memory and name in ('journal_mode', 'mmap_size'):
+                    continue  # không áp dụng cho DB trong bộ nhớ
+                cursor.execute(f'PRAGMA {name} = {value}')
+            cursor.close()
+
+
+def _is_read(clause):
+    if isinstance(clause, Select):
+        return True
+    if isinstance(clause, TextClause):
+        return clause.text.lstrip().upper().startswith(('SELECT', 'WITH'))
+    return False
+
+
+class RoutingSession(FlaskSession):
+    """Session của db: câu đọc trong route @read_replica đi tới replica, còn lại tới primary."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and _is_read(clause):
+            if self.info.get(_USE_REPLICA):
+                replica = self._replica_engine()
+                if replica is not None:
+                    return replica
+        elif bind is None:
+            # Ghi (hoặc không xác định được): primary, và các câu đọc sau đó cũng về primary
+            self.info[_USE_REPLICA] = False
+            self.info[_WROTE] = True
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _replica_engine(self):
+        # Chọn ngẫu nhiên một replica cho cả session để các câu đọc nhất quán với nhau
+        key = self.info.get('replica_bind')
+        if key is None:
+            keys = replica_bind_keys(current_app)
+            if not keys:
+                return None
+            key = self.info['replica_bind'] = random.choice(keys)
+        return self._db.engines[key]
+
+
+def read_replica(f):
+    """Đánh dấu route chỉ đọc: các câu SELECT của request GET được gửi tới replica."""
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        if request.method in ('GET', 'HEAD') and flask_session.get(_STICKY_KEY, 0) < time.time():
+            from app import db
+            db.session().info[_USE_REPLICA] = True
+        return f(*args, **kwargs)
+    return wrapper
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _stick_to_primary(session):
+    # Read-your-writes: client vừa ghi thì đọc từ primary trong vài giây tiếp theo
+    if session.info.pop(_WROTE, False) and has_request_context():
+        sticky = current_app.config['DATABASE_REPLICA_STICKY_SECONDS']
+        if sticky and current_app.config['DATABASE_REPLICA_URIS']:
+            flask_session[_STICKY_KEY] = time.time() + sticky
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _forget_writes(session):
+    session.info.pop(_WROTE, None)
@@ -1,8 +1,9 @@
 from flask_wtf import FlaskForm
 from flask_wtf.file import FileField, FileAllowed # Import FileField và FileAllowed
 from wtforms import StringField, PasswordField, BooleanField, SubmitField, TextAreaField, SelectMultipleField
-from wtforms.validators import DataRequired, Email, EqualTo, ValidationError, Length, Optional # Thêm Optional
-from app.models import User, Genre
+from wtforms.validators import DataRequired, Email, EqualTo, ValidationError, Length, Optional, URL # Thêm Optional
+from app.models import Genre
+from app.services.genres import genre_catalog
 
 class LoginForm(FlaskForm):
     username_or_email = StringField('Tên đăng nhập hoặc Email', validators=[DataRequired()])
@@ -17,16 +18,7 @@ class RegistrationForm(FlaskForm):
     password2 = PasswordField(
         'Nhập lại mật khẩu', validators=[DataRequired(), EqualTo('password', message='Mật khẩu không khớp.')])
     submit = SubmitField('Đăng ký')
-
-    def validate_username(self, username):
-        user = User.query.filter_by(username=username.data).first()
-        if user:
-            raise ValidationError('Tên đăng nhập này đã được sử dụng.')
-
-    def validate_email(self, email):
-        user = User.query.filter_by(email=email.data).first()
-        if user:
-            raise ValidationError('Địa chỉ email này đã được sử dụng.')
+    # Trùng tên đăng nhập/email được phát hiện bằng ràng buộc UNIQUE khi chèn (xem auth.register)
 
 class PostForm(FlaskForm):
     title = StringField('Tiêu đề', validators=[DataRequired(), Length(max=100)])
@@ -48,14 +40,14 @@ class PostForm(FlaskForm):
     
     # Trường để nhúng URL video
     video_embed_url = StringField('Hoặc nhúng URL video (YouTube, Vimeo, etc. - tùy chọn)', 
-                                  validators=[Length(max=255), Optional()])
+                                  validators=[Optional(), Length(max=255), URL(message='URL video không hợp lệ.')])
 
     submit = SubmitField('Đăng bài')
 
     def __init__(self, *args, **kwargs):
         super(PostForm, self).__init__(*args, **kwargs)
-        # Query tất cả genres để hiển thị trong SelectMultipleField
-        self.genres.choices = [(g.id, g.name) for g in Genre.query.order_by('name').all()]
+        # Lấy danh sách genres từ danh mục trong bộ nhớ để hiển thị trong SelectMultipleField
+        self.genres.choices = list(genre_catalog().choices)
 
 class CommentForm(FlaskForm):
     content = TextAreaField('Bình luận', validators=[DataRequired()])
@@ -0,0 +1,220 @@
+import cProfile
+import io
+import pstats
+import random
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+from flask import g, request, has_request_context
+from sqlalchemy import event
+
+# Đo hiệu năng theo request, bật trong create_app (INSTRUMENTATION_ENABLED).
+#
+# Với mỗi request ghi lại thời gian xử lý vào histogram theo endpoint, cùng số câu SQL và
+# tổng thời gian SQL (đếm bằng before/after_cursor_execute trên mọi engine, kể cả replica).
+# Một câu SELECT giống hệt nhau (cùng chuỗi SQL, chỉ khác tham số) chạy từ
+# INSTRUMENTATION_N_PLUS_ONE_THRESHOLD lần trở lên trong một request bị coi là dấu hiệu N+1:
+# ghi log cảnh báo và lưu vào danh sách gần đây. INSTRUMENTATION_PROFILE_RATE (0..1) là tỉ lệ
+# request được chạy dưới cProfile; kết quả (các hàm tốn nhiều thời gian nhất) được giữ lại
+# INSTRUMENTATION_PROFILE_KEEP bản gần nhất.
+#
+# Số liệu chỉ nằm trong bộ nhớ của tiến trình hiện tại (reset khi khởi động lại) và được
+# xem tại /admin/performance.
+
+_G_KEY = '_instrumentation'
+_QUERY_START = 'instrumentation_query_start'
+# Cận trên (ms) của các ô histogram; ô cuối nhận mọi giá trị lớn hơn
+LATENCY_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float('inf'))
+
+
+class RequestStats:
+    """Số liệu của request đang chạy, giữ trong flask.g."""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.status = 500  # after_request không chạy khi view ném exception
+        self.sql_count = 0
+        self.sql_ms = 0.0
+        self.statements = Counter()
+        self.profiler = None
+
+
+class EndpointStats:
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.sql_count = 0
+        self.sql_ms = 0.0
+        self.max_sql_count = 0
+        self.n_plus_one = 0
+
+    def add(self, duration_ms, stats, suspects):
+        self.requests += 1
+        if stats.status >= 500:
+            self.errors += 1
+        self.total_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if duration_ms <= bound:
+                self.buckets[index] += 1
+                break
+        self.sql_count += stats.sql_count
+        self.sql_ms += stats.sql_ms
+        self.max_sql_count = max(self.max_sql_count, stats.sql_count)
+        if suspects:
+            self.n_plus_one += 1
+
+    def percentile(self, q):
+        """Ước lượng phân vị q (0..1) theo cận trên của ô histogram chứa nó."""
+        if not self.requests:
+            return 0.0
+        target = q * self.requests
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.buckets):
+            seen += count
+            if seen >= target:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+    def as_dict(self):
+        requests = self.requests or 1
+        return dict(requests=self.requests, errors=self.errors,
+                    avg_ms=self.total_ms / requests, max_ms=self.max_ms,
+                    p50_ms=self.percentile(0.5), p95_ms=self.percentile(0.95), p99_ms=self.percentile(0.99),
+                    avg_sql_count=self.sql_count / requests, max_sql_count=self.max_sql_count,
+                    avg_sql_ms=self.sql_ms / requests, n_plus_one=self.n_plus_one,
+                    buckets=list(zip(LATENCY_BUCKETS, self.buckets)))
+
+
+class Instrumentation:
+
+    def __init__(self):
+        self.app = None
+        self.started_at = datetime.utcnow()
+        self._endpoints = {}
+        self._suspects = deque(maxlen=50)
+        self._profiles = deque(maxlen=20)
+        self._lock = threading.Lock()
+
+    def init_app(self, app, db):
+        """Gắn hook request và listener SQL; gọi sau db.init_app."""
+        app.config.setdefault('INSTRUMENTATION_ENABLED', True)
+        app.config.setdefault('INSTRUMENTATION_PROFILE_RATE', 0.0)
+        app.config.setdefault('INSTRUMENTATION_PROFILE_KEEP', 20)
+        app.config.setdefault('INSTRUMENTATION_N_PLUS_ONE_THRESHOLD', 5)
+        self.app = app
+        app.extensions['instrumentation'] = self
+        if not app.config['INSTRUMENTATION_ENABLED']:
+            return
+        self._profiles = deque(maxlen=app.config['INSTRUMENTATION_PROFILE_KEEP'])
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        with app.app_context():
+            engines = list(db.engines.values())
+        for engine in engines:
+            event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+    @property
+    def enabled(self):
+        return self.app is not None and self.app.config['INSTRUMENTATION_ENABLED']
+
+    # --- Hook request ---
+    def _before_request(self):
+        stats = RequestStats()
+        rate = self.app.config['INSTRUMENTATION_PROFILE_RATE']
+        if rate and random.random() < rate:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+                stats.profiler = profiler
+            except ValueError:
+                pass  # đã có profiler khác đang chạy (Python 3.12+ chỉ cho một)
+        setattr(g, _G_KEY, stats)
+
+    def _after_request(self, response):
+        stats = g.get(_G_KEY)
+        if stats is not None:
+            stats.status = response.status_code
+        return response
+
+    def _teardown_request(self, exc):
+        stats = g.pop(_G_KEY, None)
+        if stats is None:
+            return
+        duration_ms = (time.perf_counter() - stats.started_at) * 1000
+        if stats.profiler is not None:
+            stats.profiler.disable()
+        endpoint = request.endpoint or '(không khớp route)'
+        threshold = self.app.config['INSTRUMENTATION_N_PLUS_ONE_THRESHOLD']
+        suspects = [(statement, count) for statement, count in stats.statements.most_common()
+                    if count >= threshold]
+        with self._lock:
+            endpoint_stats = self._endpoints.get(endpoint)
+            if endpoint_stats is None:
+                endpoint_stats = self._endpoints[endpoint] = EndpointStats()
+            endpoint_stats.add(duration_ms, stats, suspects)
+            for statement, count in suspects:
+                self._suspects.append(dict(at=datetime.utcnow(), endpoint=endpoint, path=request.path,
+                                           count=count, statement=statement))
+        for statement, count in suspects:
+            self.app.logger.warning('Nghi N+1 tại %s: câu SQL chạy %d lần trong một request: %s',
+                                    endpoint, count, statement[:200])
+        if stats.profiler is not None:
+            self._save_profile(stats.profiler, endpoint, duration_ms)
+
+    def _save_profile(self, profiler, endpoint, duration_ms):
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(30)
+        with self._lock:
+            self._profiles.append(dict(at=datetime.utcnow(), endpoint=endpoint, path=request.path,
+                                       duration_ms=duration_ms, text=out.getvalue()))
+
+    # --- Đọc số liệu ---
+    def snapshot(self):
+        """Số liệu gộp theo endpoint (sắp theo tổng thời gian giảm dần), N+1 và profile gần đây."""
+        with self._lock:
+            endpoints = [(name, stats.total_ms, stats.as_dict()) for name, stats in self._endpoints.items()]
+            suspects = list(reversed(self._suspects))
+            profiles = list(reversed(self._profiles))
+        endpoints.sort(key=lambda item: item[1], reverse=True)
+        return dict(started_at=self.started_at,
+                    endpoints=[(name, values) for name, _, values in endpoints],
+                    n_plus_one=suspects, profiles=profiles)
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+            self._suspects.clear()
+            self._profiles.clear()
+            self.started_at = datetime.utcnow()
+
+
+instrumentation = Instrumentation()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault(_QUERY_START, []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get(_QUERY_START)
+    if not starts:
+        return
+    elapsed_ms = (time.perf_counter() - starts.pop()) * 1000
+    # Chỉ tính câu SQL chạy trong luồng của request (luồng nền gửi thông báo, ảnh thu nhỏ... thì bỏ)
+    if not has_request_context():
+        return
+    stats = g.get(_G_KEY)
+    if stats is None:
+        return
+    stats.sql_count += 1
+    stats.sql_ms += elapsed_ms
+    if statement.lstrip()[:6].upper() == 'SELECT':
+        stats.statements[statement] += 1
@@ -1,4 +1,6 @@
 from datetime import datetime
+from functools import lru_cache
+from flask import current_app
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
 from app import db # Import db từ app package
@@ -6,9 +8,21 @@ from app import db # Import db từ app package
 # Bảng nối nhiều-nhiều cho post_genres
 post_genres_table = db.Table('post_genres',
     db.Column('post_id', db.Integer, db.ForeignKey('posts.id', ondelete='CASCADE', onupdate='CASCADE'), primary_key=True),
-    db.Column('genre_id', db.Integer, db.ForeignKey('genres.id', ondelete='CASCADE', onupdate='CASCADE'), primary_key=True)
+    db.Column('genre_id', db.Integer, db.ForeignKey('genres.id', ondelete='CASCADE', onupdate='CASCADE'), primary_key=True),
+    # Khóa chính (post_id, genre_id) không giúp được truy vấn "các bài thuộc thể loại X"
+    db.Index('ix_post_genres_genre_id_post_id', 'genre_id', 'post_id')
 )
 
+@lru_cache(maxsize=None)
+def _full_hash_method(method):
+    # Werkzeug tự điền tham số mặc định khi thiếu ('scrypt', 'pbkdf2:sha512'...): lấy phần trước
+    # dấu '$' của một hash mẫu để so sánh được với hash đã lưu (mỗi cấu hình chỉ băm một lần)
+    return generate_password_hash('', method=method).split('$', 1)[0]
+
+def password_hash_method():
+    """PASSWORD_HASH_METHOD của config, viết đầy đủ tham số như trong chuỗi hash của Werkzeug."""
+    return _full_hash_method(current_app.config.get('PASSWORD_HASH_METHOD') or 'scrypt')
+
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
@@ -21,6 +35,10 @@ class User(UserMixin, db.Model):
     is_active = db.Column(db.Boolean, default=True, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Bộ đếm thông báo chưa đọc, cập nhật cùng transaction với Notification (badge trên base.html)
+    unread_notifications = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    # Số bạn bè, dùng để chọn fan-out khi ghi hay khi đọc cho bảng tin bạn bè (app/services/timeline.py)
+    friend_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
 
     posts = db.relationship('Post', backref='author_user', lazy='dynamic', cascade="all, delete-orphan")
     comments = db.relationship('Comment', backref='author_user', lazy='dynamic', cascade="all, delete-orphan")
@@ -43,19 +61,30 @@ class User(UserMixin, db.Model):
                                          backref='actor_user', lazy='dynamic') # No cascade for actor
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = generate_password_hash(password, method=password_hash_method())
 
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
 
+    def password_needs_rehash(self):
+        # Phần trước dấu '$' đầu tiên của hash là thuật toán kèm tham số, ví dụ 'scrypt:32768:8:1'
+        return self.password_hash.split('$', 1)[0] != password_hash_method()
+
+    def rehash_password(self, password):
+        # Gọi sau khi check_password thành công; không tính là chỉnh sửa hồ sơ nên giữ updated_at
+        new_hash = generate_password_hash(password, method=password_hash_method())
+        User.query.filter_by(id=self.id).update(
+            {User.password_hash: new_hash, User.updated_at: User.updated_at},
+            synchronize_session='evaluate')
+
     def __repr__(self):
         return f'<User {self.username}>'
     
     def send_friend_request(self, recipient_user):
-        if not self.has_sent_request_to(recipient_user) and \
-           not recipient_user.has_sent_request_to(self) and \
-           self.id != recipient_user.id and \
-           not self.is_friends_with(recipient_user):
+        # Một câu truy vấn cho cả hai chiều thay vì bốn lần kiểm tra riêng lẻ
+        from app.services.friendships import friendship_graph, RELATIONSHIP_NONE
+        if self.id != recipient_user.id and \
+           friendship_graph.relationship(self.id, recipient_user.id) == RELATIONSHIP_NONE:
             friendship = Friendship(user_id=self.id, friend_id=recipient_user.id, status='pending')
             db.session.add(friendship)
             return friendship
@@ -65,6 +94,7 @@ class User(UserMixin, db.Model):
         friendship = Friendship.query.filter_by(user_id=requester_user.id, friend_id=self.id, status='pending').first()
         if friendship:
             friendship.status = 'accepted'
+            User.adjust_friend_counts([self.id, requester_user.id], 1)
             return friendship
         return None
 
@@ -85,6 +115,7 @@ class User(UserMixin, db.Model):
         
         if f1:
             db.session.delete(f1)
+            User.adjust_friend_counts([self.id, friend_user.id], -1)
             deleted_count +=1
         
         # Nếu bạn có logic tạo 2 record cho friendship, thì xóa cả record còn lại
@@ -94,40 +125,54 @@ class User(UserMixin, db.Model):
         #     deleted_count +=1
         return deleted_count > 0
 
+    # Các kiểm tra quan hệ dùng FriendshipGraph (app/services/friendships.py); import trễ để tránh circular import
     def is_friends_with(self, other_user):
-        return Friendship.query.filter(
-            ((Friendship.user_id == self.id) & (Friendship.friend_id == other_user.id) | \
-             (Friendship.user_id == other_user.id) & (Friendship.friend_id == self.id)) & \
-            (Friendship.status == 'accepted')
-        ).first() is not None
+        from app.services.friendships import friendship_graph
+        return friendship_graph.are_friends(self.id, other_user.id)
 
     def has_sent_request_to(self, other_user):
-        return Friendship.query.filter_by(user_id=self.id, friend_id=other_user.id, status='pending').first() is not None
+        from app.services.friendships import friendship_graph, RELATIONSHIP_REQUEST_SENT
+        return friendship_graph.relationship(self.id, other_user.id) == RELATIONSHIP_REQUEST_SENT
 
     def has_received_request_from(self, other_user):
-        return Friendship.query.filter_by(user_id=other_user.id, friend_id=self.id, status='pending').first() is not None
+        from app.services.friendships import friendship_graph, RELATIONSHIP_REQUEST_RECEIVED
+        return friendship_graph.relationship(self.id, other_user.id) == RELATIONSHIP_REQUEST_RECEIVED
 
     def get_friends(self):
-        friends = []
-        # Lấy các user_id của bạn bè từ các mối quan hệ 'accepted'
-        # Trường hợp user_id của mình là người gửi
-        friend_ids_as_requester = db.session.query(Friendship.friend_id).filter(
-            Friendship.user_id == self.id, Friendship.status == 'accepted'
-        ).all()
-        # Trường hợp user_id của mình là người nhận
-        friend_ids_as_receiver = db.session.query(Friendship.user_id).filter(
-            Friendship.friend_id == self.id, Friendship.status == 'accepted'
-        ).all()
-
-        all_friend_ids = {fid[0] for fid in friend_ids_as_requester}
-        all_friend_ids.update({fid[0] for fid in friend_ids_as_receiver})
-
-        if all_friend_ids:
-            friends = User.query.filter(User.id.in_(all_friend_ids)).all()
-        return friends
+        from app.services.friendships import friendship_graph
+        friend_ids = friendship_graph.friend_ids(self.id)
+        if not friend_ids:
+            return []
+        return User.query.filter(User.id.in_(friend_ids)).order_by(User.username).all()
     
+    @staticmethod
+    def adjust_friend_counts(user_ids, delta):
+        User.query.filter(User.id.in_(user_ids)).update(
+            {User.friend_count: User.friend_count + delta, User.updated_at: User.updated_at},
+            synchronize_session='evaluate')
+
+    @staticmethod
+    def recount_friend_counts(batch_size=1000):
+        # Tính lại friend_count từ các dòng friendships 'accepted' (cả hai chiều) theo từng lô id
+        friend_total = db.select(db.func.count()).where(
+            Friendship.status == 'accepted',
+            db.or_(Friendship.user_id == User.id, Friendship.friend_id == User.id)).scalar_subquery()
+        max_id = db.session.query(db.func.max(User.id)).scalar() or 0
+        updated = 0
+        for start in range(0, max_id, batch_size):
+            result = db.session.execute(
+                db.update(User)
+                .where(User.id > start, User.id <= start + batch_size)
+                .values(friend_count=friend_total, updated_at=User.updated_at)
+                .execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+            updated += result.rowcount
+        return updated
+
     def get_pending_friend_requests(self): # Các request người khác gửi cho mình
-        return Friendship.query.filter_by(friend_id=self.id, status='pending').all()
+        return Friendship.query.options(db.joinedload(Friendship.requester)) \
+            .filter_by(friend_id=self.id, status='pending').all()
 
     def add_notification(self, actor, type, content, link=None, source_entity_id=None, source_entity_type=None):
         actor_id_val = actor.id if actor else None
@@ -136,11 +181,56 @@ class User(UserMixin, db.Model):
                              source_entity_id=source_entity_id,
                              source_entity_type=source_entity_type)
         db.session.add(notif)
+        self.adjust_unread_notifications(1)
+        from app.services.events import event_bus
+        event_bus.publish_after_commit(self.id, 'notification', dict(
+            type=type, content=content, link=link, unread_delta=1))
         return notif
 
     def unread_notification_count(self):
-        # Đảm bảo notifications_received là lazy='dynamic'
-        return self.notifications_received.filter_by(is_read=False).count()
+        # Đọc từ cột bộ đếm thay vì COUNT(*) trên notifications mỗi lần render trang
+        return self.unread_notifications or 0
+
+    def adjust_unread_notifications(self, delta):
+        # UPDATE nguyên tử phía DB; giữ nguyên updated_at vì đây không phải chỉnh sửa hồ sơ
+        User.query.filter_by(id=self.id).update(
+            {User.unread_notifications: User.unread_notifications + delta, User.updated_at: User.updated_at},
+            synchronize_session='evaluate')
+        self.invalidate_identity_after_commit()
+
+    def reset_unread_notifications(self):
+        User.query.filter_by(id=self.id).update(
+            {User.unread_notifications: 0, User.updated_at: User.updated_at},
+            synchronize_session='evaluate')
+        self.invalidate_identity_after_commit()
+
+    def invalidate_identity(self):
+        # Xóa danh tính đã cache cho load_user (import trễ để tránh circular import)
+        from app.services.identity import invalidate_identity
+        invalidate_identity(self.id)
+
+    def invalidate_identity_after_commit(self):
+        # Dùng khi thay đổi chưa commit: xóa cache khi transaction commit
+        from app.services.identity import invalidate_identity_after_commit
+        invalidate_identity_after_commit(self.id)
+
+    @staticmethod
+    def recount_unread_notifications(batch_size=1000):
+        # Tính lại unread_notifications từ bảng notifications theo từng lô id
+        unread_total = db.select(db.func.count()).where(
+            Notification.user_id == User.id, Notification.is_read.is_(False)).scalar_subquery()
+        max_id = db.session.query(db.func.max(User.id)).scalar() or 0
+        updated = 0
+        for start in range(0, max_id, batch_size):
+            result = db.session.execute(
+                db.update(User)
+                .where(User.id > start, User.id <= start + batch_size)
+                .values(unread_notifications=unread_total, updated_at=User.updated_at)
+                .execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+            updated += result.rowcount
+        return updated
 
 class Post(db.Model):
     __tablename__ = 'posts'
@@ -150,20 +240,62 @@ class Post(db.Model):
     author_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE', onupdate='CASCADE'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Bộ đếm phi chuẩn hóa, cập nhật trong cùng transaction với PostLike/Comment (xem adjust_counters)
+    like_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    comment_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
 
     # ĐÃ XÓA: image_filename và video_filename
 
     comments = db.relationship('Comment', backref='post_ref', lazy='dynamic', cascade="all, delete-orphan")
-    genres = db.relationship('Genre', secondary=post_genres_table, lazy='subquery',
+    # selectin: nạp genres cho cả lô bài bằng một câu IN thay vì lặp lại query gốc dưới dạng subquery
+    genres = db.relationship('Genre', secondary=post_genres_table, lazy='selectin',
                              backref=db.backref('posts_ref', lazy=True))
     likes = db.relationship('PostLike', back_populates='post', cascade="all, delete-orphan")
     
     # THÊM MỚI: Mối quan hệ với PostMedia
     media_items = db.relationship('PostMedia', backref='post_ref', lazy='dynamic', cascade="all, delete-orphan")
 
+    # Index phục vụ phân trang keyset theo (created_at, id) cho feed trang chủ và timeline hồ sơ
+    __table_args__ = (
+        db.Index('ix_posts_created_at_id', 'created_at', 'id'),
+        db.Index('ix_posts_author_id_created_at_id', 'author_id', 'created_at', 'id'),
+    )
+
     def __repr__(self):
         return f'<Post {self.title}>'
 
+    def adjust_counters(self, likes=0, comments=0):
+        # UPDATE posts SET like_count = like_count + ?, ... nguyên tử ở phía DB,
+        # không đọc-sửa-ghi trong Python nên an toàn khi nhiều request cùng like/bình luận.
+        values = {}
+        if likes:
+            values[Post.like_count] = Post.like_count + likes
+        if comments:
+            values[Post.comment_count] = Post.comment_count + comments
+        if values:
+            # Giữ nguyên updated_at: like/bình luận không phải là chỉnh sửa bài viết (tránh onupdate)
+            values[Post.updated_at] = Post.updated_at
+            Post.query.filter_by(id=self.id).update(values, synchronize_session='evaluate')
+
+    @staticmethod
+    def recount_counters(batch_size=1000):
+        # Tính lại like_count/comment_count từ post_likes/comments theo từng lô id,
+        # mỗi lô một UPDATE + commit để không giữ khóa ghi quá lâu.
+        like_total = db.select(db.func.count()).where(PostLike.post_id == Post.id).scalar_subquery()
+        comment_total = db.select(db.func.count()).where(Comment.post_id == Post.id).scalar_subquery()
+        max_id = db.session.query(db.func.max(Post.id)).scalar() or 0
+        updated = 0
+        for start in range(0, max_id, batch_size):
+            result = db.session.execute(
+                db.update(Post)
+                .where(Post.id > start, Post.id <= start + batch_size)
+                .values(like_count=like_total, comment_count=comment_total, updated_at=Post.updated_at)
+                .execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+            updated += result.rowcount
+        return updated
+
 # THÊM MỚI: Model PostMedia
 class PostMedia(db.Model):
     __tablename__ = 'post_media'
@@ -175,6 +307,11 @@ class PostMedia(db.Model):
     thumbnail_path = db.Column(db.String(255), nullable=True)
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # Tải media của một bài (và xóa dây chuyền khi xóa bài)
+    __table_args__ = (
+        db.Index('ix_post_media_post_id', 'post_id'),
+    )
+
     # backref 'post_ref' đã được định nghĩa trong Post.media_items
     # Nếu muốn truy cập ngược từ PostMedia -> Post, có thể thêm:
     # post = db.relationship('Post', back_populates='media_items')
@@ -192,6 +329,13 @@ class Comment(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    __table_args__ = (
+        # Bình luận của một bài theo thứ tự thời gian (view_post), kể cả phân trang keyset
+        db.Index('ix_comments_post_id_created_at_id', 'post_id', 'created_at', 'id'),
+        # Xóa dây chuyền khi xóa user
+        db.Index('ix_comments_author_id', 'author_id'),
+    )
+
     def __repr__(self):
         return f'<Comment {self.id}>'
 
@@ -213,6 +357,11 @@ class PostLike(db.Model):
     user = db.relationship('User', back_populates='likes')
     post = db.relationship('Post', back_populates='likes')
 
+    # Khóa chính (user_id, post_id) không dùng được khi lọc theo post_id (đếm lượt thích, xóa bài)
+    __table_args__ = (
+        db.Index('ix_post_likes_post_id', 'post_id'),
+    )
+
     def __repr__(self):
         return f'<PostLike User {self.user_id} - Post {self.post_id}>'
 
@@ -227,6 +376,8 @@ class Friendship(db.Model):
 
     __table_args__ = (
         db.CheckConstraint('user_id <> friend_id', name='ck_friendship_user_id_friend_id'),
+        # Khóa chính (user_id, friend_id) chỉ phục vụ chiều người gửi; index này cho chiều người nhận
+        db.Index('ix_friendships_friend_id_status', 'friend_id', 'status'),
     )
     def __repr__(self):
         return f'<Friendship {self.user_id} -> {self.friend_id}: {self.status}>'
@@ -242,7 +393,79 @@ class Notification(db.Model):
     source_entity_id = db.Column(db.Integer, nullable=True)
     source_entity_type = db.Column(db.String(50), nullable=True)
     is_read = db.Column(db.Boolean, default=False, nullable=False)
+    # Số người đã gộp vào thông báo này ("A và 41 người khác đã thích...")
+    actor_count = db.Column(db.Integer, default=1, server_default='1', nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # Danh sách thông báo của một user và lọc chưa đọc, mới nhất trước
+        db.Index('ix_notifications_user_id_is_read_created_at', 'user_id', 'is_read', 'created_at'),
+        # Phân trang keyset trang /notifications
+        db.Index('ix_notifications_user_id_created_at_id', 'user_id', 'created_at', 'id'),
+        # Job dọn thông báo đã đọc quá hạn
+        db.Index('ix_notifications_is_read_created_at', 'is_read', 'created_at'),
+        # ondelete='SET NULL' khi xóa người thực hiện
+        db.Index('ix_notifications_actor_id', 'actor_id'),
+    )
+
+    def __repr__(self):
+        return f'<Notification {self.id} for {self.user_id}>'
+
+class NotificationArchive(db.Model):
+    # Thông báo đã đọc quá hạn được chuyển sang đây khi NOTIFICATION_RETENTION_MODE = 'archive'
+    __tablename__ = 'notifications_archive'
+    id = db.Column(db.Integer, primary_key=True) # giữ nguyên id của Notification gốc
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE', onupdate='CASCADE'), nullable=False, index=True)
+    actor_id = db.Column(db.Integer, nullable=True)
+    type = db.Column(db.String(50), nullable=False)
+    content = db.Column(db.String(255), nullable=False)
+    link = db.Column(db.String(255), nullable=True)
+    source_entity_id = db.Column(db.Integer, nullable=True)
+    source_entity_type = db.Column(db.String(50), nullable=True)
+    actor_count = db.Column(db.Integer, default=1, server_default='1', nullable=False)
+    created_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f'<NotificationArchive {self.id} for {self.user_id}>'
+
+class FeedEntry(db.Model):
+    # Bảng tin bạn bè đã vật chất hóa: mỗi dòng là "post_id xuất hiện trong bảng tin của user_id".
+    # created_at sao chép từ Post để phân trang keyset mà không cần JOIN posts.
+    __tablename__ = 'feed_entries'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE', onupdate='CASCADE'), primary_key=True)
+    post_id = db.Column(db.Integer, db.ForeignKey('posts.id', ondelete='CASCADE', onupdate='CASCADE'), primary_key=True)
+    author_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE', onupdate='CASCADE'), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_feed_entries_user_id_created_at_post_id', 'user_id', 'created_at', 'post_id'),
+        db.Index('ix_feed_entries_post_id', 'post_id'),
+        # Xóa dây chuyền theo tác giả và purge_friendship (user_id, author_id)
+        db.Index('ix_feed_entries_author_id_user_id', 'author_id', 'user_id'),
+    )
+
+    def __repr__(self):
+        return f'<FeedEntry User {self.user_id} - Post {self.post_id}>'
+
+class EntityCount(db.Model):
+    # Tổng số dòng của các bảng hiển thị trên dashboard, cập nhật dần trong mỗi flush
+    # (xem app/services/stats.py) thay vì COUNT(*) mỗi lần xem
+    __tablename__ = 'entity_counts'
+    name = db.Column(db.String(30), primary_key=True)
+    value = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    refreshed_at = db.Column(db.DateTime, nullable=True) # lần đếm lại toàn bảng gần nhất
+
+    def __repr__(self):
+        return f'<EntityCount {self.name}={self.value}>'
+
+class DailyStat(db.Model):
+    # Số liệu theo ngày (user/bài/bình luận/like mới) do job nền tổng hợp
+    __tablename__ = 'daily_stats'
+    day = db.Column(db.Date, primary_key=True)
+    metric = db.Column(db.String(30), primary_key=True)
+    value = db.Column(db.Integer, default=0, nullable=False)
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
     def __repr__(self):
-        return f'<Notification {self.id} for {self.user_id}>'
\ No newline at end of file
+        return f'<DailyStat {self.day} {self.metric}={self.value}>'
@@ -0,0 +1,234 @@
+import re
+from sqlalchemy import event, func
+from app import db
+from app.models import User, Post, Genre, PostLike, Friendship, Notification
+
+# Kiểm tra kế hoạch truy vấn (chỉ SQLite) cho các truy vấn nóng của ứng dụng.
+#
+# Mỗi mục trong registry là một hàm gọi đúng đoạn code mà route dùng (service, model...);
+# audit chạy hàm đó trong một transaction sẽ bị rollback, ghi lại mọi câu SQL phát ra rồi
+# chạy EXPLAIN QUERY PLAN cho từng câu. Trong lúc chạy, session.commit() chỉ flush, nên cả
+# các job tự commit theo lô (recount, tổng hợp số liệu, dọn thông báo) cũng không ghi gì thật. Một câu "SCAN <bảng>" không dùng index trên bảng có
+# nhiều hơn min_rows dòng bị coi là lỗi. Mục cần id mẫu (người dùng, bài, thể loại) mà DB
+# chưa có dòng nào thì bị bỏ qua. Dùng qua lệnh `flask audit-queries`.
+
+_REGISTRY = []
+# "SCAN posts" hoặc "SCAN posts AS p" (không có USING INDEX) là quét toàn bảng
+_FULL_SCAN_RE = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$')
+
+
+def audited(name, allow_scan=False, requires=()):
+    """Đăng ký một truy vấn cần kiểm tra; allow_scan cho các truy vấn cố ý quét cả bảng,
+    requires là các id mẫu (thuộc tính của Samples) mà hàm cần."""
+    def decorator(f):
+        _REGISTRY.append((name, f, allow_scan, requires))
+        return f
+    return decorator
+
+
+class Samples:
+    """Id mẫu có thật trong DB để các truy vấn đi đúng nhánh như khi chạy thật; None nếu bảng trống."""
+
+    def __init__(self):
+        self.user_id = db.session.query(func.min(User.id)).scalar()
+        self.username = db.session.query(User.username).filter(User.id == self.user_id).scalar()
+        self.post_id = db.session.query(func.min(Post.id)).scalar()
+        self.genre_id = db.session.query(func.min(Genre.id)).scalar()
+
+    def missing(self, names):
+        return [name for name in names if getattr(self, name) is None]
+
+
+# --- Registry ---
+
+@audited('feed.home')
+def _home(s):
+    from app.services.feed import load_feed_keyset
+    page = load_feed_keyset(Post.query, cursor=None, per_page=10)
+    if page.pagination.next_cursor:
+        load_feed_keyset(Post.query, cursor=page.pagination.next_cursor, per_page=10)
+
+
+@audited('feed.profile', requires=('user_id',))
+def _profile(s):
+    from app.services.feed import load_feed_keyset
+    User.query.filter_by(username=s.username).first()
+    load_feed_keyset(Post.query.filter_by(author_id=s.user_id), cursor=None, per_page=10)
+
+
+@audited('feed.genre', requires=('genre_id',))
+def _genre(s):
+    from app.services.feed import load_feed_keyset, filter_by_genres
+    load_feed_keyset(filter_by_genres(Post.query, [s.genre_id]), cursor=None, per_page=10)
+
+
+@audited('post.view', requires=('user_id', 'post_id'))
+def _view_post(s):
+    from app.services.comments import load_comments_page
+    db.session.get(Post, s.post_id)
+    comments, pagination = load_comments_page(s.post_id, cursor=None, per_page=20)
+    if pagination.next_cursor:
+        load_comments_page(s.post_id, cursor=pagination.next_cursor, per_page=20)
+    PostLike.query.filter_by(user_id=s.user_id, post_id=s.post_id).first()
+
+
+@audited('recount_counters')
+def _recount(s):
+    # Chạy cả job (UPDATE theo lô id); các commit bên trong bị audit bỏ qua và rollback
+    Post.recount_counters()
+    User.recount_unread_notifications()
+    User.recount_friend_counts()
+
+
+@audited('timeline.read', requires=('user_id',))
+def _timeline(s):
+    from app.services.timeline import read_timeline
+    read_timeline(s.user_id, cursor=None, per_page=10)
+
+
+@audited('friendships', requires=('user_id',))
+def _friendships(s):
+    from app.services.friendships import friendship_graph
+    friendship_graph._load_friend_ids(s.user_id)
+    friendship_graph.relationship(s.user_id, s.user_id + 1)
+    db.session.get(User, s.user_id).get_pending_friend_requests()
+    Friendship.query.filter_by(user_id=s.user_id, status='pending').all()
+
+
+@audited('notifications.page', requires=('user_id',))
+def _notifications(s):
+    from app.services.pagination import keyset_paginate
+    keyset_paginate(Notification.query.filter(Notification.user_id == s.user_id),
+                    [Notification.created_at, Notification.id], cursor=None, per_page=20)
+
+
+@audited('notifications.coalesce_lookup', requires=('user_id', 'post_id'))
+def _coalesce(s):
+    from app.services.notifications import _unread_to_coalesce
+    _unread_to_coalesce({(s.user_id, 'new_like', 'post', s.post_id)})
+
+
+@audited('notifications.compaction')
+def _compaction(s):
+    # Chế độ archive chạy đủ các câu của chế độ xóa (chọn id, DELETE) cộng thêm INSERT ... SELECT
+    from flask import current_app
+    from app.services.notifications import compact_notifications
+    compact_notifications(current_app.config.get('NOTIFICATION_RETENTION_DAYS') or 90, archive=True)
+
+
+@audited('identity.load', requires=('user_id',))
+def _identity(s):
+    from app.services.identity import _fetch_identity_row
+    _fetch_identity_row(s.user_id)
+
+
+@audited('auth.login', requires=('user_id',))
+def _login(s):
+    from sqlalchemy import or_, case
+    User.query.filter(or_(User.username == s.username, User.email == s.username)) \
+        .order_by(case((User.username == s.username, 0), else_=1)).first()
+
+
+@audited('admin.dashboard')
+def _dashboard(s):
+    from app.services.stats import entity_counts, daily_trends
+    entity_counts()
+    daily_trends(30)
+
+
+@audited('admin.users', allow_scan=True)
+def _admin_users(s):
+    # Duyệt theo khóa chính (id giảm dần) và dừng khi đủ một trang, nên "SCAN users" là chấp nhận được
+    from app.services.admin_lists import list_users
+    list_users({}, cursor=None, per_page=50)
+    list_users({'role': 'admin', 'active': '1'}, cursor=None, per_page=50)
+
+
+@audited('admin.posts', requires=('user_id', 'genre_id'))
+def _admin_posts(s):
+    from app.services.admin_lists import list_posts
+    posts, pagination = list_posts({}, cursor=None, per_page=50)
+    if pagination.next_cursor:
+        list_posts({}, cursor=pagination.next_cursor, per_page=50)
+    list_posts({'author': s.username, 'date_from': '2000-01-01'}, cursor=None, per_page=50)
+    list_posts({'genre': s.genre_id}, cursor=None, per_page=50)
+
+
+@audited('stats.rollup', allow_scan=True)
+def _stats_rollup(s):
+    # Job nền GROUP BY theo created_at (không có index riêng), chạy mỗi STATS_ROLLUP_INTERVAL
+    from app.services.stats import roll_up_daily_stats
+    roll_up_daily_stats(backfill_days=1)
+
+
+# --- Chạy audit ---
+
+class Finding:
+
+    def __init__(self, query_name, statement, detail, table, rows, allowed):
+        self.query_name = query_name
+        self.statement = statement
+        self.detail = detail
+        self.table = table
+        self.rows = rows
+        self.allowed = allowed
+
+    def is_failure(self, min_rows):
+        return not self.allowed and self.rows > min_rows
+
+
+def _capture(f, samples):
+    statements = []
+    engine = db.engine
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not statement.lstrip().upper().startswith('EXPLAIN'):
+            statements.append((statement, parameters))
+
+    session = db.session()
+    session.commit = session.flush
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        f(samples)
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+        del session.commit
+        session.rollback()
+    return statements
+
+
+def run_audit():
+    """Trả về (danh sách Finding cho mọi lần quét toàn bảng, {tên mục bị bỏ qua: id mẫu còn thiếu})."""
+    if db.engine.dialect.name != 'sqlite':
+        raise RuntimeError('audit-queries hiện chỉ hỗ trợ SQLite (EXPLAIN QUERY PLAN).')
+    samples = Samples()
+    tables = set(db.inspect(db.engine).get_table_names())
+    row_counts = {}
+    findings = []
+    skipped = {}
+    for name, f, allow_scan, requires in _REGISTRY:
+        missing = samples.missing(requires)
+        if missing:
+            skipped[name] = missing
+            continue
+        seen = set()
+        for statement, parameters in _capture(f, samples):
+            if statement in seen:
+                continue
+            seen.add(statement)
+            with db.engine.connect() as conn:
+                plan = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).all()
+                for row in plan:
+                    match = _FULL_SCAN_RE.match(row[-1])
+                    # Bỏ qua subquery/CTE (anon_1...) vì chúng không phải bảng thật
+                    if not match or match.group(1) not in tables:
+                        continue
+                    table = match.group(1)
+                    if table not in row_counts:
+                        row_counts[table] = conn.exec_driver_sql(f'SELECT COUNT(*) FROM "{table}"').scalar()
+                    findings.append(Finding(name, statement, row[-1], table, row_counts[table], allow_scan))
+    return findings, skipped
+
+
+def registered_queries():
+    return [name for name, _, _, _ in _REGISTRY]
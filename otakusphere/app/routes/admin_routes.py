@@ -1,9 +1,16 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, abort, request
-from flask_login import login_required, current_user
-from app import db
-from app.models import User, Post, Comment, Genre
+from flask import Blueprint, render_template, redirect, url_for, flash, abort, request, current_app, \
+    Response, stream_with_context
+from flask_login import current_user
+from app import db, cache
+from app.models import User, Genre, post_genres_table
 from app.forms import GenreForm # Thêm các form admin nếu cần
+from app.services import admin_lists
+from app.services.genres import invalidate_genre_catalog, genre_catalog
+from app.services.stats import entity_counts, daily_trends, period_totals, DAILY_METRICS
+from app.instrumentation import instrumentation
+from app.database import read_replica
 from functools import wraps
+from sqlalchemy.exc import IntegrityError
 
 bp = Blueprint('admin', __name__)
 
@@ -20,22 +27,63 @@ def admin_required(f):
     return decorated_function
 
 
+def _csv_response(chunks, filename):
+    # Trả về từng khối ngay khi đọc xong một lô, không dựng cả file trong bộ nhớ
+    return Response(stream_with_context(chunks), mimetype='text/csv',
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+
+def invalidate_genre_caches():
+    # Gọi sau mỗi lần ghi vào bảng genres
+    invalidate_genre_catalog()
+
+
 @bp.route('/')
 @admin_required
 def dashboard():
-    user_count = User.query.count()
-    post_count = Post.query.count()
-    comment_count = Comment.query.count()
-    genre_count = Genre.query.count()
+    # Đọc số liệu đã tính sẵn (app/services/stats.py), không COUNT(*) trên bảng lớn
+    counts = entity_counts()
+    trend_days = current_app.config['STATS_TREND_DAYS']
+    days, by_day, computed_at = daily_trends(trend_days)
     return render_template('admin/dashboard.html', title='Admin Dashboard',
-                           user_count=user_count, post_count=post_count,
-                           comment_count=comment_count, genre_count=genre_count)
+                           user_count=counts['users'], post_count=counts['posts'],
+                           comment_count=counts['comments'], genre_count=counts['genres'],
+                           like_count=counts['likes'], days=days, by_day=by_day, computed_at=computed_at,
+                           weekly=period_totals(by_day, 7), metrics=list(DAILY_METRICS),
+                           cache_stats=cache.stats())
+
+@bp.route('/performance')
+@admin_required
+def performance():
+    # Số liệu đo theo request của tiến trình hiện tại (app/instrumentation.py)
+    return render_template('admin/performance.html', title='Hiệu năng',
+                           enabled=instrumentation.enabled,
+                           **instrumentation.snapshot())
+
+@bp.route('/performance/reset', methods=['POST'])
+@admin_required
+def reset_performance():
+    instrumentation.reset()
+    flash('Đã xóa số liệu hiệu năng.', 'success')
+    return redirect(url_for('admin.performance'))
 
 @bp.route('/users')
 @admin_required
+@read_replica
 def list_users():
-    users = User.query.order_by(User.created_at.desc()).all()
-    return render_template('admin/users.html', title='Quản lý người dùng', users=users)
+    # Lọc theo role/is_active và phân trang keyset (app/services/admin_lists.py)
+    filters = admin_lists.parse_user_filters(request.args)
+    users, pagination = admin_lists.list_users(filters, cursor=request.args.get('cursor'),
+                                               per_page=current_app.config['ADMIN_ITEMS_PER_PAGE'])
+    return render_template('admin/users.html', title='Quản lý người dùng', users=users,
+                           pagination=pagination, filters=filters, total=entity_counts()['users'])
+
+@bp.route('/users/export.csv')
+@admin_required
+@read_replica
+def export_users():
+    filters = admin_lists.parse_user_filters(request.args)
+    return _csv_response(admin_lists.export_users_csv(filters), 'users.csv')
 
 @bp.route('/users/<int:user_id>/toggle_active', methods=['POST'])
 @admin_required
@@ -46,6 +94,7 @@ def toggle_user_active(user_id):
         return redirect(url_for('admin.list_users'))
     user.is_active = not user.is_active
     db.session.commit()
+    user.invalidate_identity()
     status = "kích hoạt" if user.is_active else "vô hiệu hóa"
     flash(f'Đã {status} tài khoản {user.username}.', 'success')
     return redirect(url_for('admin.list_users'))
@@ -62,15 +111,29 @@ def set_user_role(user_id, new_role):
         return redirect(url_for('admin.list_users'))
     user.role = new_role
     db.session.commit()
+    user.invalidate_identity()
     flash(f'Đã cập nhật role cho {user.username} thành {new_role}.', 'success')
     return redirect(url_for('admin.list_users'))
 
 
 @bp.route('/posts')
 @admin_required
+@read_replica
 def list_posts():
-    posts = Post.query.order_by(Post.created_at.desc()).all()
-    return render_template('admin/posts.html', title='Quản lý bài viết', posts=posts)
+    # Lọc theo tác giả/thể loại/khoảng ngày, không tải Post.content
+    filters = admin_lists.parse_post_filters(request.args)
+    posts, pagination = admin_lists.list_posts(filters, cursor=request.args.get('cursor'),
+                                               per_page=current_app.config['ADMIN_ITEMS_PER_PAGE'])
+    return render_template('admin/posts.html', title='Quản lý bài viết', posts=posts,
+                           pagination=pagination, filters=filters, catalog=genre_catalog(),
+                           total=entity_counts()['posts'])
+
+@bp.route('/posts/export.csv')
+@admin_required
+@read_replica
+def export_posts():
+    filters = admin_lists.parse_post_filters(request.args)
+    return _csv_response(admin_lists.export_posts_csv(filters), 'posts.csv')
 
 # Admin có thể dùng route edit/delete post của user_routes nếu có quyền
 
@@ -83,6 +146,7 @@ def list_genres():
         db.session.add(genre)
         try:
             db.session.commit()
+            invalidate_genre_caches()
             flash('Thể loại mới đã được tạo!', 'success')
         except IntegrityError:
             db.session.rollback()
@@ -110,6 +174,7 @@ def edit_genre(genre_id):
             genre.name = form.name.data
             genre.description = form.description.data
             db.session.commit()
+            invalidate_genre_caches()
             flash('Thể loại đã được cập nhật!', 'success')
             return redirect(url_for('admin.list_genres'))
             
@@ -120,10 +185,13 @@ def edit_genre(genre_id):
 @admin_required
 def delete_genre(genre_id):
     genre = Genre.query.get_or_404(genre_id)
-    if genre.posts_ref: # Kiểm tra xem thể loại có bài viết nào không
+    # Chỉ cần biết có ít nhất một bài viết dùng thể loại này (index (genre_id, post_id)), không nạp cả danh sách
+    in_use = db.session.query(post_genres_table.c.post_id).filter_by(genre_id=genre.id).first() is not None
+    if in_use: # Kiểm tra xem thể loại có bài viết nào không
         flash('Không thể xóa thể loại này vì nó đang được sử dụng bởi các bài viết.', 'danger')
         return redirect(url_for('admin.list_genres'))
     db.session.delete(genre)
     db.session.commit()
+    invalidate_genre_caches()
     flash('Thể loại đã được xóa!', 'success')
     return redirect(url_for('admin.list_genres'))
\ No newline at end of file
@@ -1,5 +1,7 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_user, logout_user, current_user, login_required
+from sqlalchemy import or_, case
+from sqlalchemy.exc import IntegrityError
 from app import db
 from app.models import User
 from app.forms import LoginForm, RegistrationForm
@@ -15,10 +17,22 @@ def register():
         user = User(username=form.username.data, email=form.email.data)
         user.set_password(form.password.data)
         # Mặc định user đầu tiên đăng ký là admin (cho mục đích dev)
-        if User.query.count() == 0:
+        if db.session.query(User.id).limit(1).first() is None:
             user.role = 'admin'
         db.session.add(user)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Ràng buộc UNIQUE của username/email thay cho hai câu kiểm tra trước khi chèn;
+            # chỉ khi trùng mới cần một truy vấn để biết trường nào bị trùng
+            db.session.rollback()
+            taken = db.session.query(User.username, User.email).filter(
+                or_(User.username == form.username.data, User.email == form.email.data)).all()
+            if any(row.username == form.username.data for row in taken):
+                form.username.errors.append('Tên đăng nhập này đã được sử dụng.')
+            if any(row.email == form.email.data for row in taken):
+                form.email.errors.append('Địa chỉ email này đã được sử dụng.')
+            return render_template('auth/register.html', title='Đăng ký', form=form)
         flash('Chúc mừng, bạn đã đăng ký thành công!', 'success')
         return redirect(url_for('auth.login'))
     return render_template('auth/register.html', title='Đăng ký', form=form)
@@ -29,9 +43,11 @@ def login():
         return redirect(url_for('user.home'))
     form = LoginForm()
     if form.validate_on_submit():
-        user_by_username = User.query.filter_by(username=form.username_or_email.data).first()
-        user_by_email = User.query.filter_by(email=form.username_or_email.data).first()
-        user = user_by_username or user_by_email
+        # Một truy vấn cho cả tên đăng nhập lẫn email (mỗi cột có index UNIQUE riêng);
+        # nếu khớp cả hai người khác nhau thì ưu tiên người có tên đăng nhập trùng
+        identifier = form.username_or_email.data
+        user = User.query.filter(or_(User.username == identifier, User.email == identifier)) \
+                         .order_by(case((User.username == identifier, 0), else_=1)).first()
 
         if user is None or not user.check_password(form.password.data):
             flash('Tên đăng nhập hoặc mật khẩu không đúng.', 'danger')
@@ -39,6 +55,10 @@ def login():
         if not user.is_active:
             flash('Tài khoản của bạn đã bị vô hiệu hóa.', 'warning')
             return redirect(url_for('auth.login'))
+        if user.password_needs_rehash():
+            # PASSWORD_HASH_METHOD đã đổi: băm lại bằng tham số mới khi đang có mật khẩu gốc
+            user.rehash_password(form.password.data)
+            db.session.commit()
         
         login_user(user, remember=form.remember_me.data)
         next_page = request.args.get('next')
@@ -1,23 +1,35 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, abort, current_app
+from datetime import datetime
+from flask import Blueprint, render_template, redirect, url_for, flash, request, abort, current_app, Response, send_from_directory, jsonify
+from werkzeug.exceptions import RequestEntityTooLarge
 from flask_login import login_required, current_user
 from app import db # db được import từ app package
-from app.models import Post, User, Comment, Genre, PostLike, Friendship, Notification # Import các model cần thiết
+from app.models import Post, User, Comment, PostLike, Friendship, Notification, PostMedia # Import các model cần thiết
 from app.forms import PostForm, CommentForm # Import các form cần thiết
-from sqlalchemy.exc import IntegrityError # Để bắt lỗi trùng lặp (ví dụ: tên genre)
+from app.services.feed import load_feed_keyset, load_feed, filter_by_genres
+from app.services.pagination import keyset_paginate
+from app.services.genres import genre_catalog
+from app.services.search import search_index
+from app.services.media import media_pipeline
+from app.services.comments import load_comments_page
+from app.services import timeline
+from app.services.notifications import notification_dispatcher, mark_read
+from app.services.events import event_bus, format_sse
+from app.database import read_replica
+from app.services.friendships import (friendship_graph, RELATIONSHIP_FRIENDS,
+                                      RELATIONSHIP_REQUEST_SENT, RELATIONSHIP_REQUEST_RECEIVED)
 
 # Tạo Blueprint cho user routes
 bp = Blueprint('user', __name__) # Đặt tên blueprint là 'user' để url_for('user.home') hoạt động
 
 @bp.route('/')
 @bp.route('/home')
+@read_replica
 def home():
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     # Sử dụng current_app.config thay vì app.config trực tiếp trong blueprint
-    posts_pagination = Post.query.order_by(Post.created_at.desc()).paginate(
-        page=page, per_page=current_app.config['POSTS_PER_PAGE'], error_out=False
-    )
-    posts = posts_pagination.items
-    return render_template('user/home.html', title='Trang chủ', posts=posts, pagination=posts_pagination)
+    feed = load_feed_keyset(Post.query, cursor=cursor, per_page=current_app.config['POSTS_PER_PAGE'])
+    return render_template('user/home.html', title='Trang chủ', posts=feed.posts, feed=feed,
+                           pagination=feed.pagination)
 
 @bp.route('/post/new', methods=['GET', 'POST'])
 @login_required
@@ -25,16 +37,22 @@ def create_post():
     form = PostForm()
     if form.validate_on_submit():
         post = Post(title=form.title.data, content=form.content.data, author_id=current_user.id)
-        selected_genres = Genre.query.filter(Genre.id.in_(form.genres.data)).all()
-        for genre in selected_genres:
+        # Lấy Genre từ danh mục trong bộ nhớ thay vì query lại theo id
+        for genre in genre_catalog().resolve(form.genres.data):
             post.genres.append(genre)
         db.session.add(post)
+        db.session.flush() # Cần post.id để ghi vào chỉ mục tìm kiếm và bảng tin bạn bè
+        media_pipeline.attach_uploads(post, image=form.image_upload.data, video=form.video_upload.data,
+                                      embed_url=form.video_embed_url.data)
+        search_index.index_post(post)
+        timeline.fan_out_post(post, current_user)
         db.session.commit()
         flash('Bài viết của bạn đã được tạo!', 'success')
         return redirect(url_for('user.home'))
     return render_template('user/create_post.html', title='Tạo bài viết mới', form=form, legend='Tạo bài viết mới')
 
 @bp.route('/post/<int:post_id>', methods=['GET', 'POST'])
+@read_replica
 def view_post(post_id):
     post = Post.query.get_or_404(post_id)
     comment_form = CommentForm()
@@ -42,15 +60,18 @@ def view_post(post_id):
     if comment_form.validate_on_submit() and current_user.is_authenticated:
         comment = Comment(content=comment_form.content.data, post_id=post.id, author_id=current_user.id)
         db.session.add(comment)
+        post.adjust_counters(comments=1) # autoflush trong UPDATE này gán comment.id
+        search_index.index_comment(comment)
         
         # Tạo notification cho chủ bài viết (nếu không phải là người bình luận)
         if post.author_id != current_user.id:
-            # Giả sử User model có phương thức add_notification
-            post.author_user.add_notification( 
+            # Ghi vào outbox sau khi commit; luồng nền dựng link tuyệt đối và chèn Notification
+            notification_dispatcher.notify(
+                post.author_id,
                 actor=current_user,
                 type='new_comment',
                 content=f'{current_user.username} đã bình luận về bài viết "{post.title}".',
-                link=url_for('user.view_post', post_id=post.id, _external=True), # _external=True để có URL đầy đủ
+                link_endpoint='user.view_post', link_values={'post_id': post.id},
                 source_entity_id=comment.id, 
                 source_entity_type='comment'
             )
@@ -58,13 +79,46 @@ def view_post(post_id):
         flash('Bình luận của bạn đã được thêm!', 'success')
         return redirect(url_for('user.view_post', post_id=post.id)) # Redirect để tránh resubmit form
     
-    comments = Comment.query.filter_by(post_id=post.id).order_by(Comment.created_at.asc()).all()
+    # Chỉ một trang bình luận; các trang sau tải thêm qua post_comments (JSON)
+    comments, comments_pagination = load_comments_page(post.id, cursor=request.args.get('comments_cursor'),
+                                                       per_page=current_app.config['COMMENTS_PER_PAGE'])
     user_liked_post = False
     if current_user.is_authenticated:
         user_liked_post = PostLike.query.filter_by(user_id=current_user.id, post_id=post.id).first() is not None
 
-    return render_template('user/view_post.html', title=post.title, post=post, 
-                           comments=comments, comment_form=comment_form, user_liked_post=user_liked_post)
+    media_items = post.media_items.order_by(PostMedia.id).all()
+
+    return render_template('user/view_post.html', title=post.title, post=post, media_items=media_items,
+                           comments=comments, comments_pagination=comments_pagination,
+                           comment_form=comment_form, user_liked_post=user_liked_post)
+
+
+@bp.route('/post/<int:post_id>/comments')
+@read_replica
+def post_comments(post_id):
+    # Nút "Xem thêm bình luận": trả về HTML của trang kế tiếp cùng cursor cho lần tải sau
+    comments, pagination = load_comments_page(post_id, cursor=request.args.get('cursor'),
+                                              per_page=current_app.config['COMMENTS_PER_PAGE'])
+    return jsonify(html=render_template('partials/_comments.html', comments=comments),
+                   next_cursor=pagination.next_cursor)
+
+
+@bp.route('/media/<path:filename>')
+def media_file(filename):
+    # Tên file là hash nội dung nên không bao giờ đổi: cho trình duyệt cache lâu dài
+    return send_from_directory(current_app.config['MEDIA_ROOT'], filename, max_age=365 * 24 * 3600)
+
+
+# Chỉ các form đăng/sửa bài có tải file; 413 ở nơi khác giữ phản hồi mặc định
+UPLOAD_ENDPOINTS = ('user.create_post', 'user.edit_post')
+
+
+@bp.errorhandler(RequestEntityTooLarge)
+def upload_too_large(error):
+    if request.endpoint not in UPLOAD_ENDPOINTS:
+        return error
+    flash('File tải lên vượt quá dung lượng cho phép.', 'danger')
+    return redirect(request.url)
 
 @bp.route('/post/<int:post_id>/edit', methods=['GET', 'POST'])
 @login_required
@@ -78,10 +132,11 @@ def edit_post(post_id):
         post.title = form.title.data
         post.content = form.content.data
         # Cập nhật genres
-        post.genres = [] # Xóa các genre cũ trước khi thêm mới
-        selected_genres = Genre.query.filter(Genre.id.in_(form.genres.data)).all()
-        for genre in selected_genres:
-            post.genres.append(genre)
+        post.genres = genre_catalog().resolve(form.genres.data) # Thay toàn bộ genre cũ
+        # Media mới (nếu có) được thêm vào, media cũ giữ nguyên
+        media_pipeline.attach_uploads(post, image=form.image_upload.data, video=form.video_upload.data,
+                                      embed_url=form.video_embed_url.data)
+        search_index.index_post(post)
         db.session.commit()
         flash('Bài viết đã được cập nhật!', 'success')
         return redirect(url_for('user.view_post', post_id=post.id))
@@ -99,6 +154,8 @@ def delete_post(post_id):
     post = Post.query.get_or_404(post_id)
     if post.author_id != current_user.id and current_user.role != 'admin':
         abort(403)
+    search_index.remove_post(post.id) # Xóa cả bài viết lẫn các bình luận của nó khỏi chỉ mục
+    timeline.remove_post(post.id)
     db.session.delete(post)
     db.session.commit()
     flash('Bài viết đã được xóa!', 'success')
@@ -111,31 +168,86 @@ def like_post(post_id):
     like = PostLike.query.filter_by(user_id=current_user.id, post_id=post.id).first()
     if like:
         db.session.delete(like)
+        post.adjust_counters(likes=-1)
         # (Tùy chọn) Xóa notification nếu có, hoặc tạo notification "unliked"
         flash('Bạn đã bỏ thích bài viết.', 'info')
     else:
         new_like = PostLike(user_id=current_user.id, post_id=post.id)
         db.session.add(new_like)
+        post.adjust_counters(likes=1)
         # Tạo notification cho chủ bài viết (nếu không phải là người thích)
         if post.author_id != current_user.id:
-            post.author_user.add_notification(
+            notification_dispatcher.notify(
+                post.author_id,
                 actor=current_user,
                 type='new_like',
                 content=f'{current_user.username} đã thích bài viết "{post.title}".',
-                link=url_for('user.view_post', post_id=post.id, _external=True),
+                link_endpoint='user.view_post', link_values={'post_id': post.id},
                 source_entity_id=post.id,
-                source_entity_type='post'
+                source_entity_type='post',
+                # Khi nhiều người cùng thích, các thông báo được gộp lại làm một
+                aggregate_content=f'{current_user.username} và {{others}} người khác đã thích bài viết "{post.title}".'
             )
         flash('Bạn đã thích bài viết!', 'success')
     db.session.commit()
     return redirect(url_for('user.view_post', post_id=post.id))
 
 
+@bp.route('/timeline')
+@login_required
+@read_replica
+def friends_timeline():
+    feed = timeline.read_timeline(current_user.id, cursor=request.args.get('cursor'),
+                                  per_page=current_app.config['POSTS_PER_PAGE'])
+    return render_template('user/timeline.html', title='Bảng tin bạn bè',
+                           posts=feed.posts, pagination=feed.pagination)
+
+
+@bp.route('/genre/<int:genre_id>')
+@read_replica
+def browse_genre(genre_id):
+    catalog = genre_catalog()
+    if genre_id not in catalog:
+        abort(404)
+    # ?with=<id>&with=<id> thêm thể loại khác; mode=all: phải có đủ, mode=any: có ít nhất một
+    extra_ids = [gid for gid in request.args.getlist('with', type=int) if gid in catalog and gid != genre_id]
+    mode = 'all' if request.args.get('mode') == 'all' else 'any'
+    query = filter_by_genres(Post.query, [genre_id] + extra_ids, match_all=(mode == 'all'))
+    feed = load_feed_keyset(query, cursor=request.args.get('cursor'),
+                            per_page=current_app.config['POSTS_PER_PAGE'])
+    genre = catalog.by_id[genre_id]
+    return render_template('user/genre.html', title=f'Thể loại {genre.name}', genre=genre,
+                           catalog=catalog, extra_ids=extra_ids, mode=mode,
+                           posts=feed.posts, pagination=feed.pagination)
+
+
+@bp.route('/search')
+@read_replica
+def search():
+    query = request.args.get('q', '').strip()
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = current_app.config['SEARCH_RESULTS_PER_PAGE']
+    posts, has_next = [], False
+    if query:
+        # Lấy dư một kết quả để biết còn trang sau hay không
+        ranked = search_index.search(query, limit=per_page + 1, offset=(page - 1) * per_page)
+        has_next = len(ranked) > per_page
+        post_ids = [post_id for post_id, _ in ranked[:per_page]]
+        if post_ids:
+            by_id = {post.id: post for post in load_feed(Post.query.filter(Post.id.in_(post_ids)))}
+            posts = [by_id[post_id] for post_id in post_ids if post_id in by_id] # Giữ thứ tự theo độ liên quan
+    return render_template('user/search.html', title='Tìm kiếm', query=query, posts=posts,
+                           page=page, has_next=has_next)
+
+
 @bp.route('/profile/<username>')
 # @login_required # Có thể bỏ nếu muốn public profile
+@read_replica
 def profile(username):
     user_profile_obj = User.query.filter_by(username=username).first_or_404() # Đổi tên biến để tránh nhầm lẫn
-    user_posts = Post.query.filter_by(author_id=user_profile_obj.id).order_by(Post.created_at.desc()).all()
+    user_posts = load_feed_keyset(Post.query.filter_by(author_id=user_profile_obj.id),
+                                  cursor=request.args.get('cursor'),
+                                  per_page=current_app.config['POSTS_PER_PAGE'])
     
     is_self = current_user.is_authenticated and current_user.id == user_profile_obj.id
     are_friends = False
@@ -143,13 +255,15 @@ def profile(username):
     received_request_from_profile_user = False # current_user đã nhận request từ user_profile_obj
 
     if current_user.is_authenticated and not is_self:
-        are_friends = current_user.is_friends_with(user_profile_obj)
-        sent_request_to_profile_user = current_user.has_sent_request_to(user_profile_obj)
-        received_request_from_profile_user = current_user.has_received_request_from(user_profile_obj)
+        # Một câu truy vấn cho toàn bộ trạng thái quan hệ giữa hai người
+        relationship = friendship_graph.relationship(current_user.id, user_profile_obj.id)
+        are_friends = relationship == RELATIONSHIP_FRIENDS
+        sent_request_to_profile_user = relationship == RELATIONSHIP_REQUEST_SENT
+        received_request_from_profile_user = relationship == RELATIONSHIP_REQUEST_RECEIVED
         
     return render_template('user/profile.html', title=f'Hồ sơ {user_profile_obj.username}', 
                            user_profile=user_profile_obj, # Truyền user_profile_obj vào template
-                           posts=user_posts,
+                           posts=user_posts.posts, feed=user_posts, pagination=user_posts.pagination,
                            is_self=is_self, are_friends=are_friends,
                            sent_request=sent_request_to_profile_user, # Đổi tên biến cho rõ ràng
                            received_request=received_request_from_profile_user) # Đổi tên biến
@@ -167,11 +281,12 @@ def send_friend_request(username):
     friendship = current_user.send_friend_request(recipient) 
     if friendship:
         # Tạo notification cho người nhận
-        recipient.add_notification(
+        notification_dispatcher.notify(
+            recipient.id,
             actor=current_user,
             type='friend_request',
             content=f'{current_user.username} đã gửi cho bạn một lời mời kết bạn.',
-            link=url_for('user.friends_list', _external=True) # Hoặc link đến profile của current_user
+            link_endpoint='user.friends_list' # Hoặc link đến profile của current_user
         )
         db.session.commit()
         flash(f'Đã gửi yêu cầu kết bạn đến {username}.', 'success')
@@ -186,12 +301,14 @@ def accept_friend_request(username):
     # current_user là người nhận, requester là người gửi
     friendship = current_user.accept_friend_request(requester)
     if friendship:
+        timeline.backfill_friendship(current_user, requester)
         # Tạo notification cho người gửi yêu cầu (requester)
-        requester.add_notification(
+        notification_dispatcher.notify(
+            requester.id,
             actor=current_user,
             type='friend_accept',
             content=f'{current_user.username} đã chấp nhận lời mời kết bạn của bạn.',
-            link=url_for('user.profile', username=current_user.username, _external=True)
+            link_endpoint='user.profile', link_values={'username': current_user.username}
         )
         db.session.commit()
         flash(f'Bạn đã trở thành bạn bè với {username}.', 'success')
@@ -218,6 +335,7 @@ def decline_friend_request(username):
 def unfriend(username):
     friend_user = User.query.filter_by(username=username).first_or_404()
     if current_user.unfriend(friend_user):
+        timeline.purge_friendship(current_user, friend_user)
         db.session.commit()
         flash(f'Bạn đã hủy kết bạn với {username}.', 'info')
     else:
@@ -226,12 +344,14 @@ def unfriend(username):
 
 @bp.route('/friends')
 @login_required
+@read_replica
 def friends_list():
     friends = current_user.get_friends()
     pending_requests_received = current_user.get_pending_friend_requests() # Các request người khác gửi cho mình
     
     # Các request mình đã gửi và đang chờ
-    sent_pending_requests = Friendship.query.filter_by(user_id=current_user.id, status='pending').all() 
+    sent_pending_requests = Friendship.query.options(db.joinedload(Friendship.receiver)) \
+        .filter_by(user_id=current_user.id, status='pending').all()
     
     return render_template('user/friends.html', title='Bạn bè', 
                            friends=friends, 
@@ -242,14 +362,52 @@ def friends_list():
 # --- Notifications Routes ---
 @bp.route('/notifications')
 @login_required
+@read_replica
 def notifications():
-    # Lấy danh sách thông báo, sắp xếp theo thời gian mới nhất trước
-    user_notifications = current_user.notifications_received.order_by(Notification.created_at.desc()).all()
-    
+    # Lấy một trang thông báo (mới nhất trước), phân trang keyset theo (created_at, id)
+    query = Notification.query.filter(Notification.user_id == current_user.id) \
+                              .options(db.joinedload(Notification.actor_user))
+    user_notifications, pagination = keyset_paginate(
+        query, [Notification.created_at, Notification.id], cursor=request.args.get('cursor'),
+        per_page=current_app.config['NOTIFICATIONS_PER_PAGE'])
+
     # Không tự động đánh dấu đã đọc ở đây, để người dùng chủ động
     return render_template('user/notifications.html', 
                            title='Thông báo', 
-                           notifications=user_notifications)
+                           notifications=user_notifications,
+                           pagination=pagination)
+
+@bp.route('/notifications/stream')
+@login_required
+def notifications_stream():
+    # Server-sent events: đẩy thông báo mới và thay đổi số chưa đọc thay vì để client tải lại trang
+    subscription = event_bus.subscribe(current_user.id)
+    if subscription is None:
+        # Worker đã đủ số kết nối; client (EventSource) thử lại sau `retry` mili giây
+        return Response('retry: 30000\n\n', status=503, mimetype='text/event-stream',
+                        headers={'Retry-After': '30'})
+    unread = current_user.unread_notification_count()
+    heartbeat = current_app.config['SSE_HEARTBEAT_INTERVAL']
+    # Kết nối sống lâu: trả connection DB về pool trước khi bắt đầu stream
+    db.session.close()
+
+    def generate():
+        try:
+            yield format_sse('unread', dict(unread=unread))
+            while True:
+                events = subscription.wait(timeout=heartbeat)
+                if subscription.overflowed:
+                    # Client đọc chậm: đóng kết nối, EventSource sẽ kết nối lại với số liệu mới
+                    return
+                if not events:
+                    yield ': heartbeat\n\n'  # dòng chú thích giữ kết nối qua proxy
+                for name, data in events:
+                    yield format_sse(name, data)
+        finally:
+            event_bus.unsubscribe(subscription)
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @bp.route('/notifications/mark_read/<int:notification_id>', methods=['POST'])
 @login_required
@@ -258,8 +416,7 @@ def mark_notification_read(notification_id):
     if notification.user_id != current_user.id: # Đảm bảo user chỉ đánh dấu notif của mình
         abort(403)
     
-    was_unread = not notification.is_read
-    notification.is_read = True
+    was_unread = mark_read(current_user, notification_id=notification.id) > 0
     db.session.commit()
 
     if was_unread:
@@ -273,10 +430,16 @@ def mark_notification_read(notification_id):
 @bp.route('/notifications/mark_all_read', methods=['POST'])
 @login_required
 def mark_all_notifications_read():
-    unread_notifications = Notification.query.filter_by(user_id=current_user.id, is_read=False).all()
-    if unread_notifications:
-        for notif in unread_notifications:
-            notif.is_read = True
+    # Tùy chọn: chỉ một loại thông báo, hoặc chỉ những thông báo đến trước thời điểm trang được
+    # hiển thị (để không đánh dấu nhầm thông báo người dùng chưa kịp thấy)
+    before = None
+    if request.form.get('before'):
+        try:
+            before = datetime.fromisoformat(request.form['before'])
+        except ValueError:
+            abort(400)
+    marked = mark_read(current_user, type=request.form.get('type') or None, before=before)
+    if marked:
         db.session.commit()
         flash('Tất cả thông báo chưa đọc đã được đánh dấu là đã đọc.', 'success')
     else:
@@ -302,6 +465,8 @@ def mark_all_notifications_read():
 #         abort(403)
 #     post_id_redirect = comment.post_id
 #     db.session.delete(comment)
+#     comment.post_ref.adjust_counters(comments=-1) # Giữ Post.comment_count đồng bộ
+#     search_index.remove_comment(comment.id)
 #     db.session.commit()
 #     flash('Bình luận đã được xóa.', 'success')
 #     return redirect(url_for('user.view_post', post_id=post_id_redirect))
\ No newline at end of file
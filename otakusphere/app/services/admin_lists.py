@@ -0,0 +1,142 @@
+import csv
+import io
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from sqlalchemy.orm import load_only, joinedload
+from app import db
+from app.models import User, Post
+from app.services.feed import filter_by_genres
+from app.services.pagination import keyset_paginate
+
+# Danh sách người dùng/bài viết của trang admin: lọc phía server, phân trang keyset và xuất CSV.
+#
+# Danh sách chỉ tải các cột cần hiển thị (load_only), nên Post.content không bao giờ được đọc.
+# Người dùng sắp theo id (khóa chính, tăng theo thời gian tạo); bài viết theo (created_at, id)
+# để dùng ix_posts_created_at_id, hoặc ix_posts_author_id_created_at_id khi lọc theo tác giả.
+# Xuất CSV dùng cùng bộ lọc, đọc bằng yield_per (server-side cursor khi driver hỗ trợ) và
+# trả về từng lô dòng, nên bộ nhớ không phụ thuộc số dòng.
+
+EXPORT_BATCH_SIZE = 1000
+USER_ROLES = ('user', 'admin')
+# Excel/LibreOffice coi ô bắt đầu bằng các ký tự này là công thức (CSV injection)
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d') if value else None
+    except ValueError:
+        return None
+
+
+def parse_user_filters(args):
+    """Bộ lọc hợp lệ từ query string (giá trị sai bị bỏ qua); dùng lại làm tham số cho link phân trang."""
+    filters = {}
+    if args.get('role') in USER_ROLES:
+        filters['role'] = args['role']
+    if args.get('active') in ('1', '0'):
+        filters['active'] = args['active']
+    if args.get('sort') == 'oldest':
+        filters['sort'] = 'oldest'
+    return filters
+
+
+def parse_post_filters(args):
+    filters = {}
+    if args.get('author', '').strip():
+        filters['author'] = args['author'].strip()
+    genre_id = args.get('genre', type=int)
+    if genre_id:
+        filters['genre'] = genre_id
+    for name in ('date_from', 'date_to'):
+        if _parse_date(args.get(name)):
+            filters[name] = args[name]
+    if args.get('sort') == 'oldest':
+        filters['sort'] = 'oldest'
+    return filters
+
+
+def _user_criteria(filters):
+    criteria = []
+    if 'role' in filters:
+        criteria.append(User.role == filters['role'])
+    if 'active' in filters:
+        criteria.append(User.is_active == (filters['active'] == '1'))
+    return criteria
+
+
+def _post_criteria(filters):
+    criteria = []
+    if 'author' in filters:
+        author_id = select(User.id).where(User.username == filters['author']).scalar_subquery()
+        criteria.append(Post.author_id == author_id)
+    if 'date_from' in filters:
+        criteria.append(Post.created_at >= _parse_date(filters['date_from']))
+    if 'date_to' in filters:
+        # Bao gồm cả ngày date_to
+        criteria.append(Post.created_at < _parse_date(filters['date_to']) + timedelta(days=1))
+    return criteria
+
+
+def list_users(filters, cursor, per_page):
+    """Một trang người dùng theo bộ lọc; trả về (danh sách User, KeysetPagination)."""
+    query = User.query.options(load_only(User.id, User.username, User.email, User.role,
+                                         User.is_active, User.created_at)) \
+                      .filter(*_user_criteria(filters))
+    return keyset_paginate(query, [User.id], cursor=cursor, per_page=per_page,
+                           descending=filters.get('sort') != 'oldest', key=lambda user: (user.id,))
+
+
+def list_posts(filters, cursor, per_page):
+    """Một trang bài viết theo bộ lọc, không tải nội dung bài; trả về (danh sách Post, KeysetPagination)."""
+    query = Post.query.options(
+        load_only(Post.id, Post.title, Post.author_id, Post.created_at, Post.like_count, Post.comment_count),
+        joinedload(Post.author_user).load_only(User.id, User.username),
+    ).filter(*_post_criteria(filters))
+    if 'genre' in filters:
+        query = filter_by_genres(query, [filters['genre']])
+    return keyset_paginate(query, [Post.created_at, Post.id], cursor=cursor, per_page=per_page,
+                           descending=filters.get('sort') != 'oldest')
+
+
+def _csv_cell(value):
+    """Thêm dấu ' trước chuỗi (tên người dùng, tiêu đề bài...) có thể bị bảng tính hiểu là công thức."""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _csv_rows(header, statement):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM để Excel nhận đúng UTF-8 (tên tiếng Việt)
+    buffer.write('\ufeff')
+    writer.writerow(header)
+    for partition in db.session.execute(statement.execution_options(yield_per=EXPORT_BATCH_SIZE)).partitions():
+        writer.writerows([_csv_cell(value) for value in row] for row in partition)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()  # chỉ có header (không có dòng nào)
+
+
+def export_users_csv(filters):
+    """Sinh từng khối CSV của mọi người dùng khớp bộ lọc (cùng thứ tự với trang danh sách)."""
+    order = User.id.asc() if filters.get('sort') == 'oldest' else User.id.desc()
+    statement = select(User.id, User.username, User.email, User.role, User.is_active, User.created_at) \
+        .where(*_user_criteria(filters)).order_by(order)
+    return _csv_rows(['id', 'username', 'email', 'role', 'is_active', 'created_at'], statement)
+
+
+def export_posts_csv(filters):
+    """Sinh từng khối CSV của mọi bài viết khớp bộ lọc, không đọc nội dung bài."""
+    if filters.get('sort') == 'oldest':
+        order = (Post.created_at.asc(), Post.id.asc())
+    else:
+        order = (Post.created_at.desc(), Post.id.desc())
+    statement = select(Post.id, Post.title, User.username, Post.created_at, Post.like_count, Post.comment_count) \
+        .join(User, User.id == Post.author_id).where(*_post_criteria(filters)).order_by(*order)
+    if 'genre' in filters:
+        statement = filter_by_genres(statement, [filters['genre']])
+    return _csv_rows(['id', 'title', 'author', 'created_at', 'like_count', 'comment_count'], statement)
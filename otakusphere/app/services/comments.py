@@ -0,0 +1,14 @@
+from app import db
+from app.models import Comment
+from app.services.pagination import keyset_paginate
+
+# Bình luận của một bài viết, cũ nhất trước, phân trang keyset theo (created_at, id) trên
+# index ix_comments_post_id_created_at_id. Tác giả được JOIN ngay trong câu truy vấn nên
+# mỗi trang tốn đúng một câu SQL bất kể chủ đề dài bao nhiêu.
+
+
+def load_comments_page(post_id, cursor, per_page):
+    """Trả về (danh sách Comment kèm author_user, KeysetPagination)."""
+    query = Comment.query.filter(Comment.post_id == post_id).options(db.joinedload(Comment.author_user))
+    return keyset_paginate(query, [Comment.created_at, Comment.id], cursor=cursor,
+                           per_page=per_page, descending=False)
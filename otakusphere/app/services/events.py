@@ -0,0 +1,127 @@
+import json
+import threading
+from collections import deque, defaultdict
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# Bus pub/sub trong tiến trình cho luồng SSE /notifications/stream.
+#
+# Tầng thông báo gọi event_bus.publish_after_commit(...) trong transaction của mình; sự kiện
+# chỉ được phát tới các kết nối đang mở của người nhận SAU KHI transaction commit (rollback
+# thì bỏ), giống cách notification_dispatcher giữ yêu cầu trong session.info.
+#
+# Mỗi kết nối có một hàng đợi giới hạn (SSE_QUEUE_SIZE). Client đọc chậm làm đầy hàng đợi
+# thì kết nối bị đóng thay vì giữ sự kiện vô hạn trong bộ nhớ; EventSource tự kết nối lại và
+# nhận lại số chưa đọc hiện tại, nên không mất trạng thái. Số kết nối đồng thời trên mỗi
+# tiến trình bị giới hạn bởi SSE_MAX_STREAMS vì mỗi kết nối chiếm một luồng của worker.
+#
+# Bus chỉ phát trong tiến trình hiện tại: chạy nhiều worker thì cần thay bằng broker dùng
+# chung (Redis pub/sub...) với cùng giao diện publish/subscribe.
+
+_PENDING_KEY = 'pending_events'
+
+
+class Subscription:
+    """Một kết nối SSE: hàng đợi sự kiện giới hạn của một user."""
+
+    def __init__(self, user_id, max_size):
+        self.user_id = user_id
+        self.max_size = max_size
+        self.overflowed = False
+        self._events = deque()
+        self._ready = threading.Condition()
+
+    def put(self, name, data):
+        with self._ready:
+            if len(self._events) >= self.max_size:
+                # Client không theo kịp: bỏ hàng đợi và báo cho luồng SSE đóng kết nối
+                self._events.clear()
+                self.overflowed = True
+            else:
+                self._events.append((name, data))
+            self._ready.notify()
+
+    def wait(self, timeout):
+        """Chờ tối đa timeout giây; trả về danh sách sự kiện (rỗng nếu hết giờ)."""
+        with self._ready:
+            if not self._events and not self.overflowed:
+                self._ready.wait(timeout)
+            events = list(self._events)
+            self._events.clear()
+            return events
+
+
+class EventBus:
+
+    def __init__(self):
+        self.max_streams = 100
+        self.queue_size = 50
+        self._subscribers = defaultdict(set)  # user_id -> {Subscription}
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        app.config.setdefault('SSE_MAX_STREAMS', 100)
+        app.config.setdefault('SSE_QUEUE_SIZE', 50)
+        app.config.setdefault('SSE_HEARTBEAT_INTERVAL', 15)
+        self.max_streams = app.config['SSE_MAX_STREAMS']
+        self.queue_size = app.config['SSE_QUEUE_SIZE']
+        app.extensions['event_bus'] = self
+
+    def subscribe(self, user_id):
+        """Mở một kết nối; trả về None khi tiến trình đã đủ SSE_MAX_STREAMS kết nối."""
+        with self._lock:
+            if self._count >= self.max_streams:
+                return None
+            subscription = Subscription(user_id, self.queue_size)
+            self._subscribers[user_id].add(subscription)
+            self._count += 1
+            return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscribers.get(subscription.user_id)
+            if subscriptions is None or subscription not in subscriptions:
+                return
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._subscribers[subscription.user_id]
+            self._count -= 1
+
+    def has_subscribers(self, user_id):
+        return user_id in self._subscribers
+
+    def active_streams(self):
+        return self._count
+
+    def publish(self, user_id, name, data):
+        with self._lock:
+            subscriptions = list(self._subscribers.get(user_id, ()))
+        for subscription in subscriptions:
+            subscription.put(name, data)
+
+    def publish_after_commit(self, user_id, name, data):
+        """Phát sự kiện sau khi transaction hiện tại commit; bỏ qua nếu user không có kết nối nào."""
+        if not self.has_subscribers(user_id):
+            return
+        from app import db
+        db.session().info.setdefault(_PENDING_KEY, []).append((user_id, name, data))
+
+
+def format_sse(name, data):
+    """Một khung sự kiện theo định dạng text/event-stream."""
+    return f'event: {name}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'
+
+
+event_bus = EventBus()
+
+
+@event.listens_for(Session, 'after_commit')
+def _after_commit(session):
+    for user_id, name, data in session.info.pop(_PENDING_KEY, ()):
+        event_bus.publish(user_id, name, data)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _after_rollback(session):
+    session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,70 @@
+from sqlalchemy import func, select
+from sqlalchemy.orm import joinedload, selectinload
+from app.models import Post, post_genres_table
+from app.services.pagination import keyset_paginate
+
+# Tầng truy vấn feed: tải một trang bài viết cùng tác giả và thể loại với số câu
+# truy vấn cố định (không phụ thuộc số bài trên trang). Số lượt thích/bình luận
+# đọc thẳng từ cột phi chuẩn hóa Post.like_count/Post.comment_count.
+#   1. (chỉ khi phân trang OFFSET) COUNT tổng số bài
+#   2. SELECT posts JOIN users (tác giả)
+#   3. SELECT genres cho các bài trên trang (selectin)
+#
+# Phân trang keyset (load_feed_keyset) lọc theo (created_at, id) thay vì OFFSET và
+# không cần COUNT, nên trang thứ 500 tốn như trang đầu (dựa trên index ix_posts_*).
+
+
+def with_feed_options(query):
+    """Gắn chiến lược eager load cho tác giả và thể loại vào một query Post."""
+    return query.options(joinedload(Post.author_user), selectinload(Post.genres))
+
+
+class FeedPage:
+    """Một trang feed: danh sách Post đã eager load kèm thông tin phân trang."""
+
+    def __init__(self, posts, pagination=None):
+        self.posts = posts
+        self.pagination = pagination
+
+    def __iter__(self):
+        return iter(self.posts)
+
+    def __len__(self):
+        return len(self.posts)
+
+
+def filter_by_genres(query, genre_ids, match_all=False):
+    """Lọc query Post theo thể loại: có ít nhất một (OR) hoặc có đủ tất cả (AND).
+
+    Dùng semi-join trên post_genres (index (genre_id, post_id)) nên không nhân bản dòng Post.
+    """
+    genre_ids = list(dict.fromkeys(genre_ids))
+    if not genre_ids:
+        return query
+    post_ids = select(post_genres_table.c.post_id).where(post_genres_table.c.genre_id.in_(genre_ids))
+    if match_all and len(genre_ids) > 1:
+        post_ids = post_ids.group_by(post_genres_table.c.post_id) \
+                           .having(func.count(post_genres_table.c.genre_id) == len(genre_ids))
+    return query.filter(Post.id.in_(post_ids))
+
+
+def load_feed_page(query, page, per_page):
+    """Phân trang `query` (Post) theo kiểu OFFSET và trả về FeedPage."""
+    pagination = with_feed_options(query).paginate(page=page, per_page=per_page, error_out=False)
+    return FeedPage(pagination.items, pagination=pagination)
+
+
+def load_feed_keyset(query, cursor, per_page):
+    """Phân trang keyset `query` (Post chưa order_by), mới nhất trước.
+
+    `cursor` là token lấy từ KeysetPagination.next_cursor/prev_cursor (hoặc None
+    cho trang đầu); token không hợp lệ được coi như trang đầu.
+    """
+    posts, pagination = keyset_paginate(with_feed_options(query), [Post.created_at, Post.id],
+                                        cursor=cursor, per_page=per_page)
+    return FeedPage(posts, pagination=pagination)
+
+
+def load_feed(query):
+    """Tải toàn bộ kết quả của `query` (Post) và trả về FeedPage không phân trang."""
+    return FeedPage(with_feed_options(query).all())
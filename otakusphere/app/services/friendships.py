@@ -0,0 +1,90 @@
+from sqlalchemy import or_, and_, union_all, select, event
+from sqlalchemy.orm import Session, object_session
+from app import db, cache
+from app.models import Friendship
+
+# Dịch vụ đồ thị bạn bè. Một quan hệ giữa hai người được lưu bằng một dòng friendships
+# (user_id = người gửi, friend_id = người nhận), nên mọi trạng thái giữa A và B đều
+# suy ra được từ một câu truy vấn trên cả hai chiều.
+
+RELATIONSHIP_SELF = 'self'
+RELATIONSHIP_NONE = 'none'
+RELATIONSHIP_FRIENDS = 'friends'
+RELATIONSHIP_REQUEST_SENT = 'request_sent'  # viewer đã gửi lời mời, đang chờ
+RELATIONSHIP_REQUEST_RECEIVED = 'request_received'  # viewer đã nhận lời mời, đang chờ
+
+FRIENDS_NAMESPACE = 'friend_ids'
+_PENDING_KEY = 'friendship_invalidations'
+
+
+def _state_from_row(viewer_id, row):
+    if row is None:
+        return RELATIONSHIP_NONE
+    user_id, _, status = row
+    if status == 'accepted':
+        return RELATIONSHIP_FRIENDS
+    if status == 'pending':
+        return RELATIONSHIP_REQUEST_SENT if user_id == viewer_id else RELATIONSHIP_REQUEST_RECEIVED
+    return RELATIONSHIP_NONE
+
+
+def _rank(row):
+    # Nếu lỡ có dòng ở cả hai chiều, ưu tiên 'accepted' rồi tới 'pending'
+    return {'accepted': 0, 'pending': 1}.get(row[2], 2)
+
+
+class FriendshipGraph:
+
+    def relationship(self, viewer_id, other_id):
+        """Trạng thái quan hệ của viewer với other bằng một câu truy vấn."""
+        if viewer_id == other_id:
+            return RELATIONSHIP_SELF
+        rows = db.session.query(Friendship.user_id, Friendship.friend_id, Friendship.status).filter(or_(
+            and_(Friendship.user_id == viewer_id, Friendship.friend_id == other_id),
+            and_(Friendship.user_id == other_id, Friendship.friend_id == viewer_id),
+        )).all()
+        return _state_from_row(viewer_id, min(rows, key=_rank) if rows else None)
+
+    def friend_ids(self, user_id):
+        """Tập id bạn bè (frozenset) của user, cache theo user id."""
+        return cache.get_or_set(FRIENDS_NAMESPACE, user_id, lambda: self._load_friend_ids(user_id))
+
+    def _load_friend_ids(self, user_id):
+        # Một câu UNION ALL trên hai chiều; chiều friend_id dùng index (friend_id, status)
+        as_requester = select(Friendship.friend_id).where(Friendship.user_id == user_id,
+                                                          Friendship.status == 'accepted')
+        as_receiver = select(Friendship.user_id).where(Friendship.friend_id == user_id,
+                                                       Friendship.status == 'accepted')
+        return frozenset(db.session.execute(union_all(as_requester, as_receiver)).scalars())
+
+    def are_friends(self, user_id, other_id):
+        return other_id in self.friend_ids(user_id)
+
+    def invalidate(self, *user_ids):
+        for user_id in user_ids:
+            cache.delete(FRIENDS_NAMESPACE, user_id)
+
+
+friendship_graph = FriendshipGraph()
+
+
+# Mọi thay đổi trên một dòng friendships (chấp nhận, hủy kết bạn, chặn, ...) đều xóa cache
+# friend_ids của cả hai người, nhưng chỉ SAU khi transaction commit (giống identity cache).
+def _track_change(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(_PENDING_KEY, set()).update((target.user_id, target.friend_id))
+
+
+for _event_name in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(Friendship, _event_name, _track_change)
+
+
+@event.listens_for(Session, 'after_commit')
+def _after_commit(session):
+    friendship_graph.invalidate(*session.info.pop(_PENDING_KEY, ()))
+
+
+@event.listens_for(Session, 'after_rollback')
+def _after_rollback(session):
+    session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,75 @@
+import threading
+from collections import namedtuple
+from types import MappingProxyType
+from flask import current_app
+from sqlalchemy.orm import make_transient_to_detached
+from app import db, cache
+from app.models import Genre
+
+# Danh mục thể loại dùng chung cho PostForm, create_post và edit_post.
+# Thể loại rất ít thay đổi nên cả danh mục được nạp một lần cho mỗi tiến trình (mỗi app)
+# và giữ dưới dạng snapshot bất biến trong app.extensions. Phiên bản của snapshot chính là phiên bản của
+# namespace 'genres' trong app cache: admin ghi vào bảng genres thì gọi
+# invalidate_genre_catalog(), snapshot cũ sẽ bị nạp lại ở lần truy cập kế tiếp
+# (kể cả ở tiến trình khác nếu cache dùng backend chung).
+
+GenreSnapshot = namedtuple('GenreSnapshot', ['id', 'name', 'description'])
+
+
+class GenreCatalog:
+    """Snapshot bất biến của bảng genres: tra cứu theo id và danh sách choices đã sắp xếp."""
+
+    def __init__(self, genres, version):
+        self.version = version
+        snapshots = sorted((GenreSnapshot(g.id, g.name, g.description) for g in genres),
+                           key=lambda g: g.name)
+        self.by_id = MappingProxyType({g.id: g for g in snapshots})
+        self.genres = tuple(snapshots)
+        self.choices = tuple((g.id, g.name) for g in snapshots)
+
+    def __contains__(self, genre_id):
+        return genre_id in self.by_id
+
+    def __len__(self):
+        return len(self.genres)
+
+    def resolve(self, genre_ids):
+        """Trả về các Genre gắn vào session hiện tại cho danh sách id, không cần SELECT.
+
+        Id không có trong danh mục bị bỏ qua (giống Genre.id.in_(...) trước đây).
+        """
+        resolved = []
+        for genre_id in dict.fromkeys(genre_ids):
+            snapshot = self.by_id.get(genre_id)
+            if snapshot is None:
+                continue
+            genre = Genre(id=snapshot.id, name=snapshot.name, description=snapshot.description)
+            # Biến đối tượng transient thành detached rồi merge(load=False) để gắn vào
+            # session mà không phát sinh truy vấn (dùng lại instance nếu session đã có)
+            make_transient_to_detached(genre)
+            resolved.append(db.session.merge(genre, load=False))
+        return resolved
+
+
+_CATALOG_KEY = 'genre_catalog'
+_catalog_lock = threading.Lock()
+
+
+def genre_catalog():
+    """Danh mục thể loại hiện hành, nạp lại khi phiên bản trong cache thay đổi."""
+    extensions = current_app.extensions
+    version = cache.namespace_version('genres')
+    catalog = extensions.get(_CATALOG_KEY)
+    if catalog is None or catalog.version != version:
+        with _catalog_lock:
+            catalog = extensions.get(_CATALOG_KEY)
+            if catalog is None or catalog.version != version:
+                catalog = GenreCatalog(Genre.query.all(), version)
+                extensions[_CATALOG_KEY] = catalog
+    return catalog
+
+
+def invalidate_genre_catalog():
+    # Gọi sau mỗi lần commit thay đổi bảng genres
+    cache.invalidate('genres')
+    current_app.extensions.pop(_CATALOG_KEY, None)
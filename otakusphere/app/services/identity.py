@@ -0,0 +1,86 @@
+from flask import current_app
+from flask_login import UserMixin
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app import db, cache
+from app.models import User
+
+# Danh tính nhẹ cho Flask-Login. load_user chạy ở mọi request, nên thay vì nạp cả
+# dòng users (kể cả cột bio kiểu Text) ta chỉ SELECT vài cột cần cho layout/phân quyền
+# và cache kết quả (dữ liệu thuần) theo user id với TTL ngắn. Route nào cần tới
+# phương thức/quan hệ của User (get_friends, notifications_received, ...) thì
+# UserIdentity tự nạp User đầy đủ ở lần truy cập đầu tiên trong request đó.
+#
+# Thay đổi nằm trong một transaction chưa commit thì phải xóa cache SAU khi commit
+# (invalidate_identity_after_commit): xóa sớm hơn thì một request khác có thể đọc lại giá trị
+# cũ và cache nó thêm USER_IDENTITY_TTL giây.
+
+IDENTITY_NAMESPACE = 'user_identity'
+_PENDING_KEY = 'identity_invalidations'
+_IDENTITY_COLUMNS = (User.id, User.username, User.role, User.is_active, User.unread_notifications)
+
+
+class UserIdentity(UserMixin):
+    """current_user rút gọn; thuộc tính không có sẵn được lấy từ User đầy đủ."""
+
+    def __init__(self, id, username, role, is_active, unread_notifications):
+        self.id = id
+        self.username = username
+        self.role = role
+        self._is_active = is_active
+        self.unread_notifications = unread_notifications
+        self._user = None
+
+    @property
+    def is_active(self):
+        return self._is_active
+
+    def unread_notification_count(self):
+        return self.unread_notifications or 0
+
+    def get_user(self):
+        """Nạp (một lần cho mỗi request) đối tượng User đầy đủ."""
+        if self._user is None:
+            self._user = db.session.get(User, self.id)
+        return self._user
+
+    def __getattr__(self, name):
+        # Chỉ được gọi khi thuộc tính không tồn tại trên UserIdentity
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.get_user(), name)
+
+    def __repr__(self):
+        return f'<UserIdentity {self.username}>'
+
+
+def _fetch_identity_row(user_id):
+    row = db.session.query(*_IDENTITY_COLUMNS).filter(User.id == user_id).first()
+    return tuple(row) if row else None
+
+
+def load_identity(user_id):
+    row = cache.get_or_set(IDENTITY_NAMESPACE, user_id, lambda: _fetch_identity_row(user_id),
+                           ttl=current_app.config['USER_IDENTITY_TTL'])
+    return UserIdentity(*row) if row else None
+
+
+def invalidate_identity(user_id):
+    # Gọi khi role/is_active/username/bộ đếm thông báo của user thay đổi
+    cache.delete(IDENTITY_NAMESPACE, user_id)
+
+
+def invalidate_identity_after_commit(user_id):
+    """Như invalidate_identity nhưng chờ transaction hiện tại commit (rollback thì bỏ)."""
+    db.session().info.setdefault(_PENDING_KEY, set()).add(user_id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _after_commit(session):
+    for user_id in session.info.pop(_PENDING_KEY, ()):
+        invalidate_identity(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _after_rollback(session):
+    session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,228 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import event, update, select
+from sqlalchemy.orm import Session
+from werkzeug.exceptions import RequestEntityTooLarge
+from app import db
+from app.models import PostMedia
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow là phụ thuộc tùy chọn: thiếu thì chỉ không có ảnh thu nhỏ
+    Image = None
+
+# Lưu media của bài viết.
+#
+# File tải lên được chép từng khối (MEDIA_CHUNK_SIZE) sang một file tạm trong MEDIA_ROOT
+# đồng thời tính SHA-256, rồi đổi tên thành <hash>.<đuôi> trong thư mục con theo 2 ký tự
+# đầu của hash. Cùng một nội dung chỉ được lưu một lần, các PostMedia dùng chung đường dẫn.
+# Werkzeug vốn đã ghi phần file của form multipart ra file tạm khi vượt 500 KB, nên không
+# có lúc nào cả video nằm trong bộ nhớ. MAX_CONTENT_LENGTH giới hạn cả request (413), còn
+# MEDIA_MAX_IMAGE_SIZE/MEDIA_MAX_VIDEO_SIZE giới hạn từng file khi đang chép.
+#
+# Ảnh thu nhỏ được tạo bởi một pool luồng nền SAU KHI transaction tạo bài commit, rồi ghi
+# thumbnail_path vào mọi PostMedia trỏ tới cùng file.
+#
+# File mới được ghi trong một transaction không commit (form lỗi ở bước sau, exception...)
+# bị xóa khi transaction kết thúc, trừ khi đã có PostMedia khác trỏ tới cùng nội dung hoặc
+# một transaction khác của tiến trình vừa store() ra cùng file mà chưa kết thúc. Mỗi lần
+# store() giữ một "claim" trên đường dẫn (đếm trong bộ nhớ, dưới khóa) tới khi transaction của
+# nó kết thúc. Các worker khác nhau không thấy claim của nhau: nếu chạy nhiều tiến trình chung
+# MEDIA_ROOT thì vẫn có thể xóa nhầm trong khoảng hẹp đó.
+
+_PENDING_KEY = 'pending_thumbnails'
+_NEW_FILES_KEY = 'new_media_files'
+_CLAIMS_KEY = 'claimed_media_files'
+IMAGE_EXTENSIONS = {'jpg', 'jpeg', 'png', 'gif'}
+VIDEO_EXTENSIONS = {'mp4', 'mov', 'avi', 'mkv', 'webm'}
+
+
+class MediaTooLarge(RequestEntityTooLarge):
+    description = 'File tải lên vượt quá dung lượng cho phép.'
+
+
+class MediaPipeline:
+
+    def __init__(self):
+        self.app = None
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._claims = Counter()  # đường dẫn -> số transaction đang dùng, chưa kết thúc
+        self._claims_lock = threading.Lock()
+
+    def init_app(self, app):
+        if not app.config.get('MEDIA_ROOT'):
+            app.config['MEDIA_ROOT'] = os.path.join(app.instance_path, 'media')
+        app.config.setdefault('MEDIA_CHUNK_SIZE', 64 * 1024)
+        app.config.setdefault('MEDIA_MAX_IMAGE_SIZE', 10 * 1024 * 1024)
+        app.config.setdefault('MEDIA_MAX_VIDEO_SIZE', 200 * 1024 * 1024)
+        app.config.setdefault('MEDIA_THUMBNAIL_SIZE', (320, 320))
+        app.config.setdefault('MEDIA_THUMBNAIL_WORKERS', 2)
+        self.app = app
+        app.extensions['media_pipeline'] = self
+
+    @property
+    def root(self):
+        return self.app.config['MEDIA_ROOT']
+
+    def _path(self, relative_path):
+        return os.path.join(self.root, *relative_path.split('/'))
+
+    # --- Lưu file ---
+    def store(self, file_storage, max_size):
+        """Chép file tải lên vào kho theo nội dung; trả về đường dẫn tương đối (dùng chung nếu trùng)."""
+        extension = os.path.splitext(file_storage.filename or '')[1].lower().lstrip('.')
+        tmp_dir = os.path.join(self.root, 'tmp')
+        os.makedirs(tmp_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        chunk_size = self.app.config['MEDIA_CHUNK_SIZE']
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                while True:
+                    chunk = file_storage.stream.read(chunk_size)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > max_size:
+                        raise MediaTooLarge()
+                    digest.update(chunk)
+                    out.write(chunk)
+            name = digest.hexdigest()
+            relative_path = f'{name[:2]}/{name}.{extension}' if extension else f'{name[:2]}/{name}'
+            final_path = self._path(relative_path)
+            session = db.session()
+            with self._claims_lock:
+                if os.path.exists(final_path):
+                    os.remove(tmp_path)  # đã có file cùng nội dung
+                else:
+                    os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                    os.replace(tmp_path, final_path)
+                    session.info.setdefault(_NEW_FILES_KEY, set()).add(relative_path)
+                self._claims[relative_path] += 1
+            session.info.setdefault(_CLAIMS_KEY, []).append(relative_path)
+            return relative_path
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def attach_uploads(self, post, image=None, video=None, embed_url=None):
+        """Lưu các media từ PostForm và thêm PostMedia cho bài (post đã có id); trả về danh sách PostMedia."""
+        config = self.app.config
+        items = []
+        if image:
+            path = self.store(image, config['MEDIA_MAX_IMAGE_SIZE'])
+            thumbnail = self.thumbnail_path_for(path)
+            media = PostMedia(post_id=post.id, media_type='image', file_path=path,
+                              thumbnail_path=thumbnail if os.path.exists(self._path(thumbnail)) else None)
+            if media.thumbnail_path is None:
+                db.session().info.setdefault(_PENDING_KEY, set()).add(path)
+            items.append(media)
+        if video:
+            path = self.store(video, config['MEDIA_MAX_VIDEO_SIZE'])
+            items.append(PostMedia(post_id=post.id, media_type='video_file', file_path=path))
+        if embed_url:
+            items.append(PostMedia(post_id=post.id, media_type='video_embed', file_path=embed_url))
+        db.session.add_all(items)
+        return items
+
+    # --- Ảnh thu nhỏ ---
+    def thumbnail_path_for(self, relative_path):
+        name = os.path.splitext(relative_path.rsplit('/', 1)[-1])[0]
+        return f'thumbs/{name[:2]}/{name}.jpg'
+
+    def _submit_thumbnails(self, paths):
+        if Image is None:
+            self.app.logger.warning('Chưa cài Pillow, bỏ qua tạo ảnh thu nhỏ cho %d ảnh', len(paths))
+            return
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.app.config['MEDIA_THUMBNAIL_WORKERS'],
+                                                    thread_name_prefix='media-thumbnail')
+        for path in paths:
+            self._executor.submit(self._make_thumbnail, path)
+
+    def _make_thumbnail(self, relative_path):
+        thumbnail = self.thumbnail_path_for(relative_path)
+        target = self._path(thumbnail)
+        try:
+            if not os.path.exists(target):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with Image.open(self._path(relative_path)) as image:
+                    image.thumbnail(self.app.config['MEDIA_THUMBNAIL_SIZE'])
+                    # Ghi ra file tạm rồi đổi tên để không ai đọc phải ảnh ghi dở
+                    tmp_target = f'{target}.{threading.get_ident()}.tmp'
+                    image.convert('RGB').save(tmp_target, 'JPEG', quality=85)
+                    os.replace(tmp_target, target)
+            with self.app.app_context():
+                db.session.execute(update(PostMedia)
+                                   .where(PostMedia.file_path == relative_path, PostMedia.thumbnail_path.is_(None))
+                                   .values(thumbnail_path=thumbnail))
+                db.session.commit()
+        except Exception:
+            self.app.logger.exception('Không tạo được ảnh thu nhỏ cho %s', relative_path)
+
+    def _release(self, claimed, new_paths):
+        """Trả claim của một transaction vừa kết thúc; xóa các file nó mới ghi mà không ai còn dùng."""
+        with self._claims_lock:
+            for relative_path in claimed:
+                self._claims[relative_path] -= 1
+                if self._claims[relative_path] <= 0:
+                    del self._claims[relative_path]
+            # Giữ khóa tới khi xóa xong để store() khác không dùng lại file giữa lúc kiểm tra và xóa
+            orphans = sorted(path for path in new_paths if path not in self._claims)
+            if orphans:
+                self._discard_files(orphans)
+
+    def _discard_files(self, paths):
+        """Xóa các file vừa ghi của một transaction không commit, nếu không PostMedia nào dùng tới."""
+        try:
+            # Kết nối riêng: session của transaction vừa kết thúc không chạy SQL được nữa
+            with db.engine.connect() as connection:
+                referenced = set(connection.execute(
+                    select(PostMedia.file_path).where(PostMedia.file_path.in_(paths))).scalars())
+            for relative_path in set(paths) - referenced:
+                path = self._path(relative_path)
+                if os.path.exists(path):
+                    os.remove(path)
+        except Exception:
+            self.app.logger.exception('Không dọn được %d file media của transaction bị hủy', len(paths))
+
+    def wait(self):
+        """Chờ các ảnh thu nhỏ đang tạo xong (dùng cho lệnh CLI và khi kiểm thử)."""
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+media_pipeline = MediaPipeline()
+
+
+@event.listens_for(Session, 'after_commit')
+def _after_commit(session):
+    session.info.pop(_NEW_FILES_KEY, None)
+    paths = session.info.pop(_PENDING_KEY, None)
+    if paths:
+        media_pipeline._submit_thumbnails(sorted(paths))
+
+
+@event.listens_for(Session, 'after_rollback')
+def _after_rollback(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def _after_transaction_end(session, transaction):
+    # Chạy cả khi rollback lẫn khi session bị đóng giữa chừng (teardown sau exception);
+    # nếu đã commit thì after_commit đã lấy danh sách đi trước đó
+    if transaction.parent is None:
+        claimed = session.info.pop(_CLAIMS_KEY, None)
+        if claimed:
+            media_pipeline._release(claimed, session.info.pop(_NEW_FILES_KEY, ()))
@@ -0,0 +1,424 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from flask import url_for, request, has_request_context
+from sqlalchemy import event, insert, update, delete, select, bindparam, func
+from sqlalchemy.orm import Session
+from app import db
+from app.models import User, Post, PostLike, Notification, NotificationArchive
+from app.services.events import event_bus
+
+# Gửi thông báo bất đồng bộ.
+#
+# Route chỉ gọi notification_dispatcher.notify(...) trong transaction của mình; yêu cầu được
+# giữ trong session.info và chỉ được ghi vào outbox SAU KHI transaction đó commit (rollback
+# thì bị bỏ). Outbox là một file SQLite riêng, nên thông báo đã nhận không bị mất khi tiến
+# trình khởi động lại. Một luồng nền lấy từng lô từ outbox, dựng link tuyệt đối, chèn các
+# Notification bằng một lệnh executemany, cộng bộ đếm chưa đọc theo người nhận rồi xóa lô
+# khỏi outbox. Giao ít nhất một lần: nếu chết giữa lúc commit DB chính và xóa outbox, lô đó
+# được giao lại.
+#
+# Chỉ dùng một luồng tiêu thụ: các lô đã được gộp, và SQLite chỉ có một writer tại một thời
+# điểm nên thêm luồng ghi không làm nhanh hơn. NOTIFICATION_DISPATCH = 'sync' giữ cách cũ
+# (ghi ngay trong transaction của request), hữu ích khi test hoặc dùng sqlite:// trong bộ nhớ.
+#
+# Gộp thông báo: với các loại trong COALESCE_TYPES, thông báo mới cùng người nhận và cùng
+# đối tượng nguồn (ví dụ cùng một bài viết) được gộp vào thông báo CHƯA ĐỌC sẵn có thay vì
+# thêm dòng mới: cập nhật người thực hiện gần nhất và đưa lên đầu danh sách. Thông báo đã
+# đọc thì không gộp nữa, lần sau sẽ bắt đầu một dòng mới. actor_count là số người khác nhau
+# đang thực hiện hành động đó (ví dụ số người đang thích bài), đếm lại từ dữ liệu gốc lúc
+# giao, nên thích/bỏ thích qua lại không làm nó tăng.
+#
+# Thông báo đã đọc quá NOTIFICATION_RETENTION_DAYS ngày được xóa (hoặc chuyển sang
+# notifications_archive) theo lô bởi compact_notifications, chạy định kỳ trong luồng nền
+# hoặc bằng lệnh `flask compact-notifications`.
+
+_PENDING_KEY = 'pending_notifications'
+
+
+def _count_likers(post_ids):
+    """Số người (trừ tác giả) đang thích mỗi bài; khóa chính (user_id, post_id) nên mỗi người một dòng."""
+    return dict(db.session.query(PostLike.post_id, func.count())
+                .join(Post, Post.id == PostLike.post_id)
+                .filter(PostLike.post_id.in_(post_ids), PostLike.user_id != Post.author_id)
+                .group_by(PostLike.post_id).all())
+
+
+# Loại thông báo được gộp -> hàm đếm số người thực hiện theo id đối tượng nguồn
+COALESCE_TYPES = {'new_like': _count_likers}
+
+
+def _coalesce_key(payload):
+    if payload['type'] not in COALESCE_TYPES or payload.get('source_entity_id') is None:
+        return None
+    return (payload['user_id'], payload['type'], payload['source_entity_type'], payload['source_entity_id'])
+
+
+def _aggregate_content(payload, actor_count):
+    # aggregate_content chứa chỗ trống {others}; dùng replace thay vì format vì nội dung
+    # có thể chứa dấu ngoặc nhọn (tiêu đề bài viết...)
+    template = payload.get('aggregate_content')
+    if actor_count <= 1 or not template:
+        return payload['content']
+    return template.replace('{others}', str(actor_count - 1))
+
+
+def _unread_to_coalesce(keys):
+    """Các thông báo chưa đọc có thể gộp, theo khóa gộp; một câu truy vấn cho cả lô."""
+    rows = db.session.query(
+        Notification.id, Notification.user_id, Notification.type, Notification.source_entity_type,
+        Notification.source_entity_id
+    ).filter(
+        Notification.user_id.in_({key[0] for key in keys}),
+        Notification.is_read == False,
+        Notification.type.in_({key[1] for key in keys}),
+        Notification.source_entity_id.in_({key[3] for key in keys}),
+    ).order_by(Notification.id).all()
+    found = {}
+    for row in rows:
+        key = (row.user_id, row.type, row.source_entity_type, row.source_entity_id)
+        if key in keys:
+            # Cùng các khóa với một dòng sắp chèn (user_id, type...) để phần sau xử lý như nhau
+            found[key] = dict(notification_id=row.id, user_id=row.user_id, type=row.type)
+    return found
+
+
+def deliver_notifications(payloads):
+    """Chèn (hoặc gộp) một lô thông báo và cập nhật bộ đếm chưa đọc, trong transaction hiện tại."""
+    if not payloads:
+        return
+    now = datetime.utcnow()
+    keys = {key for key in map(_coalesce_key, payloads) if key is not None}
+    targets = _unread_to_coalesce(keys) if keys else {}
+    actor_counts = {}
+    for type_name, count_actors in COALESCE_TYPES.items():
+        source_ids = {key[3] for key in keys if key[1] == type_name}
+        if source_ids:
+            counts = count_actors(source_ids)
+            actor_counts.update({key: counts.get(key[3], 0) for key in keys if key[1] == type_name})
+
+    inserts, updates = [], {}
+    for p in payloads:
+        key = _coalesce_key(p)
+        target = targets.get(key) if key is not None else None
+        # Ít nhất là người vừa thực hiện (có thể đã bỏ thích trước khi thông báo được giao)
+        actor_count = max(actor_counts.get(key, 0), 1)
+        if target is None:
+            row = dict(user_id=p['user_id'], actor_id=p['actor_id'], type=p['type'],
+                       content=_aggregate_content(p, actor_count), link=p['link'],
+                       source_entity_id=p['source_entity_id'], source_entity_type=p['source_entity_type'],
+                       is_read=False, actor_count=actor_count, created_at=now)
+            inserts.append(row)
+            if key is not None:
+                targets[key] = row  # các thông báo sau trong cùng lô gộp vào dòng sắp chèn này
+            continue
+        target.update(actor_id=p['actor_id'], actor_count=actor_count, link=p['link'], created_at=now,
+                      content=_aggregate_content(p, actor_count))
+        if 'notification_id' in target:
+            updates[target['notification_id']] = target
+
+    if inserts:
+        db.session.execute(insert(Notification), inserts)
+    if updates:
+        table = Notification.__table__
+        db.session.execute(
+            update(table).where(table.c.id == bindparam('notification_id')).values(
+                actor_id=bindparam('new_actor_id'), actor_count=bindparam('new_actor_count'),
+                content=bindparam('new_content'), link=bindparam('new_link'),
+                created_at=bindparam('new_created_at')),
+            [dict(notification_id=notification_id, new_actor_id=t['actor_id'], new_actor_count=t['actor_count'],
+                  new_content=t['content'], new_link=t['link'], new_created_at=t['created_at'])
+             for notification_id, t in updates.items()]
+        )
+
+    # Chỉ dòng mới mới làm tăng số chưa đọc; dòng được gộp vốn đã là chưa đọc
+    per_recipient = Counter(row['user_id'] for row in inserts)
+    if per_recipient:
+        db.session.execute(
+            update(User.__table__)
+            .where(User.__table__.c.id == bindparam('recipient_id'))
+            .values(unread_notifications=User.__table__.c.unread_notifications + bindparam('added')),
+            [dict(recipient_id=user_id, added=count) for user_id, count in per_recipient.items()]
+        )
+    from app.services.identity import invalidate_identity_after_commit
+    for user_id in per_recipient:
+        invalidate_identity_after_commit(user_id)
+
+    # Đẩy tới các kết nối SSE đang mở (chỉ phát sau khi lô này commit)
+    for row, unread_delta in [(row, 1) for row in inserts] + [(t, 0) for t in updates.values()]:
+        event_bus.publish_after_commit(row['user_id'], 'notification', dict(
+            type=row['type'], content=row['content'], link=row['link'], unread_delta=unread_delta))
+
+
+def mark_read(user, type=None, before=None, notification_id=None):
+    """Đánh dấu đã đọc các thông báo chưa đọc của user bằng một câu UPDATE.
+
+    Lọc tùy chọn theo loại (type), theo thời điểm (created_at <= before) hoặc một thông báo
+    cụ thể. Bộ đếm chưa đọc giảm đúng số dòng thực sự đổi trạng thái (rowcount), nên vẫn
+    đúng khi có thông báo mới chen vào giữa lúc xem trang và lúc bấm nút. Không commit.
+    """
+    stmt = update(Notification).where(Notification.user_id == user.id, Notification.is_read == False)
+    if type is not None:
+        stmt = stmt.where(Notification.type == type)
+    if before is not None:
+        stmt = stmt.where(Notification.created_at <= before)
+    if notification_id is not None:
+        stmt = stmt.where(Notification.id == notification_id)
+    # 'evaluate' cập nhật luôn các Notification đang nằm trong session mà không cần SELECT thêm
+    result = db.session.execute(stmt.values(is_read=True).execution_options(synchronize_session='evaluate'))
+    if result.rowcount:
+        user.adjust_unread_notifications(-result.rowcount)
+        # Các tab khác của cùng user cập nhật lại huy hiệu số chưa đọc
+        event_bus.publish_after_commit(user.id, 'read', dict(unread_delta=-result.rowcount))
+    return result.rowcount
+
+
+def compact_notifications(retention_days, archive=False, batch_size=1000):
+    """Xóa (hoặc lưu trữ) thông báo đã đọc cũ hơn retention_days ngày; trả về số dòng đã xử lý.
+
+    Mỗi lô một transaction riêng để không giữ khóa ghi lâu; thông báo chưa đọc không bị đụng
+    tới nên bộ đếm chưa đọc không đổi.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    columns = ['id', 'user_id', 'actor_id', 'type', 'content', 'link',
+               'source_entity_id', 'source_entity_type', 'actor_count', 'created_at']
+    total = 0
+    while True:
+        ids = db.session.execute(
+            select(Notification.id)
+            .where(Notification.is_read == True, Notification.created_at < cutoff)
+            .order_by(Notification.id).limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            break
+        if archive:
+            source = select(*[Notification.__table__.c[name] for name in columns]).where(Notification.id.in_(ids))
+            db.session.execute(insert(NotificationArchive).from_select(columns, source))
+        db.session.execute(delete(Notification).where(Notification.id.in_(ids)))
+        db.session.commit()
+        total += len(ids)
+        if len(ids) < batch_size:
+            break
+    return total
+
+
+class NotificationOutbox:
+    """Hàng đợi bền trên file SQLite; mỗi luồng dùng kết nối riêng."""
+
+    def __init__(self, path, claim_timeout=60, max_attempts=5):
+        self.path = path
+        self.claim_timeout = claim_timeout
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+        with self._connect() as conn:
+            # Dòng thất bại quá max_attempts lần được giữ lại (không nhận nữa) để kiểm tra thủ công
+            conn.execute("CREATE TABLE IF NOT EXISTS outbox ("
+                         "id INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT NOT NULL, "
+                         "claimed_by TEXT, claimed_at REAL, attempts INTEGER NOT NULL DEFAULT 0)")
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def append(self, payloads):
+        with self._connect() as conn:
+            conn.executemany("INSERT INTO outbox (payload) VALUES (?)",
+                             [(json.dumps(p, ensure_ascii=False),) for p in payloads])
+
+    def claim(self, worker_id, limit):
+        """Nhận một lô (kể cả lô đã nhận quá claim_timeout giây mà chưa xong)."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE outbox SET claimed_by = ?, claimed_at = ? WHERE id IN ("
+                "SELECT id FROM outbox WHERE (claimed_by IS NULL OR claimed_at < ?) AND attempts < ? "
+                "ORDER BY id LIMIT ?)",
+                (worker_id, now, now - self.claim_timeout, self.max_attempts, limit))
+            rows = conn.execute("SELECT id, payload FROM outbox WHERE claimed_by = ? AND claimed_at = ? ORDER BY id",
+                                (worker_id, now)).fetchall()
+        return [row[0] for row in rows], [json.loads(row[1]) for row in rows]
+
+    def ack(self, ids):
+        with self._connect() as conn:
+            conn.executemany("DELETE FROM outbox WHERE id = ?", [(i,) for i in ids])
+
+    def release(self, ids, failed=False):
+        with self._connect() as conn:
+            conn.executemany("UPDATE outbox SET claimed_by = NULL, claimed_at = NULL, "
+                             "attempts = attempts + ? WHERE id = ?",
+                             [(1 if failed else 0, i) for i in ids])
+
+
+class NotificationDispatcher:
+
+    def __init__(self):
+        self.app = None
+        self.outbox = None
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._worker_id = None
+        self._last_compaction = None
+
+    def init_app(self, app):
+        app.config.setdefault('NOTIFICATION_DISPATCH', 'async')
+        app.config.setdefault('NOTIFICATION_BATCH_SIZE', 200)
+        app.config.setdefault('NOTIFICATION_FLUSH_INTERVAL', 0.5)
+        app.config.setdefault('NOTIFICATION_RETENTION_DAYS', 90)
+        app.config.setdefault('NOTIFICATION_RETENTION_MODE', 'delete')
+        app.config.setdefault('NOTIFICATION_COMPACT_INTERVAL', 3600)
+        app.config.setdefault('NOTIFICATION_COMPACT_BATCH_SIZE', 1000)
+        if not app.config.get('NOTIFICATION_OUTBOX_PATH'):
+            app.config['NOTIFICATION_OUTBOX_PATH'] = os.path.join(app.instance_path, 'notification_outbox.db')
+        self.app = app
+        app.extensions['notification_dispatcher'] = self
+        self.outbox = None
+        if app.config['NOTIFICATION_DISPATCH'] != 'async':
+            return
+        self.outbox = NotificationOutbox(app.config['NOTIFICATION_OUTBOX_PATH'])
+        self._worker_id = f'{os.getpid()}-{id(self)}'
+
+        @app.before_request
+        def _start_notification_worker():
+            # Khởi động luồng nền ở request đầu tiên (không chạy khi dùng lệnh CLI),
+            # luồng này cũng giao nốt các thông báo còn sót trong outbox từ lần chạy trước
+            if self._thread is None:
+                self.start()
+
+    # --- Phía request ---
+    def notify(self, recipient_id, actor, type, content, link_endpoint=None, link_values=None,
+               source_entity_id=None, source_entity_type=None, aggregate_content=None):
+        """Gửi một thông báo; aggregate_content (có chỗ trống {others}) là nội dung khi được gộp."""
+        payload = dict(user_id=recipient_id, actor_id=actor.id if actor else None, type=type,
+                       content=content, link_endpoint=link_endpoint, link_values=link_values or {},
+                       source_entity_id=source_entity_id, source_entity_type=source_entity_type,
+                       aggregate_content=aggregate_content)
+        if self.outbox is None:
+            payload['link'] = self._build_link(payload)
+            deliver_notifications([payload])
+            return
+        payload['base_url'] = request.host_url if has_request_context() else None
+        db.session().info.setdefault(_PENDING_KEY, []).append(payload)
+
+    def _build_link(self, payload):
+        if not payload['link_endpoint']:
+            return None
+        return url_for(payload['link_endpoint'], _external=True, **payload['link_values'])
+
+    def _flush_committed(self, session):
+        payloads = session.info.pop(_PENDING_KEY, None)
+        if payloads and self.outbox is not None:
+            self.outbox.append(payloads)
+            self._wakeup.set()
+
+    # --- Luồng nền ---
+    def start(self):
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='notification-dispatcher', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        interval = self.app.config['NOTIFICATION_FLUSH_INTERVAL']
+        try:
+            while True:
+                self._wakeup.wait(timeout=interval * 10)
+                # Chờ thêm một nhịp để gom các thông báo đến sát nhau vào cùng một lô
+                time.sleep(interval)
+                self._wakeup.clear()
+                try:
+                    while self.drain_once():
+                        pass
+                    self._maybe_compact()
+                except Exception:
+                    # Lỗi ngoài _deliver (outbox SQLite bị khóa/hỏng...): ghi log rồi thử lại ở vòng
+                    # sau; lô đang nhận dở sẽ được nhận lại sau claim_timeout
+                    self.app.logger.exception('Luồng gửi thông báo gặp lỗi, sẽ thử lại')
+        finally:
+            # Luồng có dừng vì lý do nào khác thì request kế tiếp sẽ khởi động lại
+            with self._thread_lock:
+                self._thread = None
+
+    def _maybe_compact(self):
+        # Mỗi tiến trình có luồng nền đều có thể chạy job này; chạy trùng cũng không sao
+        # vì các lô chỉ xóa những dòng còn tồn tại
+        config = self.app.config
+        interval = config['NOTIFICATION_COMPACT_INTERVAL']
+        if not interval or config['NOTIFICATION_RETENTION_DAYS'] is None:
+            return
+        now = time.monotonic()
+        if self._last_compaction is not None and now - self._last_compaction < interval:
+            return
+        self._last_compaction = now
+        with self.app.app_context():
+            try:
+                removed = compact_notifications(config['NOTIFICATION_RETENTION_DAYS'],
+                                                archive=config['NOTIFICATION_RETENTION_MODE'] == 'archive',
+                                                batch_size=config['NOTIFICATION_COMPACT_BATCH_SIZE'])
+                if removed:
+                    self.app.logger.info('Đã dọn %d thông báo cũ', removed)
+            except Exception:
+                db.session.rollback()
+                self.app.logger.exception('Dọn thông báo cũ thất bại')
+
+    def drain_once(self):
+        """Giao một lô từ outbox; trả về True nếu có thể còn lô tiếp theo."""
+        batch_size = self.app.config['NOTIFICATION_BATCH_SIZE']
+        ids, payloads = self.outbox.claim(self._worker_id, batch_size)
+        if not ids:
+            return False
+        with self.app.app_context():
+            # Dựng link tuyệt đối theo host của request gốc, mỗi host một request context giả
+            for base_url in {p.get('base_url') for p in payloads}:
+                with self.app.test_request_context(base_url=base_url):
+                    for p in payloads:
+                        if p.get('base_url') == base_url:
+                            try:
+                                p['link'] = self._build_link(p)
+                            except Exception:
+                                # Route đã đổi/bị xóa: vẫn giao thông báo, chỉ không có link
+                                self.app.logger.exception('Không dựng được link cho thông báo %s', p['type'])
+                                p['link'] = None
+            if self._deliver(payloads):
+                self.outbox.ack(ids)
+            else:
+                # Lô lỗi: giao lại từng thông báo để một dòng hỏng không chặn cả hàng đợi
+                for outbox_id, payload in zip(ids, payloads):
+                    if self._deliver([payload]):
+                        self.outbox.ack([outbox_id])
+                    else:
+                        self.outbox.release([outbox_id], failed=True)
+        return len(ids) == batch_size
+
+    def _deliver(self, payloads):
+        try:
+            deliver_notifications(payloads)
+            db.session.commit()
+            return True
+        except Exception:
+            db.session.rollback()
+            self.app.logger.exception('Không giao được %d thông báo', len(payloads))
+            return False
+
+
+notification_dispatcher = NotificationDispatcher()
+
+
+@event.listens_for(Session, 'after_commit')
+def _after_commit(session):
+    if _PENDING_KEY in session.info:
+        notification_dispatcher._flush_committed(session)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _after_rollback(session):
+    session.info.pop(_PENDING_KEY, None)
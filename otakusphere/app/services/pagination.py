@@ -0,0 +1,97 @@
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import tuple_
+
+# Phân trang keyset (cursor) dùng chung. Thay vì OFFSET + COUNT(*), mỗi trang lọc theo
+# giá trị khóa sắp xếp của bản ghi cuối trang trước, ví dụ (created_at, id), nên chi phí
+# mỗi trang là như nhau dù sâu tới đâu, miễn là có index trên đúng các cột đó.
+# Token gửi cho client là base64 của [hướng, giá trị khóa], không lộ cấu trúc truy vấn.
+
+
+class KeysetPagination:
+    """Thông tin điều hướng của một trang keyset: token opaque cho trang trước/sau."""
+
+    def __init__(self, next_cursor=None, prev_cursor=None):
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        return datetime.fromisoformat(value['dt'])
+    return value
+
+
+def encode_cursor(item, direction, key=None):
+    """Token cho `item`; mặc định khóa là (created_at, id)."""
+    values = key(item) if key else (item.created_at, item.id)
+    payload = json.dumps([direction, [_encode_value(v) for v in values]], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Giải mã token thành (direction, tuple giá trị khóa); token hỏng trả về None."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        direction, values = json.loads(base64.urlsafe_b64decode(padded))
+        if direction not in ('next', 'prev') or not isinstance(values, list):
+            return None
+        return direction, tuple(_decode_value(v) for v in values)
+    except (ValueError, TypeError, KeyError):
+        return None
+
+
+def keyset_paginate(query, columns, cursor, per_page, descending=True, key=None):
+    """Lấy một trang của `query` (chưa order_by) theo các cột khóa `columns`.
+
+    Cột cuối trong `columns` phải là duy nhất (thường là id) để thứ tự ổn định.
+    `key(item)` trả về giá trị khóa của một item (mặc định (created_at, id)).
+    Trả về (danh sách item, KeysetPagination); token hỏng được coi như trang đầu.
+    """
+    decoded = decode_cursor(cursor) if cursor else None
+    if decoded is not None and len(decoded[1]) != len(columns):
+        decoded = None
+    direction = decoded[0] if decoded else 'next'
+    row_key = tuple_(*columns)
+
+    # Đi lùi (prev) thì đảo chiều sắp xếp rồi đảo lại danh sách kết quả
+    forward = direction == 'next'
+    newest_first = descending == forward
+    if decoded is not None:
+        bound = tuple_(*decoded[1])
+        query = query.filter(row_key < bound if newest_first else row_key > bound)
+    query = query.order_by(*[c.desc() if newest_first else c.asc() for c in columns])
+
+    # Lấy dư một bản ghi để biết còn trang tiếp theo theo hướng đang đi hay không
+    items = query.limit(per_page + 1).all()
+    has_more = len(items) > per_page
+    items = items[:per_page]
+    if not forward:
+        items.reverse()
+
+    next_cursor = prev_cursor = None
+    if items:
+        if forward:
+            has_next, has_prev = has_more, decoded is not None
+        else:
+            has_next, has_prev = True, has_more
+        if has_next:
+            next_cursor = encode_cursor(items[-1], 'next', key)
+        if has_prev:
+            prev_cursor = encode_cursor(items[0], 'prev', key)
+    return items, KeysetPagination(next_cursor, prev_cursor)
@@ -0,0 +1,297 @@
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+from flask import current_app
+from sqlalchemy import event, inspect, select, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from app import db
+from app.models import Post, Comment
+
+# Tìm kiếm toàn văn trên Post.title, Post.content và Comment.content.
+#
+# Hai backend cùng giao diện:
+#   - Fts5Backend: bảng ảo FTS5 `search_index` của SQLite (mặc định khi dùng sqlite://),
+#     cập nhật trong cùng transaction với thao tác ghi bài viết/bình luận. Bảng được tạo (và
+#     nạp dữ liệu có sẵn) trong init_app trên một kết nối riêng, không đụng tới session của
+#     request; SQLite không có FTS5 thì dùng MemoryBackend.
+#   - MemoryBackend: chỉ mục đảo ngược thuần Python cho các DB khác (MySQL...). Chỉ mục
+#     nằm trong bộ nhớ của từng tiến trình, được dựng lại ở lần tìm kiếm đầu tiên và chỉ
+#     được cập nhật sau khi transaction ghi commit (rollback thì bỏ). Mỗi tiến trình chỉ
+#     thấy thay đổi do chính nó ghi, nên backend này chỉ đúng khi chạy MỘT worker; nhiều
+#     worker thì dùng FTS5 hoặc chạy lại rebuild-search-index định kỳ.
+#
+# Cả hai đều xếp hạng bằng BM25 (tiêu đề có trọng số cao hơn nội dung) và tách từ
+# không phân biệt dấu tiếng Việt: "Tình yêu", "tinh yeu", "TÌNH YÊU" là như nhau.
+
+TITLE_WEIGHT = 3.0
+BODY_WEIGHT = 1.0
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+_PENDING_KEY = 'search_index_pending'
+
+
+def normalize_text(value):
+    """Chữ thường, bỏ dấu (kể cả đ -> d) để so khớp không phân biệt dấu."""
+    if not value:
+        return ''
+    value = unicodedata.normalize('NFD', value.lower()).replace('đ', 'd')
+    return ''.join(ch for ch in value if unicodedata.category(ch) != 'Mn')
+
+
+def tokenize(value):
+    return _TOKEN_RE.findall(normalize_text(value))
+
+
+class Fts5Backend:
+    """Chỉ mục FTS5 lưu văn bản đã chuẩn hóa; post_id dùng để gom kết quả bình luận về bài."""
+
+    name = 'fts5'
+    transactional = True  # ghi trong transaction của request
+
+    def ensure_schema(self, connection, batch_size=1000):
+        """Tạo bảng ảo và nạp dữ liệu có sẵn nếu chưa có; OperationalError nếu SQLite thiếu FTS5."""
+        exists = connection.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'search_index'")).first()
+        if exists:
+            return
+        connection.execute(text(
+            "CREATE VIRTUAL TABLE search_index USING fts5("
+            "doc_type UNINDEXED, doc_id UNINDEXED, post_id UNINDEXED, title, body, "
+            "tokenize = 'unicode61 remove_diacritics 2')"
+        ))
+        if inspect(connection).has_table(Post.__tablename__):
+            self._fill(connection, batch_size)
+
+    def _insert(self, execute, doc_type, doc_id, post_id, title, body):
+        execute(
+            text("INSERT INTO search_index (doc_type, doc_id, post_id, title, body) "
+                 "VALUES (:doc_type, :doc_id, :post_id, :title, :body)"),
+            dict(doc_type=doc_type, doc_id=doc_id, post_id=post_id,
+                 title=normalize_text(title), body=normalize_text(body)))
+
+    def _fill(self, connection, batch_size):
+        for document in _iter_documents(connection.execute, batch_size):
+            self._insert(connection.execute, *document)
+
+    def add_document(self, doc_type, doc_id, post_id, title, body):
+        self.remove_document(doc_type, doc_id)
+        self._insert(db.session.execute, doc_type, doc_id, post_id, title, body)
+
+    def remove_document(self, doc_type, doc_id):
+        db.session.execute(text("DELETE FROM search_index WHERE doc_type = :doc_type AND doc_id = :doc_id"),
+                           dict(doc_type=doc_type, doc_id=doc_id))
+
+    def remove_post(self, post_id):
+        db.session.execute(text("DELETE FROM search_index WHERE post_id = :post_id"), dict(post_id=post_id))
+
+    def search(self, tokens, limit, offset=0):
+        # Mỗi token được đặt trong ngoặc kép (không bị hiểu là cú pháp FTS), nối bằng AND ngầm định
+        match = ' '.join(f'"{token}"' for token in tokens)
+        # bm25() không dùng được trong hàm gộp, nên subquery có LIMIT -1 để SQLite
+        # không "làm phẳng" nó vào câu GROUP BY bên ngoài
+        rows = db.session.execute(text(
+            "SELECT post_id, MIN(score) AS best FROM ("
+            "  SELECT post_id, bm25(search_index, 0, 0, 0, :title_weight, :body_weight) AS score"
+            "  FROM search_index WHERE search_index MATCH :match LIMIT -1"
+            ") GROUP BY post_id ORDER BY best, post_id DESC LIMIT :limit OFFSET :offset"
+        ), dict(match=match, limit=limit, offset=offset,
+                title_weight=TITLE_WEIGHT, body_weight=BODY_WEIGHT)).all()
+        # bm25() của FTS5 trả về số âm (càng nhỏ càng liên quan), đổi dấu cho dễ đọc
+        return [(post_id, -best) for post_id, best in rows]
+
+    def rebuild(self, batch_size=1000):
+        with db.engine.begin() as connection:
+            self.ensure_schema(connection, batch_size)
+            connection.execute(text("DELETE FROM search_index"))
+            self._fill(connection, batch_size)
+
+
+class MemoryBackend:
+    """Chỉ mục đảo ngược trong bộ nhớ với BM25 tự tính. Thread-safe."""
+
+    name = 'memory'
+    transactional = False  # chỉ cập nhật sau khi commit
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings = defaultdict(dict)  # token -> {doc_key: trọng số tf}
+        self._docs = {}  # doc_key -> (post_id, độ dài có trọng số, Counter token)
+        self._docs_by_post = defaultdict(set)  # post_id -> {doc_key} (bài + các bình luận)
+        self._total_length = 0.0
+        self._built = False
+
+    def _add(self, doc_key, post_id, title, body):
+        self._remove(doc_key)
+        weighted = Counter()
+        for token in tokenize(title):
+            weighted[token] += TITLE_WEIGHT
+        for token in tokenize(body):
+            weighted[token] += BODY_WEIGHT
+        length = sum(weighted.values())
+        for token, tf in weighted.items():
+            self._postings[token][doc_key] = tf
+        self._docs[doc_key] = (post_id, length, weighted)
+        self._docs_by_post[post_id].add(doc_key)
+        self._total_length += length
+
+    def _remove(self, doc_key):
+        doc = self._docs.pop(doc_key, None)
+        if doc is None:
+            return
+        post_id, length, weighted = doc
+        self._docs_by_post[post_id].discard(doc_key)
+        if not self._docs_by_post[post_id]:
+            del self._docs_by_post[post_id]
+        for token in weighted:
+            postings = self._postings.get(token)
+            if postings is not None:
+                postings.pop(doc_key, None)
+                if not postings:
+                    del self._postings[token]
+        self._total_length -= length
+
+    def add_document(self, doc_type, doc_id, post_id, title, body):
+        with self._lock:
+            # Chưa dựng thì bỏ qua: lần dựng đầu tiên đọc thẳng từ DB
+            if self._built:
+                self._add((doc_type, doc_id), post_id, title, body)
+
+    def remove_document(self, doc_type, doc_id):
+        with self._lock:
+            self._remove((doc_type, doc_id))
+
+    def remove_post(self, post_id):
+        with self._lock:
+            for doc_key in list(self._docs_by_post.get(post_id, ())):
+                self._remove(doc_key)
+
+    def search(self, tokens, limit, offset=0):
+        with self._lock:
+            if not self._built:
+                self.rebuild()
+            postings = [self._postings.get(token) for token in tokens]
+            if not postings or any(not p for p in postings):
+                return []
+            n_docs = len(self._docs)
+            avg_length = self._total_length / n_docs if n_docs else 0.0
+            candidates = set.intersection(*(set(p) for p in postings))
+            best = {}
+            for doc_key in candidates:
+                post_id, length, _ = self._docs[doc_key]
+                score = 0.0
+                for token_postings in postings:
+                    tf = token_postings[doc_key]
+                    idf = math.log(1 + (n_docs - len(token_postings) + 0.5) / (len(token_postings) + 0.5))
+                    norm = self.k1 * (1 - self.b + self.b * length / avg_length) if avg_length else self.k1
+                    score += idf * tf * (self.k1 + 1) / (tf + norm)
+                best[post_id] = max(score, best.get(post_id, 0.0))
+        ranked = sorted(best.items(), key=lambda item: (-item[1], -item[0]))
+        return ranked[offset:offset + limit]
+
+    def rebuild(self, batch_size=1000):
+        with self._lock:
+            self._postings.clear()
+            self._docs.clear()
+            self._docs_by_post.clear()
+            self._total_length = 0.0
+            self._built = True
+            for doc_type, doc_id, post_id, title, body in _iter_documents(db.session.execute, batch_size):
+                self._add((doc_type, doc_id), post_id, title, body)
+
+
+def _iter_rows(execute, id_column, columns, batch_size):
+    # Duyệt bảng theo khóa chính tăng dần, mỗi lô một SELECT (không nạp cả bảng một lần)
+    last_id = 0
+    while True:
+        batch = execute(select(id_column, *columns).where(id_column > last_id)
+                        .order_by(id_column).limit(batch_size)).all()
+        if not batch:
+            return
+        yield from batch
+        last_id = batch[-1][0]
+
+
+def _iter_documents(execute, batch_size):
+    """(doc_type, doc_id, post_id, title, body) của mọi bài viết rồi mọi bình luận."""
+    for post_id, title, content in _iter_rows(execute, Post.id, (Post.title, Post.content), batch_size):
+        yield 'post', post_id, post_id, title, content
+    for comment_id, post_id, content in _iter_rows(execute, Comment.id, (Comment.post_id, Comment.content),
+                                                   batch_size):
+        yield 'comment', comment_id, post_id, '', content
+
+
+class SearchIndex:
+    """Điểm truy cập chung cho route; backend được chọn theo SEARCH_BACKEND khi init_app."""
+
+    def init_app(self, app):
+        app.config.setdefault('SEARCH_BACKEND', 'auto')
+        choice = app.config['SEARCH_BACKEND']
+        if choice == 'auto':
+            choice = 'fts5' if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite') else 'memory'
+        backend = Fts5Backend() if choice == 'fts5' else MemoryBackend()
+        if backend.transactional:
+            with app.app_context():
+                engine = db.engine
+            try:
+                with engine.begin() as connection:
+                    backend.ensure_schema(connection)
+            except OperationalError:
+                # SQLite được build không có FTS5: chuyển sang chỉ mục trong bộ nhớ
+                app.logger.warning('SQLite không hỗ trợ FTS5, dùng chỉ mục tìm kiếm trong bộ nhớ')
+                backend = MemoryBackend()
+        app.extensions['search_backend'] = backend
+
+    @property
+    def backend(self):
+        return current_app.extensions['search_backend']
+
+    def _write(self, operation, *args):
+        backend = self.backend
+        if backend.transactional:
+            getattr(backend, operation)(*args)
+        else:
+            # Giữ đến khi transaction của request commit (after_commit không được chạy SQL,
+            # nên chỉ giữ dữ liệu thuần, không giữ đối tượng ORM)
+            db.session().info.setdefault(_PENDING_KEY, []).append((backend, operation, args))
+
+    def index_post(self, post):
+        self._write('add_document', 'post', post.id, post.id, post.title, post.content)
+
+    def index_comment(self, comment):
+        self._write('add_document', 'comment', comment.id, comment.post_id, '', comment.content)
+
+    def remove_post(self, post_id):
+        self._write('remove_post', post_id)
+
+    def remove_comment(self, comment_id):
+        self._write('remove_document', 'comment', comment_id)
+
+    def search(self, query, limit, offset=0):
+        """Trả về [(post_id, điểm)] xếp theo độ liên quan giảm dần."""
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            return []
+        return self.backend.search(tokens, limit, offset)
+
+    def rebuild(self, batch_size=1000):
+        backend = self.backend
+        backend.rebuild(batch_size=batch_size)
+        return backend.name
+
+
+search_index = SearchIndex()
+
+
+@event.listens_for(Session, 'after_commit')
+def _after_commit(session):
+    for backend, operation, args in session.info.pop(_PENDING_KEY, ()):
+        getattr(backend, operation)(*args)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _after_rollback(session):
+    session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,187 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import event, func, update, delete, insert
+from sqlalchemy.orm import Session, object_session
+from app import db
+from app.database import _is_sqlite, _is_memory_sqlite
+from app.models import User, Post, Comment, Genre, PostLike, EntityCount, DailyStat
+
+# Số liệu cho dashboard admin.
+#
+# Tổng số dòng (entity_counts): listener after_insert/after_delete của các model trong
+# COUNTED_MODELS cộng dồn thay đổi của một lần flush vào session.info, rồi after_flush ghi
+# một câu UPDATE value = value + delta cho mỗi bảng, trong cùng transaction (rollback thì
+# bộ đếm cũng không đổi). INSERT/DELETE hàng loạt bằng Core (insert(), Query.delete(),
+# ON DELETE CASCADE của DB) không qua ORM nên không được đếm; job nền đếm lại toàn bảng định
+# kỳ (STATS_RECOUNT_INTERVAL) để sửa sai lệch đó.
+#
+# Số liệu theo ngày (daily_stats): job nền tổng hợp số user/bài/bình luận/like mới theo ngày
+# bằng GROUP BY trên created_at, mỗi lần chỉ tính lại từ ngày gần nhất đã có (ngày đó có thể
+# mới tính dở). Dashboard chỉ đọc hai bảng nhỏ này.
+
+_DELTAS_KEY = 'entity_count_deltas'
+
+COUNTED_MODELS = {'users': User, 'posts': Post, 'comments': Comment, 'genres': Genre, 'likes': PostLike}
+DAILY_METRICS = {
+    'new_users': User.created_at,
+    'new_posts': Post.created_at,
+    'new_comments': Comment.created_at,
+    'new_likes': PostLike.created_at,
+}
+
+
+def refresh_counts():
+    """Đếm lại toàn bộ các bảng trong COUNTED_MODELS (tạo dòng nếu chưa có); trả về dict tên -> số."""
+    now = datetime.utcnow()
+    counts = {}
+    for name, model in COUNTED_MODELS.items():
+        counts[name] = db.session.query(func.count()).select_from(model).scalar()
+        updated = db.session.execute(update(EntityCount).where(EntityCount.name == name)
+                                     .values(value=counts[name], refreshed_at=now))
+        if not updated.rowcount:
+            db.session.add(EntityCount(name=name, value=counts[name], refreshed_at=now))
+    db.session.commit()
+    return counts
+
+
+def entity_counts():
+    """Tổng số dòng hiện tại của mỗi bảng; lần đầu (chưa có dòng nào) thì đếm lại toàn bộ."""
+    counts = {row.name: row.value for row in EntityCount.query.all()}
+    if set(COUNTED_MODELS) - set(counts):
+        counts = refresh_counts()
+    return counts
+
+
+def roll_up_daily_stats(backfill_days=90, today=None):
+    """Tính lại daily_stats từ ngày gần nhất đã có (hoặc backfill_days ngày trước) tới hôm nay."""
+    today = today or datetime.utcnow().date()
+    last_day = db.session.query(func.max(DailyStat.day)).scalar()
+    start = last_day or today - timedelta(days=backfill_days)
+    since = datetime.combine(start, datetime.min.time())
+    now = datetime.utcnow()
+    rows = []
+    for metric, column in DAILY_METRICS.items():
+        day = func.date(column)
+        counts = dict(db.session.query(day, func.count()).filter(column >= since).group_by(day).all())
+        current = start
+        while current <= today:
+            # func.date trả về chuỗi 'YYYY-MM-DD' trên SQLite, date trên MySQL/PostgreSQL
+            value = counts.get(current, counts.get(current.isoformat(), 0))
+            rows.append(dict(day=current, metric=metric, value=value, computed_at=now))
+            current += timedelta(days=1)
+    db.session.execute(delete(DailyStat).where(DailyStat.day >= start))
+    db.session.execute(insert(DailyStat), rows)
+    db.session.commit()
+    return len(rows)
+
+
+def daily_trends(days):
+    """Số liệu days ngày gần nhất: (danh sách ngày mới nhất trước, {ngày: {metric: value}}, lúc tính)."""
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    by_day = {}
+    computed_at = None
+    for row in DailyStat.query.filter(DailyStat.day >= since).all():
+        by_day.setdefault(row.day, {})[row.metric] = row.value
+        computed_at = max(computed_at or row.computed_at, row.computed_at)
+    return sorted(by_day, reverse=True), by_day, computed_at
+
+
+def period_totals(by_day, days, today=None):
+    """Tổng của days ngày gần nhất so với days ngày trước đó, theo từng metric."""
+    today = today or datetime.utcnow().date()
+    totals = {}
+    for metric in DAILY_METRICS:
+        current = sum(by_day.get(today - timedelta(days=i), {}).get(metric, 0) for i in range(days))
+        previous = sum(by_day.get(today - timedelta(days=i), {}).get(metric, 0) for i in range(days, days * 2))
+        change = (current - previous) / previous * 100 if previous else None
+        totals[metric] = dict(current=current, previous=previous, change=change)
+    return totals
+
+
+class StatsCollector:
+    """Job nền tổng hợp daily_stats và đếm lại entity_counts định kỳ."""
+
+    def __init__(self):
+        self.app = None
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._last_recount = None
+
+    def init_app(self, app):
+        app.config.setdefault('STATS_ROLLUP_INTERVAL', 3600)
+        app.config.setdefault('STATS_RECOUNT_INTERVAL', 24 * 3600)
+        app.config.setdefault('STATS_BACKFILL_DAYS', 90)
+        app.config.setdefault('STATS_TREND_DAYS', 30)
+        self.app = app
+        app.extensions['stats_collector'] = self
+        if not app.config['STATS_ROLLUP_INTERVAL']:
+            return
+        uri = app.config['SQLALCHEMY_DATABASE_URI']
+        if _is_sqlite(uri) and _is_memory_sqlite(uri):
+            # sqlite:// dùng chung một kết nối cho mọi luồng: job nền chạy song song với request
+            # sẽ làm hỏng transaction của nhau, nên chỉ chạy qua `flask rollup-stats`
+            return
+
+        @app.before_request
+        def _start_stats_collector():
+            # Như luồng gửi thông báo: chỉ khởi động khi app thực sự phục vụ request
+            if self._thread is None:
+                self.start()
+
+    def start(self):
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='stats-collector', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self.run_once()
+            time.sleep(self.app.config['STATS_ROLLUP_INTERVAL'])
+
+    def run_once(self):
+        config = self.app.config
+        with self.app.app_context():
+            try:
+                roll_up_daily_stats(backfill_days=config['STATS_BACKFILL_DAYS'])
+                now = time.monotonic()
+                if self._last_recount is None or now - self._last_recount >= config['STATS_RECOUNT_INTERVAL']:
+                    self._last_recount = now
+                    refresh_counts()
+            except Exception:
+                db.session.rollback()
+                self.app.logger.exception('Tổng hợp số liệu dashboard thất bại')
+
+
+stats_collector = StatsCollector()
+
+
+def _track(name, delta):
+    def listener(mapper, connection, target):
+        session = object_session(target)
+        if session is not None:
+            deltas = session.info.setdefault(_DELTAS_KEY, {})
+            deltas[name] = deltas.get(name, 0) + delta
+    return listener
+
+
+for _name, _model in COUNTED_MODELS.items():
+    event.listen(_model, 'after_insert', _track(_name, 1))
+    event.listen(_model, 'after_delete', _track(_name, -1))
+
+
+@event.listens_for(Session, 'after_flush')
+def _apply_deltas(session, flush_context):
+    deltas = session.info.pop(_DELTAS_KEY, None)
+    if not deltas:
+        return
+    for name, delta in deltas.items():
+        if delta:
+            session.execute(update(EntityCount).where(EntityCount.name == name)
+                            .values(value=EntityCount.value + delta))
+
+
+@event.listens_for(Session, 'after_rollback')
+def _after_rollback(session):
+    session.info.pop(_DELTAS_KEY, None)
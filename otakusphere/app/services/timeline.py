@@ -0,0 +1,149 @@
+import random
+from flask import current_app
+from sqlalchemy import tuple_, or_, and_, insert, select, literal, exists
+from app import db
+from app.models import User, Post, FeedEntry
+from app.services.feed import FeedPage, load_feed
+from app.services.pagination import KeysetPagination, encode_cursor, decode_cursor
+from app.services.friendships import friendship_graph
+
+# Bảng tin "bài viết của bạn bè" theo mô hình fan-out khi ghi:
+#   - create_post chép (post_id, created_at) vào feed_entries của từng người bạn,
+#   - đọc bảng tin chỉ là một truy vấn keyset trên feed_entries của chính mình.
+# Tác giả có quá nhiều bạn (friend_count > TIMELINE_FANOUT_THRESHOLD) thì không fan-out;
+# bài của họ được lấy lúc đọc (fan-out khi đọc) và trộn với feed_entries.
+# Bảng tin của mỗi người được cắt về TIMELINE_MAX_LENGTH mục.
+# Tác giả về lại ngưỡng (hủy kết bạn, đếm lại friend_count) thì bài của họ không còn được
+# lấy lúc đọc, nên các bài gần nhất được chép vào bảng tin bạn bè (backfill_author).
+
+
+def _is_high_fanout(user):
+    return (user.friend_count or 0) > current_app.config['TIMELINE_FANOUT_THRESHOLD']
+
+
+def fan_out_post(post, author):
+    """Ghi bài mới vào bảng tin bạn bè của tác giả (gọi trước commit, sau flush)."""
+    if _is_high_fanout(author):
+        return 0
+    recipients = friendship_graph.friend_ids(author.id)
+    if not recipients:
+        return 0
+    db.session.execute(insert(FeedEntry), [
+        dict(user_id=user_id, post_id=post.id, author_id=author.id, created_at=post.created_at)
+        for user_id in recipients
+    ])
+    # Cắt bớt theo xác suất: mỗi lần fan-out chỉ thêm 1 mục cho mỗi người nhận, nên bảng tin
+    # chỉ vượt giới hạn trung bình khoảng 1/TIMELINE_TRIM_PROBABILITY mục trước khi bị cắt
+    probability = current_app.config['TIMELINE_TRIM_PROBABILITY']
+    for user_id in recipients:
+        if random.random() < probability:
+            trim_timeline(user_id)
+    return len(recipients)
+
+
+def trim_timeline(user_id):
+    """Xóa các mục cũ hơn mục thứ TIMELINE_MAX_LENGTH trong bảng tin của user."""
+    cutoff = db.session.query(FeedEntry.created_at, FeedEntry.post_id) \
+        .filter(FeedEntry.user_id == user_id) \
+        .order_by(FeedEntry.created_at.desc(), FeedEntry.post_id.desc()) \
+        .offset(current_app.config['TIMELINE_MAX_LENGTH'] - 1).limit(1).first()
+    if cutoff is None:
+        return 0
+    return FeedEntry.query.filter(
+        FeedEntry.user_id == user_id,
+        tuple_(FeedEntry.created_at, FeedEntry.post_id) < tuple_(cutoff.created_at, cutoff.post_id)
+    ).delete(synchronize_session=False)
+
+
+def backfill_friendship(user_a, user_b):
+    """Chép các bài gần nhất của mỗi bên vào bảng tin của bên kia khi vừa kết bạn."""
+    limit = current_app.config['TIMELINE_BACKFILL']
+    for owner, author in ((user_a, user_b), (user_b, user_a)):
+        if _is_high_fanout(author):
+            continue  # bài của tác giả này được lấy lúc đọc
+        already_there = exists().where(FeedEntry.user_id == owner.id, FeedEntry.post_id == Post.id)
+        recent = select(literal(owner.id), Post.id, Post.author_id, Post.created_at) \
+            .where(Post.author_id == author.id, ~already_there) \
+            .order_by(Post.created_at.desc(), Post.id.desc()).limit(limit)
+        db.session.execute(insert(FeedEntry).from_select(
+            ['user_id', 'post_id', 'author_id', 'created_at'], recent))
+
+
+def backfill_author(author_id, exclude=()):
+    """Chép các bài gần nhất của tác giả vào bảng tin của mọi người bạn (trừ exclude).
+
+    Dùng khi tác giả vừa chuyển từ fan-out khi đọc về fan-out khi ghi: bài cũ của họ chưa
+    từng được chép vào bảng tin nào và từ nay cũng không còn được lấy lúc đọc.
+    """
+    recipients = friendship_graph.friend_ids(author_id) - set(exclude)
+    if not recipients:
+        return 0
+    recent = db.session.query(Post.id, Post.created_at).filter(Post.author_id == author_id) \
+        .order_by(Post.created_at.desc(), Post.id.desc()) \
+        .limit(current_app.config['TIMELINE_BACKFILL']).all()
+    if not recent:
+        return 0
+    existing = set(db.session.query(FeedEntry.user_id, FeedEntry.post_id).filter(
+        FeedEntry.post_id.in_([post_id for post_id, _ in recent]), FeedEntry.user_id.in_(recipients)))
+    rows = [dict(user_id=user_id, post_id=post_id, author_id=author_id, created_at=created_at)
+            for user_id in recipients for post_id, created_at in recent
+            if (user_id, post_id) not in existing]
+    if rows:
+        db.session.execute(insert(FeedEntry), rows)
+    return len(rows)
+
+
+def purge_friendship(user_a, user_b):
+    """Xóa bài của mỗi bên khỏi bảng tin của bên kia khi hủy kết bạn (gọi sau User.unfriend)."""
+    FeedEntry.query.filter(or_(
+        and_(FeedEntry.user_id == user_a.id, FeedEntry.author_id == user_b.id),
+        and_(FeedEntry.user_id == user_b.id, FeedEntry.author_id == user_a.id),
+    )).delete(synchronize_session=False)
+    # friend_count đã được giảm trong session: bên nào vừa về đúng ngưỡng thì trước đó
+    # đang được lấy lúc đọc, bài của họ chưa có trong bảng tin của những người bạn còn lại
+    threshold = current_app.config['TIMELINE_FANOUT_THRESHOLD']
+    for user, other in ((user_a, user_b), (user_b, user_a)):
+        if user.friend_count == threshold:
+            backfill_author(user.id, exclude=(other.id,))
+
+
+def remove_post(post_id):
+    FeedEntry.query.filter_by(post_id=post_id).delete(synchronize_session=False)
+
+
+def read_timeline(user_id, cursor, per_page):
+    """Một trang bảng tin bạn bè (mới nhất trước), phân trang keyset chỉ theo chiều tiến."""
+    decoded = decode_cursor(cursor) if cursor else None
+    if decoded is not None and decoded[0] != 'next':
+        decoded = None
+
+    # Fan-out khi ghi: các mục đã vật chất hóa
+    entries = db.session.query(FeedEntry.created_at, FeedEntry.post_id).filter(FeedEntry.user_id == user_id)
+    if decoded is not None:
+        entries = entries.filter(tuple_(FeedEntry.created_at, FeedEntry.post_id) < tuple_(*decoded[1]))
+    candidates = entries.order_by(FeedEntry.created_at.desc(), FeedEntry.post_id.desc()) \
+                        .limit(per_page + 1).all()
+
+    # Fan-out khi đọc: bài của những người bạn vượt ngưỡng fan-out
+    friend_ids = friendship_graph.friend_ids(user_id)
+    if friend_ids:
+        threshold = current_app.config['TIMELINE_FANOUT_THRESHOLD']
+        high_fanout_ids = [row[0] for row in db.session.query(User.id).filter(
+            User.id.in_(friend_ids), User.friend_count > threshold)]
+        if high_fanout_ids:
+            pulled = db.session.query(Post.created_at, Post.id).filter(Post.author_id.in_(high_fanout_ids))
+            if decoded is not None:
+                pulled = pulled.filter(tuple_(Post.created_at, Post.id) < tuple_(*decoded[1]))
+            candidates += pulled.order_by(Post.created_at.desc(), Post.id.desc()).limit(per_page + 1).all()
+
+    ordered = sorted({post_id: created_at for created_at, post_id in candidates}.items(),
+                     key=lambda item: (item[1], item[0]), reverse=True)
+    has_next = len(ordered) > per_page
+    post_ids = [post_id for post_id, _ in ordered[:per_page]]
+
+    posts = []
+    if post_ids:
+        by_id = {post.id: post for post in load_feed(Post.query.filter(Post.id.in_(post_ids)))}
+        posts = [by_id[post_id] for post_id in post_ids if post_id in by_id]
+    next_cursor = encode_cursor(posts[-1], 'next') if has_next and posts else None
+    return FeedPage(posts, pagination=KeysetPagination(next_cursor=next_cursor))
@@ -7,6 +7,63 @@ load_dotenv(os.path.join(basedir, '.env'))
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'you-will-never-guess'
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
-        'sqlite:///' + os.path.join(basedir, 'app.db') # Fallback to SQLite if DATABASE_URL not set
+        'sqlite:///app.db' # Fallback to SQLite if DATABASE_URL not set (file nằm trong thư mục instance/)
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    POSTS_PER_PAGE = 10
\ No newline at end of file
+    # Profile engine (app/database.py): 'tuned' (WAL, PRAGMA, pool) hoặc 'none'
+    DATABASE_PROFILE = os.environ.get('DATABASE_PROFILE') or 'tuned'
+    SQLITE_PRAGMAS = {} # ghi đè từng PRAGMA của profile, ví dụ {'synchronous': 'FULL'}
+    # Replica chỉ đọc, ngăn cách bằng dấu phẩy (ví dụ 'sqlite:///replica.db'); rỗng = chỉ dùng primary
+    DATABASE_REPLICA_URIS = [uri.strip() for uri in (os.environ.get('DATABASE_REPLICA_URIS') or '').split(',') if uri.strip()]
+    DATABASE_REPLICA_STICKY_SECONDS = 5 # đọc từ primary trong khoảng này sau khi client vừa ghi
+    POSTS_PER_PAGE = 10
+    COMMENTS_PER_PAGE = 20
+    ADMIN_ITEMS_PER_PAGE = 50 # số dòng mỗi trang của danh sách user/bài viết trong trang admin
+    # Thuật toán băm mật khẩu theo cú pháp Werkzeug, ví dụ 'scrypt:16384:8:1' hoặc 'pbkdf2:sha256:260000'.
+    # Đổi giá trị này thì mật khẩu cũ vẫn đăng nhập được và được băm lại ở lần đăng nhập kế tiếp.
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD') or 'scrypt:32768:8:1'
+    # Cache trong tiến trình (app/cache.py): 'lru' hoặc 'null' để tắt
+    CACHE_BACKEND = os.environ.get('CACHE_BACKEND') or 'lru'
+    CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES') or 1024)
+    CACHE_DEFAULT_TTL = int(os.environ.get('CACHE_DEFAULT_TTL') or 300) # giây
+    # Thời gian cache danh tính đăng nhập dùng cho load_user (giây)
+    USER_IDENTITY_TTL = int(os.environ.get('USER_IDENTITY_TTL') or 30)
+    # Backend tìm kiếm (app/services/search.py): 'auto' (FTS5 nếu dùng SQLite), 'fts5' hoặc 'memory'
+    SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND') or 'auto'
+    SEARCH_RESULTS_PER_PAGE = 10
+    # Bảng tin bạn bè (app/services/timeline.py)
+    TIMELINE_FANOUT_THRESHOLD = 1000 # Tác giả có nhiều bạn hơn ngưỡng này: fan-out khi đọc thay vì khi ghi
+    TIMELINE_MAX_LENGTH = 800 # Số mục tối đa giữ lại trong bảng tin của mỗi user
+    TIMELINE_TRIM_PROBABILITY = 0.05 # Xác suất cắt bớt bảng tin của người nhận sau mỗi lần fan-out
+    TIMELINE_BACKFILL = 50 # Số bài gần nhất được chép vào bảng tin khi vừa kết bạn
+    # Gửi thông báo (app/services/notifications.py): 'async' qua outbox + luồng nền, hoặc 'sync'
+    NOTIFICATION_DISPATCH = os.environ.get('NOTIFICATION_DISPATCH') or 'async'
+    NOTIFICATION_OUTBOX_PATH = os.environ.get('NOTIFICATION_OUTBOX_PATH') # mặc định instance/notification_outbox.db
+    NOTIFICATION_BATCH_SIZE = 200
+    NOTIFICATION_FLUSH_INTERVAL = 0.5 # giây chờ để gom thông báo vào cùng một lô
+    NOTIFICATIONS_PER_PAGE = 20
+    # Dọn thông báo đã đọc cũ: 'delete' hoặc 'archive' (chuyển sang bảng notifications_archive)
+    NOTIFICATION_RETENTION_DAYS = int(os.environ.get('NOTIFICATION_RETENTION_DAYS') or 90)
+    NOTIFICATION_RETENTION_MODE = os.environ.get('NOTIFICATION_RETENTION_MODE') or 'delete'
+    NOTIFICATION_COMPACT_INTERVAL = 3600 # giây giữa hai lần dọn trong luồng nền; 0 để tắt
+    NOTIFICATION_COMPACT_BATCH_SIZE = 1000
+    # Luồng SSE /notifications/stream (app/services/events.py)
+    SSE_MAX_STREAMS = 100 # số kết nối đồng thời tối đa trên mỗi tiến trình worker
+    SSE_QUEUE_SIZE = 50 # số sự kiện chờ tối đa của một kết nối trước khi bị ngắt
+    SSE_HEARTBEAT_INTERVAL = 15 # giây
+    # Media bài viết (app/services/media.py)
+    MEDIA_ROOT = os.environ.get('MEDIA_ROOT') # mặc định instance/media
+    MEDIA_MAX_IMAGE_SIZE = 10 * 1024 * 1024 # byte
+    MEDIA_MAX_VIDEO_SIZE = 200 * 1024 * 1024 # byte
+    MAX_CONTENT_LENGTH = MEDIA_MAX_VIDEO_SIZE + MEDIA_MAX_IMAGE_SIZE + 1024 * 1024 # cả request: media + phần form còn lại
+    MEDIA_THUMBNAIL_SIZE = (320, 320)
+    MEDIA_THUMBNAIL_WORKERS = 2 # số luồng tạo ảnh thu nhỏ
+    # Đo hiệu năng theo request (app/instrumentation.py), xem tại /admin/performance
+    INSTRUMENTATION_ENABLED = (os.environ.get('INSTRUMENTATION_ENABLED') or '1') != '0'
+    INSTRUMENTATION_PROFILE_RATE = float(os.environ.get('INSTRUMENTATION_PROFILE_RATE') or 0) # tỉ lệ request chạy dưới cProfile, 0 để tắt
+    INSTRUMENTATION_PROFILE_KEEP = 20 # số profile gần nhất được giữ lại
+    INSTRUMENTATION_N_PLUS_ONE_THRESHOLD = 5 # một câu SELECT lặp lại từng này lần trong một request bị coi là N+1
+    # Số liệu dashboard admin (app/services/stats.py)
+    STATS_ROLLUP_INTERVAL = 3600 # giây giữa hai lần tổng hợp số liệu theo ngày; 0 để tắt luồng nền
+    STATS_RECOUNT_INTERVAL = 24 * 3600 # giây giữa hai lần đếm lại toàn bảng để sửa sai lệch bộ đếm
+    STATS_BACKFILL_DAYS = 90 # số ngày tổng hợp ở lần chạy đầu tiên
+    STATS_TREND_DAYS = 30 # số ngày hiển thị trên dashboard
@@ -0,0 +1,66 @@
+"""counter columns
+
+Cột bộ đếm phi chuẩn hóa: posts.like_count/comment_count, users.unread_notifications/
+friend_count và notifications.actor_count. Giá trị được tính luôn từ dữ liệu hiện có
+(giống các lệnh `flask recount-*`, nhưng trong một câu UPDATE mỗi bảng).
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 17:10:12.402715
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('like_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('comment_count', sa.Integer(), server_default='0', nullable=False))
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('unread_notifications', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('friend_count', sa.Integer(), server_default='0', nullable=False))
+
+    # Mỗi thông báo cũ chỉ có một người thực hiện, server_default '1' là đúng
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('actor_count', sa.Integer(), server_default='1', nullable=False))
+
+    posts = sa.table('posts', sa.column('id'), sa.column('like_count'), sa.column('comment_count'))
+    post_likes = sa.table('post_likes', sa.column('post_id'))
+    comments = sa.table('comments', sa.column('post_id'))
+    op.execute(posts.update().values(
+        like_count=sa.select(sa.func.count()).where(post_likes.c.post_id == posts.c.id).scalar_subquery(),
+        comment_count=sa.select(sa.func.count()).where(comments.c.post_id == posts.c.id).scalar_subquery(),
+    ))
+
+    users = sa.table('users', sa.column('id'), sa.column('unread_notifications'), sa.column('friend_count'))
+    notifications = sa.table('notifications', sa.column('user_id'), sa.column('is_read'))
+    friendships = sa.table('friendships', sa.column('user_id'), sa.column('friend_id'), sa.column('status'))
+    op.execute(users.update().values(
+        unread_notifications=sa.select(sa.func.count()).where(
+            notifications.c.user_id == users.c.id, notifications.c.is_read == sa.false()).scalar_subquery(),
+        friend_count=sa.select(sa.func.count()).where(
+            friendships.c.status == 'accepted',
+            sa.or_(friendships.c.user_id == users.c.id, friendships.c.friend_id == users.c.id)).scalar_subquery(),
+    ))
+
+
+def downgrade():
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        batch_op.drop_column('actor_count')
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_column('friend_count')
+        batch_op.drop_column('unread_notifications')
+
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.drop_column('comment_count')
+        batch_op.drop_column('like_count')
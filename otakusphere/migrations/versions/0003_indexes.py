@@ -0,0 +1,75 @@
+"""indexes
+
+Index cho khóa ngoại và các truy vấn nóng (phân trang keyset, đếm chưa đọc, dọn thông báo)
+trên các bảng có từ đầu; kiểm tra bằng `flask audit-queries`.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 17:18:40.118523
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('comments', schema=None) as batch_op:
+        batch_op.create_index('ix_comments_author_id', ['author_id'], unique=False)
+        batch_op.create_index('ix_comments_post_id_created_at_id', ['post_id', 'created_at', 'id'], unique=False)
+
+    with op.batch_alter_table('friendships', schema=None) as batch_op:
+        batch_op.create_index('ix_friendships_friend_id_status', ['friend_id', 'status'], unique=False)
+
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        batch_op.create_index('ix_notifications_actor_id', ['actor_id'], unique=False)
+        batch_op.create_index('ix_notifications_is_read_created_at', ['is_read', 'created_at'], unique=False)
+        batch_op.create_index('ix_notifications_user_id_created_at_id', ['user_id', 'created_at', 'id'], unique=False)
+        batch_op.create_index('ix_notifications_user_id_is_read_created_at', ['user_id', 'is_read', 'created_at'], unique=False)
+
+    with op.batch_alter_table('post_genres', schema=None) as batch_op:
+        batch_op.create_index('ix_post_genres_genre_id_post_id', ['genre_id', 'post_id'], unique=False)
+
+    with op.batch_alter_table('post_likes', schema=None) as batch_op:
+        batch_op.create_index('ix_post_likes_post_id', ['post_id'], unique=False)
+
+    with op.batch_alter_table('post_media', schema=None) as batch_op:
+        batch_op.create_index('ix_post_media_post_id', ['post_id'], unique=False)
+
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.create_index('ix_posts_author_id_created_at_id', ['author_id', 'created_at', 'id'], unique=False)
+        batch_op.create_index('ix_posts_created_at_id', ['created_at', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.drop_index('ix_posts_created_at_id')
+        batch_op.drop_index('ix_posts_author_id_created_at_id')
+
+    with op.batch_alter_table('post_media', schema=None) as batch_op:
+        batch_op.drop_index('ix_post_media_post_id')
+
+    with op.batch_alter_table('post_likes', schema=None) as batch_op:
+        batch_op.drop_index('ix_post_likes_post_id')
+
+    with op.batch_alter_table('post_genres', schema=None) as batch_op:
+        batch_op.drop_index('ix_post_genres_genre_id_post_id')
+
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        batch_op.drop_index('ix_notifications_user_id_is_read_created_at')
+        batch_op.drop_index('ix_notifications_user_id_created_at_id')
+        batch_op.drop_index('ix_notifications_is_read_created_at')
+        batch_op.drop_index('ix_notifications_actor_id')
+
+    with op.batch_alter_table('friendships', schema=None) as batch_op:
+        batch_op.drop_index('ix_friendships_friend_id_status')
+
+    with op.batch_alter_table('comments', schema=None) as batch_op:
+        batch_op.drop_index('ix_comments_post_id_created_at_id')
+        batch_op.drop_index('ix_comments_author_id')
@@ -0,0 +1,83 @@
+"""timeline, notification archive and stats tables
+
+feed_entries (bảng tin bạn bè), notifications_archive (dọn thông báo ở chế độ archive),
+entity_counts và daily_stats (dashboard admin).
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 17:19:05.730114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('feed_entries',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('post_id', sa.Integer(), nullable=False),
+    sa.Column('author_id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['author_id'], ['users.id'], onupdate='CASCADE', ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['post_id'], ['posts.id'], onupdate='CASCADE', ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], onupdate='CASCADE', ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', 'post_id')
+    )
+    with op.batch_alter_table('feed_entries', schema=None) as batch_op:
+        batch_op.create_index('ix_feed_entries_author_id_user_id', ['author_id', 'user_id'], unique=False)
+        batch_op.create_index('ix_feed_entries_post_id', ['post_id'], unique=False)
+        batch_op.create_index('ix_feed_entries_user_id_created_at_post_id', ['user_id', 'created_at', 'post_id'], unique=False)
+
+    op.create_table('notifications_archive',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('actor_id', sa.Integer(), nullable=True),
+    sa.Column('type', sa.String(length=50), nullable=False),
+    sa.Column('content', sa.String(length=255), nullable=False),
+    sa.Column('link', sa.String(length=255), nullable=True),
+    sa.Column('source_entity_id', sa.Integer(), nullable=True),
+    sa.Column('source_entity_type', sa.String(length=50), nullable=True),
+    sa.Column('actor_count', sa.Integer(), server_default='1', nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('archived_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], onupdate='CASCADE', ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('notifications_archive', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_notifications_archive_user_id'), ['user_id'], unique=False)
+
+    op.create_table('entity_counts',
+    sa.Column('name', sa.String(length=30), nullable=False),
+    sa.Column('value', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('refreshed_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.create_table('daily_stats',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('metric', sa.String(length=30), nullable=False),
+    sa.Column('value', sa.Integer(), nullable=False),
+    sa.Column('computed_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('day', 'metric')
+    )
+
+
+def downgrade():
+    op.drop_table('daily_stats')
+    op.drop_table('entity_counts')
+    with op.batch_alter_table('notifications_archive', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_notifications_archive_user_id'))
+
+    op.drop_table('notifications_archive')
+    with op.batch_alter_table('feed_entries', schema=None) as batch_op:
+        batch_op.drop_index('ix_feed_entries_user_id_created_at_post_id')
+        batch_op.drop_index('ix_feed_entries_post_id')
+        batch_op.drop_index('ix_feed_entries_author_id_user_id')
+
+    op.drop_table('feed_entries')
@@ -0,0 +1,118 @@
+import pytest
+from sqlalchemy import event
+from config import Config
+from app import create_app, db
+from app.models import User, Post, Genre
+
+
+class TestConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    WTF_CSRF_ENABLED = False
+    PASSWORD_HASH_METHOD = 'pbkdf2:sha256:1000' # băm nhanh cho test
+    NOTIFICATION_DISPATCH = 'sync'
+    STATS_ROLLUP_INTERVAL = 0
+    INSTRUMENTATION_ENABLED = False
+
+
+class QueryCounter:
+    """Đếm các câu SQL gửi tới DB (before_cursor_execute) trong khối with."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def __enter__(self):
+        self.statements = []
+        event.listen(self.engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._record)
+
+
+@pytest.fixture
+def app_config():
+    """Ghi đè config cho một test: @pytest.mark.parametrize('app_config', [{...}])."""
+    return {}
+
+
+@pytest.fixture
+def app(tmp_path, app_config):
+    paths = {'MEDIA_ROOT': str(tmp_path / 'media'), 'NOTIFICATION_OUTBOX_PATH': str(tmp_path / 'outbox.db')}
+    app = create_app(type('TestConfig', (TestConfig,), {**paths, **app_config}))
+    with app.app_context():
+        db.create_all()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def count_queries(app):
+    """count_queries() trả về một QueryCounter trên engine chính."""
+    with app.app_context():
+        engine = db.engine
+    return lambda: QueryCounter(engine)
+
+
+@pytest.fixture
+def make_user(app):
+    def make_user(username, password='secret1', role='user'):
+        with app.app_context():
+            user = User(username=username, email=f'{username}@example.com', role=role)
+            user.set_password(password)
+            db.session.add(user)
+            db.session.commit()
+            return user.id
+    return make_user
+
+
+@pytest.fixture
+def make_genre(app):
+    def make_genre(name):
+        with app.app_context():
+            genre = Genre(name=name)
+            db.session.add(genre)
+            db.session.commit()
+            return genre.id
+    return make_genre
+
+
+@pytest.fixture
+def make_posts(app):
+    def make_posts(author_id, count, genre_names=('Shounen',)):
+        with app.app_context():
+            genres = []
+            for name in genre_names:
+                genre = Genre.query.filter_by(name=name).first() or Genre(name=name)
+                genres.append(genre)
+            posts = []
+            for index in range(count):
+                post = Post(title=f'Bài {index}', content='Nội dung', author_id=author_id)
+                post.genres.extend(genres)
+                posts.append(post)
+            db.session.add_all(posts)
+            db.session.commit()
+            return [post.id for post in posts]
+    return make_posts
+
+
+@pytest.fixture
+def login(client):
+    def login(username, password='secret1'):
+        return client.post('/auth/login', data={'username_or_email': username, 'password': password})
+    return login
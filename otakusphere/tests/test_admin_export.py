@@ -0,0 +1,27 @@
+import csv
+import io
+from app import db
+from app.models import Post
+
+
+def _rows(response):
+    return list(csv.reader(io.StringIO(response.get_data(as_text=True).lstrip('﻿'))))
+
+
+def test_csv_export_escapes_formula_cells(app, client, make_user, make_posts, login):
+    make_user('admin', role='admin')
+    author_id = make_user('=HYPERLINK("http://evil")')
+    post_id = make_posts(author_id, 1)[0]
+    with app.app_context():
+        db.session.get(Post, post_id).title = '@SUM(A1:A9)'
+        db.session.commit()
+    login('admin')
+
+    users = {row[0]: row for row in _rows(client.get('/admin/users/export.csv'))[1:]}
+    assert users[str(author_id)][1] == '\'=HYPERLINK("http://evil")'
+    assert users[str(author_id)][2] == '\'=HYPERLINK("http://evil")@example.com'
+    assert [row[1] for row in users.values() if row[0] != str(author_id)] == ['admin']
+
+    posts = _rows(client.get('/admin/posts/export.csv'))
+    assert posts[1][:3] == [str(post_id), "'@SUM(A1:A9)", '\'=HYPERLINK("http://evil")']
+    assert posts[1][4] == '0'
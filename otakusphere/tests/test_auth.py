@@ -0,0 +1,32 @@
+from app import db
+from app.models import User
+
+
+def _password_hash(app, user_id):
+    with app.app_context():
+        return db.session.get(User, user_id).password_hash
+
+
+def test_login_rehashes_once_after_hash_method_changes(app, client, make_user, login):
+    user_id = make_user('fan')
+    assert _password_hash(app, user_id).startswith('pbkdf2:sha256:1000$')
+
+    # Chỉ ghi thuật toán, Werkzeug tự điền số vòng lặp mặc định
+    app.config['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha512'
+    assert login('fan').status_code == 302
+    rehashed = _password_hash(app, user_id)
+    assert rehashed.startswith('pbkdf2:sha512:')
+
+    client.get('/auth/logout')
+    assert login('fan').status_code == 302
+    assert _password_hash(app, user_id) == rehashed
+    with app.app_context():
+        assert db.session.get(User, user_id).check_password('secret1')
+
+
+def test_wrong_password_does_not_rehash(app, make_user, login):
+    user_id = make_user('fan')
+    before = _password_hash(app, user_id)
+    app.config['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:2000'
+    login('fan', password='wrong-password')
+    assert _password_hash(app, user_id) == before
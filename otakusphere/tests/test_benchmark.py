@@ -0,0 +1,19 @@
+from app import benchmark
+
+
+def _run(app, tmp_path, *args):
+    return app.test_cli_runner().invoke(args=[
+        'benchmark-app', '--db', str(tmp_path / 'benchmark.db'), '--scale', '0.0001',
+        '--requests', '5', '--warmup', '0', '--sessions', '1', '--scenario', 'login', *args])
+
+
+def test_benchmark_app_reports_errors_and_fails(app, tmp_path, monkeypatch):
+    result = _run(app, tmp_path)
+    assert result.exit_code == 0, result.output
+    assert '0 lỗi' in result.output
+
+    monkeypatch.setattr(benchmark, '_login', lambda client, user_id: client.post('/auth/khong-co'))
+    result = _run(app, tmp_path)
+    assert result.exit_code == 1
+    assert '5 lỗi (HTTP 404: 5)' in result.output
+    assert '[LỖI] login: 5/5 request lỗi.' in result.output
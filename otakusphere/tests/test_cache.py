@@ -0,0 +1,68 @@
+import importlib
+import types
+import pytest
+from app.cache import AppCache, LRUCacheBackend
+
+# `app.cache` trong package app là đối tượng AppCache, không phải module
+cache_module = importlib.import_module('app.cache')
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Đồng hồ giả cho TTL: clock.now là giá trị time.monotonic() trong app.cache."""
+    fake = types.SimpleNamespace(now=1000.0)
+    fake.monotonic = lambda: fake.now
+    monkeypatch.setattr(cache_module, 'time', fake)
+    return fake
+
+
+def _cache(max_entries=1024, ttl=None):
+    cache = AppCache()
+    cache.backend = LRUCacheBackend(max_entries=max_entries)
+    cache.default_ttl = ttl
+    return cache
+
+
+def test_lru_evicts_least_recently_used():
+    backend = LRUCacheBackend(max_entries=2)
+    backend.set('a', 1)
+    backend.set('b', 2)
+    assert backend.get('a') == 1  # 'a' vừa được dùng, 'b' thành cũ nhất
+    backend.set('c', 3)
+    assert backend.get('b') is cache_module._MISSING
+    assert (backend.get('a'), backend.get('c')) == (1, 3)
+    assert backend.evictions == 1 and len(backend) == 2
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = _cache(ttl=60)
+    cache.set('genres', 'all', ['Shounen'])
+    cache.set('genres', 'forever', 'x', ttl=0)  # ttl 0: không hết hạn
+    clock.now += 59
+    assert cache.get('genres', 'all') == ['Shounen']
+    clock.now += 1
+    assert cache.get('genres', 'all', default='miss') == 'miss'
+    assert cache.get('genres', 'forever') == 'x'
+    assert cache.stats()['expirations'] == 1
+
+
+def test_invalidate_only_drops_its_namespace():
+    cache = _cache()
+    cache.set('genres', 1, 'Shounen')
+    cache.set('identity', 1, 'user')
+    cache.invalidate('genres')
+    assert cache.get('genres', 1) is None
+    assert cache.get('identity', 1) == 'user'
+    # Khóa mới sau khi hủy dùng phiên bản mới
+    assert cache.get_or_set('genres', 1, lambda: 'Seinen') == 'Seinen'
+    assert cache.namespace_version('genres') == 1
+
+
+def test_namespace_version_survives_lru_eviction():
+    cache = _cache(max_entries=1)
+    cache.set('genres', 1, 'old')
+    cache.invalidate('genres')
+    cache.set('identity', 1, 'user')  # đẩy mục cũ ra; phiên bản namespace không bị đẩy theo
+    cache.set('genres', 1, 'new')
+    assert cache.namespace_version('genres') == 1
+    assert cache.get('genres', 1) == 'new'
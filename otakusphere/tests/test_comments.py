@@ -0,0 +1,49 @@
+import re
+from datetime import datetime
+import pytest
+from app import db
+from app.models import Comment
+
+pytestmark = pytest.mark.parametrize('app_config', [{'COMMENTS_PER_PAGE': 2}])
+
+
+def _add_comments(app, post_id, author_id, count):
+    with app.app_context():
+        # Cùng created_at: thứ tự trong trang và giữa các trang dựa vào id
+        comments = [Comment(post_id=post_id, author_id=author_id, content=f'Bình luận {index}',
+                            created_at=datetime(2024, 1, 1)) for index in range(count)]
+        db.session.add_all(comments)
+        db.session.commit()
+
+
+def _contents(html):
+    return re.findall(r'Bình luận \d+', html)
+
+
+def test_load_more_walks_comments_oldest_first(app, client, make_user, make_posts, count_queries):
+    author = make_user('author')
+    post_id = make_posts(author, 1)[0]
+    _add_comments(app, post_id, author, 5)
+
+    html = client.get(f'/post/{post_id}').data.decode()
+    seen = _contents(html)
+    cursor = re.search(r'data-cursor="([\w-]+)"', html).group(1)
+    # Không có JavaScript: link trỏ về view_post với cùng cursor
+    assert f'comments_cursor={cursor}' in html
+    while cursor:
+        with count_queries() as queries:
+            page = client.get(f'/post/{post_id}/comments', query_string={'cursor': cursor}).get_json()
+        assert queries.count == 1
+        seen += _contents(page['html'])
+        cursor = page['next_cursor']
+    assert seen == [f'Bình luận {index}' for index in range(5)]
+
+
+def test_view_post_follows_comments_cursor(app, client, make_user, make_posts):
+    author = make_user('author')
+    post_id = make_posts(author, 1)[0]
+    _add_comments(app, post_id, author, 3)
+    cursor = client.get(f'/post/{post_id}/comments').get_json()['next_cursor']
+    html = client.get(f'/post/{post_id}', query_string={'comments_cursor': cursor}).data.decode()
+    assert _contents(html) == ['Bình luận 2']
+    assert 'load-more-comments' not in html
@@ -0,0 +1,115 @@
+import time
+import types
+import pytest
+from sqlalchemy import text, select, insert, update
+from app import create_app, db, database
+from app.database import engine_options, replica_bind_keys, SERVER_ENGINE_OPTIONS
+from app.models import User, Post
+from tests.conftest import TestConfig
+
+
+@pytest.fixture
+def file_app(tmp_path):
+    """Tạo app trên các file SQLite trong tmp_path: file_app(**config)."""
+    apps = []
+
+    def file_app(**config):
+        config.setdefault('SQLALCHEMY_DATABASE_URI', f'sqlite:///{tmp_path / "app.db"}')
+        config.update(MEDIA_ROOT=str(tmp_path / 'media'), NOTIFICATION_OUTBOX_PATH=str(tmp_path / 'outbox.db'))
+        app = create_app(type('FileConfig', (TestConfig,), config))
+        with app.app_context():
+            db.create_all(bind_key=None)
+        apps.append(app)
+        return app
+
+    yield file_app
+    for app in apps:
+        with app.app_context():
+            db.session.remove()
+            for engine in db.engines.values():
+                engine.dispose()
+        # init_app đăng ký metadata cho mọi bind trên đối tượng db dùng chung; bỏ các bind
+        # replica để create_all() của các app sau không đi tìm engine không tồn tại
+        for key in replica_bind_keys(app):
+            db.metadatas.pop(key, None)
+
+
+def _pragma(name):
+    return db.session.execute(text(f'PRAGMA {name}')).scalar()
+
+
+def test_tuned_profile_sets_sqlite_pragmas(file_app):
+    app = file_app(SQLITE_PRAGMAS={'synchronous': 'FULL'})
+    with app.app_context():
+        assert _pragma('journal_mode') == 'wal'
+        assert _pragma('foreign_keys') == 1
+        assert _pragma('busy_timeout') == 5000
+        assert _pragma('synchronous') == 2  # FULL: config ghi đè giá trị của profile
+        assert db.engine.pool.size() == 10
+
+
+def test_none_profile_keeps_sqlite_defaults(file_app):
+    app = file_app(DATABASE_PROFILE='none')
+    with app.app_context():
+        assert _pragma('journal_mode') == 'delete'
+        assert _pragma('foreign_keys') == 0
+
+
+def test_engine_options_per_backend(app):
+    assert engine_options(app, 'postgresql://db.example/otaku') == SERVER_ENGINE_OPTIONS
+    assert engine_options(app, 'sqlite://') == {}
+    assert engine_options(app, 'sqlite:////tmp/app.db')['connect_args'] == {'check_same_thread': False, 'timeout': 5.0}
+    app.config['DATABASE_PROFILE'] = 'none'
+    assert engine_options(app, 'postgresql://db.example/otaku') == {}
+
+
+@pytest.fixture
+def replica_app(file_app, tmp_path):
+    """Primary và một replica có cùng dữ liệu, chỉ khác tiêu đề bài viết để biết câu đọc đi đâu."""
+    app = file_app(DATABASE_REPLICA_URIS=[f'sqlite:///{tmp_path / "replica.db"}'])
+    with app.app_context():
+        author = User(username='author', email='author@example.com')
+        author.set_password('secret1')
+        db.session.add(author)
+        db.session.flush()
+        db.session.add(Post(title='Bài trên primary', content='Nội dung', author_id=author.id))
+        db.session.commit()
+        replica = db.engines['replica_0']
+        db.metadata.create_all(replica)
+        with db.engine.connect() as primary, replica.begin() as connection:
+            for table in (User.__table__, Post.__table__):
+                connection.execute(insert(table), [row._asdict() for row in primary.execute(select(table))])
+            connection.execute(update(Post.__table__).values(title='Bài trên replica'))
+    return app
+
+
+def _home_title(client):
+    html = client.get('/').data.decode()
+    return 'replica' if 'Bài trên replica' in html else 'primary' if 'Bài trên primary' in html else None
+
+
+def test_reads_go_to_replica_until_client_writes(replica_app, monkeypatch):
+    client = replica_app.test_client()
+    assert _home_title(client) == 'replica'
+
+    client.post('/auth/login', data={'username_or_email': 'author', 'password': 'secret1'})
+    assert client.post('/post/1/like').status_code == 302
+    with client.session_transaction() as session:
+        assert database._STICKY_KEY in session
+    # Vừa ghi: đọc lại chính dữ liệu của mình từ primary
+    assert _home_title(client) == 'primary'
+
+    # Hết DATABASE_REPLICA_STICKY_SECONDS: quay lại replica
+    later = time.time() + 10
+    monkeypatch.setattr(database, 'time', types.SimpleNamespace(time=lambda: later))
+    assert _home_title(client) == 'replica'
+
+
+def test_session_reads_from_primary_after_writing(replica_app):
+    with replica_app.test_request_context('/'):
+        db.session().info[database._USE_REPLICA] = True
+        assert db.session.scalar(select(Post.title)) == 'Bài trên replica'
+        db.session.get(Post, 1).content = 'Sửa'
+        db.session.flush()
+        assert db.session.scalar(select(Post.title)) == 'Bài trên primary'
+        db.session.rollback()
@@ -0,0 +1,67 @@
+import json
+import pytest
+from app import db
+from app.models import User
+from app.services.events import event_bus
+
+pytestmark = pytest.mark.parametrize('app_config', [{'SSE_MAX_STREAMS': 1, 'SSE_QUEUE_SIZE': 2,
+                                                     'SSE_HEARTBEAT_INTERVAL': 0.01}])
+
+
+def _event(chunk):
+    name, data = chunk.decode().strip().split('\n')
+    return name[len('event: '):], json.loads(data[len('data: '):])
+
+
+def test_stream_cap_returns_503_until_a_stream_closes(app, client, make_user, login):
+    make_user('reader')
+    login('reader')
+    stream = client.get('/notifications/stream')
+    chunks = iter(stream.response)
+    assert _event(next(chunks)) == ('unread', {'unread': 0})
+    assert event_bus.active_streams() == 1
+
+    refused = client.get('/notifications/stream')
+    assert refused.status_code == 503
+    assert refused.headers['Retry-After'] == '30'
+
+    stream.close()
+    assert event_bus.active_streams() == 0
+    again = client.get('/notifications/stream')
+    assert again.status_code == 200
+    again.close()
+
+
+def test_events_are_published_only_after_commit(app, client, make_user, login):
+    reader = make_user('reader')
+    login('reader')
+    stream = client.get('/notifications/stream')
+    chunks = iter(stream.response)
+    next(chunks)
+    with app.app_context():
+        user = db.session.get(User, reader)
+        event_bus.publish_after_commit(reader, 'notification', dict(content='bị hủy'))
+        db.session.rollback()
+        event_bus.publish_after_commit(reader, 'notification', dict(content='đã lưu'))
+        user.adjust_unread_notifications(1)
+        db.session.commit()
+    chunk = next(chunks)
+    while chunk.startswith(b':'):  # heartbeat
+        chunk = next(chunks)
+    assert _event(chunk) == ('notification', {'content': 'đã lưu'})
+    stream.close()
+
+
+def test_slow_client_overflow_closes_the_stream(app, client, make_user, login):
+    reader = make_user('reader')
+    login('reader')
+    stream = client.get('/notifications/stream')
+    chunks = iter(stream.response)
+    next(chunks)
+    [subscription] = event_bus._subscribers[reader]
+    for index in range(3):
+        event_bus.publish(reader, 'notification', dict(index=index))
+    assert subscription.overflowed
+    assert list(chunks) == []  # hàng đợi bị bỏ, luồng SSE kết thúc
+    assert event_bus.active_streams() == 0
+    assert not event_bus.has_subscribers(reader)
@@ -0,0 +1,71 @@
+import re
+from datetime import datetime
+import pytest
+from app import db
+from app.models import Post
+from app.services.pagination import encode_cursor
+
+
+def _page(client, url):
+    html = client.get(url).data.decode()
+    post_ids = [int(post_id) for post_id in re.findall(r'/post/(\d+)"', html)]
+    cursors = {label: cursor for cursor, label in re.findall(r'cursor=([\w-]+)">(« Trang trước|Trang sau »)', html)}
+    return list(dict.fromkeys(post_ids)), cursors
+
+
+def test_home_feed_query_count_does_not_grow_with_posts(app, client, make_user, make_posts, count_queries):
+    author = make_user('author')
+    make_posts(author, 2)
+    with count_queries() as few:
+        assert client.get('/').status_code == 200
+
+    for index in range(4):
+        make_posts(make_user(f'author{index}'), 2, genre_names=('Shounen', f'Genre {index}'))
+    with count_queries() as many:
+        assert client.get('/').status_code == 200
+
+    assert many.count == few.count
+    # Trang bài viết + thể loại (selectin); không có truy vấn riêng cho từng bài/tác giả
+    assert many.count <= 3
+
+
+def test_profile_query_count_does_not_grow_with_posts(app, client, make_user, make_posts, count_queries):
+    author = make_user('author')
+    make_posts(author, 1)
+    with count_queries() as few:
+        assert client.get('/profile/author').status_code == 200
+
+    make_posts(author, 8, genre_names=('Shounen', 'Isekai'))
+    with count_queries() as many:
+        assert client.get('/profile/author').status_code == 200
+
+    assert many.count == few.count
+
+
+@pytest.mark.parametrize('app_config', [{'POSTS_PER_PAGE': 3}])
+def test_home_feed_cursors_walk_every_post_once(app, client, make_user, make_posts):
+    post_ids = make_posts(make_user('author'), 7)
+    with app.app_context():
+        # Cùng created_at cho mọi bài: thứ tự phải dựa vào id để không lặp/mất bài
+        Post.query.update({Post.created_at: datetime(2024, 1, 1)})
+        db.session.commit()
+
+    pages, url = [], '/'
+    while url:
+        post_ids_on_page, cursors = _page(client, url)
+        pages.append(post_ids_on_page)
+        url = f'/?cursor={cursors["Trang sau »"]}' if 'Trang sau »' in cursors else None
+    assert pages == [post_ids[6:3:-1], post_ids[3:0:-1], post_ids[:1]]
+
+    # Từ trang cuối lùi lại trang giữa, rồi trang đầu (trang đầu không còn nút lùi)
+    post_ids_on_page, cursors = _page(client, f'/?cursor={cursors["« Trang trước"]}')
+    assert post_ids_on_page == post_ids[3:0:-1]
+    post_ids_on_page, cursors = _page(client, f'/?cursor={cursors["« Trang trước"]}')
+    assert post_ids_on_page == post_ids[6:3:-1]
+    assert '« Trang trước' not in cursors and 'Trang sau »' in cursors
+
+def test_malformed_cursor_falls_back_to_first_page(client, make_user, make_posts):
+    post_ids = make_posts(make_user('author'), 2)
+    for cursor in ('not-a-cursor', 'W10', encode_cursor(Post(id=1, created_at=None), 'sideways')):
+        assert client.get(f'/?cursor={cursor}').status_code == 200
+        assert _page(client, f'/?cursor={cursor}')[0] == post_ids[::-1]
@@ -0,0 +1,50 @@
+from app import db
+from app.models import Friendship
+from app.services.friendships import (friendship_graph, RELATIONSHIP_NONE, RELATIONSHIP_FRIENDS,
+                                      RELATIONSHIP_REQUEST_SENT, RELATIONSHIP_REQUEST_RECEIVED)
+
+
+def _state(app, user_id, other_id):
+    # Một app context mới cho mỗi lần đọc, cache friend_ids thì dùng chung
+    with app.app_context():
+        return friendship_graph.friend_ids(user_id), friendship_graph.relationship(user_id, other_id)
+
+
+def test_friend_ids_cache_follows_accept_and_unfriend(app, client, make_user, login):
+    alice, bob = make_user('alice'), make_user('bob')
+    assert _state(app, alice, bob) == (frozenset(), RELATIONSHIP_NONE)
+
+    login('alice')
+    client.post('/friend/send_request/bob')
+    assert _state(app, alice, bob) == (frozenset(), RELATIONSHIP_REQUEST_SENT)
+    assert _state(app, bob, alice) == (frozenset(), RELATIONSHIP_REQUEST_RECEIVED)
+
+    client.get('/auth/logout')
+    login('bob')
+    assert client.post('/friend/accept_request/alice').status_code == 302
+    assert _state(app, alice, bob) == ({bob}, RELATIONSHIP_FRIENDS)
+    assert _state(app, bob, alice) == ({alice}, RELATIONSHIP_FRIENDS)
+
+    assert client.post('/friend/unfriend/alice').status_code == 302
+    assert _state(app, alice, bob) == (frozenset(), RELATIONSHIP_NONE)
+    assert _state(app, bob, alice) == (frozenset(), RELATIONSHIP_NONE)
+
+
+def test_blocking_invalidates_friend_ids_only_after_commit(app, make_user):
+    alice, bob = make_user('alice'), make_user('bob')
+    with app.app_context():
+        db.session.add(Friendship(user_id=alice, friend_id=bob, status='accepted'))
+        db.session.commit()
+        assert friendship_graph.friend_ids(bob) == {alice}
+
+        friendship = Friendship.query.filter_by(user_id=alice, friend_id=bob).one()
+        friendship.status = 'blocked'
+        db.session.flush()
+        assert friendship_graph.friend_ids(bob) == {alice}  # chưa commit: vẫn là giá trị cache
+        db.session.rollback()
+        assert friendship_graph.friend_ids(bob) == {alice}
+
+        friendship.status = 'blocked'
+        db.session.commit()
+    assert _state(app, bob, alice) == (frozenset(), RELATIONSHIP_NONE)
+    assert _state(app, alice, bob)[0] == frozenset()
@@ -0,0 +1,38 @@
+import re
+from app.models import Genre
+
+
+def _genre_id(app, name):
+    with app.app_context():
+        return Genre.query.filter_by(name=name).one().id
+
+
+def test_genre_page_query_count_does_not_grow_with_posts(app, client, make_user, make_posts, count_queries):
+    make_posts(make_user('author'), 2, genre_names=('Shounen',))
+    shounen = _genre_id(app, 'Shounen')
+    client.get(f'/genre/{shounen}')  # nạp danh mục thể loại vào cache
+    with count_queries() as few:
+        assert client.get(f'/genre/{shounen}').status_code == 200
+
+    for index in range(4):
+        make_posts(make_user(f'author{index}'), 3, genre_names=('Shounen', f'Genre {index}', 'Isekai'))
+    with count_queries() as many:
+        assert client.get(f'/genre/{shounen}').status_code == 200
+
+    assert many.count == few.count
+    # Trang bài viết (kèm tác giả) + thể loại của các bài trên trang (selectin)
+    assert many.count == 2
+
+
+def test_genre_match_all_query_count(app, client, make_user, make_posts, count_queries):
+    author = make_user('author')
+    both = make_posts(author, 3, genre_names=('Shounen', 'Isekai'))
+    make_posts(author, 3, genre_names=('Shounen',))
+    shounen, isekai = _genre_id(app, 'Shounen'), _genre_id(app, 'Isekai')
+    url = f'/genre/{shounen}?with={isekai}&mode=all'
+    client.get(url)
+    with count_queries() as counter:
+        response = client.get(url)
+    assert response.status_code == 200
+    assert {int(post_id) for post_id in re.findall(r'/post/(\d+)"', response.data.decode())} == set(both)
+    assert counter.count == 2
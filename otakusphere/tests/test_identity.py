@@ -0,0 +1,40 @@
+from app import db, cache
+from app.models import User
+from app.services.identity import IDENTITY_NAMESPACE, load_identity
+
+
+def test_unread_counter_invalidates_cached_identity_only_after_commit(app, make_user):
+    user_id = make_user('reader')
+    with app.app_context():
+        assert load_identity(user_id).unread_notifications == 0
+        user = db.session.get(User, user_id)
+
+        user.adjust_unread_notifications(1)
+        assert cache.get(IDENTITY_NAMESPACE, user_id) is not None
+        db.session.rollback()
+        assert cache.get(IDENTITY_NAMESPACE, user_id) is not None
+
+        user.adjust_unread_notifications(1)
+        db.session.commit()
+        assert cache.get(IDENTITY_NAMESPACE, user_id) is None
+        assert load_identity(user_id).unread_notifications == 1
+
+
+def test_admin_role_and_active_changes_reach_logged_in_user(app, make_user):
+    make_user('boss', role='admin')
+    member = make_user('member')
+    admin_client, member_client = app.test_client(), app.test_client()
+    for client, username in ((admin_client, 'boss'), (member_client, 'member')):
+        client.post('/auth/login', data={'username_or_email': username, 'password': 'secret1'})
+
+    # Danh tính của member đã nằm trong cache (TTL 30 giây) trước khi admin đổi quyền
+    assert member_client.get('/admin/').status_code == 403
+    admin_client.post(f'/admin/users/{member}/set_role/admin')
+    assert member_client.get('/admin/').status_code == 200
+    admin_client.post(f'/admin/users/{member}/set_role/user')
+    assert member_client.get('/admin/').status_code == 403
+
+    admin_client.post(f'/admin/users/{member}/toggle_active')
+    assert cache.get(IDENTITY_NAMESPACE, member) is None
+    with app.app_context():
+        assert load_identity(member).is_active is False
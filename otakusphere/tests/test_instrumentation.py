@@ -0,0 +1,57 @@
+import pytest
+from app import db
+from app.instrumentation import instrumentation
+from app.models import User
+
+pytestmark = pytest.mark.parametrize('app_config', [{'INSTRUMENTATION_ENABLED': True,
+                                                     'INSTRUMENTATION_N_PLUS_ONE_THRESHOLD': 3}])
+
+
+@pytest.fixture
+def instrumented_app(app):
+    # Hai route chỉ dùng trong test: một câu SELECT lặp theo từng id, và các câu SELECT khác nhau
+    @app.route('/_test/one-by-one')
+    def one_by_one():
+        return ','.join(db.session.query(User.username).filter(User.id == user_id).scalar()
+                        for user_id in range(1, 5))
+
+    @app.route('/_test/distinct-queries')
+    def distinct_queries():
+        db.session.query(User.id).count()
+        db.session.query(User.username).first()
+        db.session.query(User.email).first()
+        return 'ok'
+
+    instrumentation.reset()
+    yield app
+    instrumentation.reset()
+
+
+def test_repeated_select_is_reported_as_n_plus_one(instrumented_app, make_user, caplog):
+    for name in ('a', 'b', 'c', 'd'):
+        make_user(name)
+    client = instrumented_app.test_client()
+    client.get('/_test/distinct-queries')
+    assert instrumentation.snapshot()['n_plus_one'] == []
+
+    client.get('/_test/one-by-one')
+    snapshot = instrumentation.snapshot()
+    [suspect] = snapshot['n_plus_one']
+    assert suspect['endpoint'] == 'one_by_one' and suspect['count'] == 4
+    assert 'FROM users' in suspect['statement']
+    assert 'Nghi N+1 tại one_by_one' in caplog.text
+
+    endpoints = dict(snapshot['endpoints'])
+    assert endpoints['one_by_one']['n_plus_one'] == 1
+    assert endpoints['one_by_one']['max_sql_count'] == 4
+    assert endpoints['distinct_queries']['n_plus_one'] == 0
+
+
+def test_sql_outside_requests_is_not_counted(instrumented_app, make_user):
+    make_user('a')
+    with instrumented_app.app_context():
+        for _ in range(5):
+            db.session.get(User, 1)
+            db.session.expire_all()
+    snapshot = instrumentation.snapshot()
+    assert snapshot['endpoints'] == [] and snapshot['n_plus_one'] == []
@@ -0,0 +1,62 @@
+import io
+import os
+import pytest
+from werkzeug.datastructures import FileStorage
+from app import db
+from app.models import Post, PostMedia
+from app.services.media import media_pipeline
+
+
+def _upload(content, filename='cover.png'):
+    return FileStorage(stream=io.BytesIO(content), filename=filename)
+
+
+def test_files_of_rolled_back_transaction_are_removed(app, make_user, make_posts):
+    author_id = make_user('author')
+    post_id = make_posts(author_id, 1)[0]
+    with app.app_context():
+        db.session.get(Post, post_id)  # mở transaction như route (bài đã có id)
+        discarded = media_pipeline.store(_upload(b'rolled back'), max_size=1024)
+        db.session.rollback()
+        assert not os.path.exists(media_pipeline._path(discarded))
+
+        kept = media_pipeline.store(_upload(b'committed'), max_size=1024)
+        db.session.add(PostMedia(post_id=post_id, media_type='image', file_path=kept))
+        db.session.commit()
+        assert os.path.exists(media_pipeline._path(kept))
+
+        # Cùng nội dung với file đã có PostMedia: không bị xóa khi transaction sau bị hủy
+        db.session.get(Post, post_id)
+        assert media_pipeline.store(_upload(b'committed'), max_size=1024) == kept
+        db.session.rollback()
+        assert os.path.exists(media_pipeline._path(kept))
+
+
+@pytest.mark.parametrize('app_config', [{'MAX_CONTENT_LENGTH': 1024}])
+def test_request_too_large_redirects_only_on_upload_routes(app, client, make_user, login):
+    make_user('author')
+    response = client.post('/auth/login', data={'username_or_email': 'x' * 4096})
+    assert response.status_code == 413
+
+    login('author')
+    response = client.post('/post/new', data={'title': 'x' * 4096})
+    assert response.status_code == 302
+
+
+def test_rollback_keeps_file_claimed_by_another_open_transaction(app, make_user, make_posts):
+    author_id = make_user('author')
+    post_id = make_posts(author_id, 1)[0]
+    with app.app_context():
+        first = db.session()
+        first.get(Post, post_id)
+        path = media_pipeline.store(_upload(b'shared'), max_size=1024)
+        with app.app_context():
+            # Request khác (session khác) trùng nội dung: không ghi file mới, chưa commit
+            db.session.get(Post, post_id)
+            assert media_pipeline.store(_upload(b'shared'), max_size=1024) == path
+            first.rollback()
+            assert os.path.exists(media_pipeline._path(path))
+            db.session.add(PostMedia(post_id=post_id, media_type='image', file_path=path))
+            db.session.commit()
+        assert os.path.exists(media_pipeline._path(path))
+        assert not media_pipeline._claims
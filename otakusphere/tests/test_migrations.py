@@ -0,0 +1,60 @@
+import os
+import pytest
+from flask_migrate import upgrade, downgrade
+from sqlalchemy import text
+from app import create_app, db
+from tests.conftest import TestConfig
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'migrations')
+
+
+@pytest.fixture
+def migrated_app(tmp_path):
+    config = type('MigrationConfig', (TestConfig,), dict(
+        SQLALCHEMY_DATABASE_URI=f'sqlite:///{tmp_path / "app.db"}',
+        MEDIA_ROOT=str(tmp_path / 'media'), NOTIFICATION_OUTBOX_PATH=str(tmp_path / 'outbox.db')))
+    app = create_app(config)
+    with app.app_context():
+        yield app
+        db.session.remove()
+
+
+def test_counter_columns_are_backfilled(migrated_app):
+    upgrade(MIGRATIONS, '0001')
+    with db.engine.begin() as connection:
+        for statement in (
+            "INSERT INTO users (id, username, email, password_hash, role, is_active) VALUES "
+            "(1, 'a', 'a@x', 'h', 'user', 1), (2, 'b', 'b@x', 'h', 'user', 1), (3, 'c', 'c@x', 'h', 'user', 1)",
+            "INSERT INTO posts (id, title, content, author_id) VALUES (1, 't', 'c', 1), (2, 't', 'c', 1)",
+            "INSERT INTO post_likes (user_id, post_id) VALUES (2, 1), (3, 1)",
+            "INSERT INTO comments (post_id, author_id, content) VALUES (1, 2, 'x'), (2, 3, 'y'), (2, 3, 'z')",
+            "INSERT INTO friendships (user_id, friend_id, status) VALUES (1, 2, 'accepted'), (3, 1, 'accepted'), "
+            "(2, 3, 'pending')",
+            "INSERT INTO notifications (user_id, type, content, is_read) VALUES "
+            "(1, 'new_like', 'x', 0), (1, 'new_like', 'y', 1), (2, 'new_comment', 'z', 0)",
+        ):
+            connection.execute(text(statement))
+
+    upgrade(MIGRATIONS, '0002')
+    with db.engine.connect() as connection:
+        posts = connection.execute(text('SELECT id, like_count, comment_count FROM posts ORDER BY id')).all()
+        users = connection.execute(
+            text('SELECT id, unread_notifications, friend_count FROM users ORDER BY id')).all()
+        actor_counts = connection.execute(text('SELECT DISTINCT actor_count FROM notifications')).scalars().all()
+    assert [tuple(row) for row in posts] == [(1, 2, 1), (2, 0, 2)]
+    assert [tuple(row) for row in users] == [(1, 1, 2), (2, 1, 1), (3, 0, 1)]
+    assert actor_counts == [1]
+
+    downgrade(MIGRATIONS, '0001')
+    columns = {column['name'] for column in db.inspect(db.engine).get_columns('posts')}
+    assert 'like_count' not in columns
+
+
+def test_head_matches_models(migrated_app):
+    from alembic.migration import MigrationContext
+    from alembic.autogenerate import compare_metadata
+    upgrade(MIGRATIONS)
+    with db.engine.connect() as connection:
+        context = MigrationContext.configure(connection, opts=dict(
+            include_name=lambda name, type_, parent_names: not (type_ == 'table' and name.startswith('search_index'))))
+        assert compare_metadata(context, db.metadata) == []
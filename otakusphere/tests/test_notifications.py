@@ -0,0 +1,126 @@
+import re
+from datetime import datetime
+import pytest
+from app import db
+from app.models import User, Notification
+from app.services.notifications import notification_dispatcher
+
+
+class StopLoop(BaseException):
+    pass
+
+
+@pytest.mark.parametrize('app_config', [{'NOTIFICATION_DISPATCH': 'async', 'NOTIFICATION_FLUSH_INTERVAL': 0.01,
+                                         'NOTIFICATION_COMPACT_INTERVAL': 0}])
+def test_dispatcher_loop_survives_errors_outside_delivery(app, monkeypatch, caplog):
+    calls = []
+
+    def drain_once():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError('database is locked')
+        raise StopLoop()
+
+    monkeypatch.setattr(notification_dispatcher, 'drain_once', drain_once)
+    monkeypatch.setattr(notification_dispatcher, '_thread', object())
+    with pytest.raises(StopLoop):
+        notification_dispatcher._run()
+    # Lỗi đầu tiên chỉ được ghi log, vòng lặp vẫn chạy tiếp; khi luồng dừng thì _thread được xóa
+    assert len(calls) == 2
+    assert 'database is locked' in caplog.text
+    assert notification_dispatcher._thread is None
+
+
+def test_likes_from_two_users_coalesce_into_one_notification(app, client, make_user, make_posts, login):
+    author = make_user('author')
+    make_user('fan1')
+    make_user('fan2')
+    post_id = make_posts(author, 1)[0]
+    for fan in ('fan1', 'fan2'):
+        login(fan)
+        assert client.post(f'/post/{post_id}/like').status_code == 302
+        client.get('/auth/logout')
+
+    with app.app_context():
+        notifications = Notification.query.filter_by(user_id=author).all()
+        assert len(notifications) == 1
+        assert notifications[0].actor_count == 2
+        assert notifications[0].actor_id == User.query.filter_by(username='fan2').one().id
+        assert db.session.get(User, author).unread_notifications == 1
+
+
+def test_alternating_likers_are_counted_once(app, client, make_user, make_posts, login):
+    author = make_user('author')
+    make_user('fan1')
+    make_user('fan2')
+    post_id = make_posts(author, 1)[0]
+    # Thích/bỏ thích qua lại: thông báo thích lần lượt từ fan1, fan2, fan1, fan2
+    for fan, clicks in (('fan1', 1), ('fan2', 1), ('fan1', 2), ('fan2', 2)):
+        login(fan)
+        for _ in range(clicks):
+            assert client.post(f'/post/{post_id}/like').status_code == 302
+        client.get('/auth/logout')
+
+    with app.app_context():
+        notification = Notification.query.filter_by(user_id=author).one()
+        assert notification.actor_count == 2
+        assert notification.content.startswith('fan2 và 1 người khác')
+
+
+def _badge(client):
+    return int(re.search(r'id="unread-badge"[^>]*>(\d+)<', client.get('/').data.decode()).group(1))
+
+
+def test_unread_badge_reads_counter_and_recount_repairs_it(app, client, make_user, login, count_queries):
+    reader = make_user('reader')
+    with app.app_context():
+        user = db.session.get(User, reader)
+        for index in range(3):
+            user.add_notification(None, 'system', f'Thông báo {index}')
+        db.session.commit()
+        assert db.session.get(User, reader).unread_notifications == 3
+
+    login('reader')
+    with count_queries() as queries:
+        assert _badge(client) == 3
+    assert not any('FROM notifications' in statement for statement in queries.statements)
+
+    with app.app_context():
+        User.query.filter_by(id=reader).update({User.unread_notifications: 42})
+        db.session.commit()
+    result = app.test_cli_runner().invoke(args=['recount-unread-notifications', '--batch-size', '1'])
+    assert result.exit_code == 0
+    with app.app_context():
+        assert db.session.get(User, reader).unread_notifications == 3
+
+
+def test_mark_read_uses_one_update_and_keeps_counter_exact(app, client, make_user, login, count_queries):
+    reader = make_user('reader')
+    with app.app_context():
+        user = db.session.get(User, reader)
+        for type, day in (('new_like', 1), ('new_like', 2), ('new_comment', 3), ('new_like', 4)):
+            notification = user.add_notification(None, type, f'{type} {day}')
+            notification.created_at = datetime(2024, 1, day)
+        db.session.commit()
+        latest_id = Notification.query.filter_by(user_id=reader).order_by(Notification.created_at.desc()).first().id
+
+    login('reader')
+    # Một thông báo: đánh dấu hai lần chỉ giảm bộ đếm một lần
+    for _ in range(2):
+        assert client.post(f'/notifications/mark_read/{latest_id}').status_code == 302
+    with app.app_context():
+        assert db.session.get(User, reader).unread_notifications == 3
+    with count_queries() as queries:
+        client.post('/notifications/mark_all_read', data={'type': 'new_like', 'before': '2024-01-03T00:00:00'})
+    updates = [statement for statement in queries.statements if statement.startswith('UPDATE notifications')]
+    assert len(updates) == 1
+
+    with app.app_context():
+        unread = {n.content for n in Notification.query.filter_by(user_id=reader, is_read=False)}
+        assert unread == {'new_comment 3'}
+        assert db.session.get(User, reader).unread_notifications == 1
+
+    client.post('/notifications/mark_all_read')
+    with app.app_context():
+        assert Notification.query.filter_by(user_id=reader, is_read=False).count() == 0
+        assert db.session.get(User, reader).unread_notifications == 0
@@ -0,0 +1,42 @@
+from datetime import datetime, timedelta
+from app import db
+from app.models import Post, DailyStat, EntityCount
+from app.query_audit import run_audit
+
+
+def test_audit_does_not_write_stats(app, make_user, make_posts):
+    author_id = make_user('author')
+    post_ids = make_posts(author_id, 10)
+    with app.app_context():
+        for days_ago, post_id in enumerate(post_ids):
+            db.session.get(Post, post_id).created_at = datetime.utcnow() - timedelta(days=days_ago)
+        db.session.commit()
+
+        run_audit()
+
+        assert DailyStat.query.count() == 0
+        assert EntityCount.query.count() == 0
+
+
+def test_audit_skips_entries_without_samples(app):
+    with app.app_context():
+        findings, skipped = run_audit()
+    assert skipped['friendships'] == ['user_id']
+    assert skipped['admin.posts'] == ['user_id', 'genre_id']
+    assert 'feed.home' not in skipped
+
+
+def test_audit_runs_real_recount_and_compaction_jobs(app, make_user, make_posts):
+    from app.query_audit import Samples, _capture, _recount, _compaction
+    author_id = make_user('author')
+    post_id = make_posts(author_id, 1)[0]
+    with app.app_context():
+        db.session.get(Post, post_id).like_count = 7
+        db.session.commit()
+        statements = [statement for statement, _ in _capture(_recount, Samples())]
+        statements += [statement for statement, _ in _capture(_compaction, Samples())]
+        assert any(statement.startswith('UPDATE posts SET') and 'like_count=' in statement for statement in statements)
+        assert any(statement.startswith('UPDATE users SET') and 'friend_count=' in statement for statement in statements)
+        assert any('notifications' in statement and statement.startswith('SELECT') for statement in statements)
+        # Job chạy thật nhưng bị rollback
+        assert db.session.get(Post, post_id).like_count == 7
@@ -0,0 +1,44 @@
+import pytest
+from app import db
+from app.models import Post
+from app.services.search import search_index
+
+
+def _found(query):
+    return [post_id for post_id, _ in search_index.search(query, limit=10)]
+
+
+def test_fts5_indexes_post_created_through_route(app, client, make_user, make_genre, login):
+    make_user('writer')
+    genre_id = make_genre('Romance')
+    login('writer')
+    response = client.post('/post/new', data={'title': 'Tình yêu học đường', 'content': 'Mùa mới',
+                                              'genres': [genre_id]})
+    assert response.status_code == 302
+    with app.app_context():
+        assert search_index.backend.name == 'fts5'
+        post = Post.query.filter_by(title='Tình yêu học đường').one()
+        assert _found('tinh yeu') == [post.id]
+
+
+@pytest.mark.parametrize('app_config', [{'SEARCH_BACKEND': 'memory'}])
+def test_memory_backend_only_sees_committed_writes(app, make_user):
+    author_id = make_user('writer')
+    with app.app_context():
+        assert search_index.backend.name == 'memory'
+        assert _found('naruto') == []  # dựng chỉ mục (đang rỗng)
+
+        post = Post(title='Naruto tập cuối', content='...', author_id=author_id)
+        db.session.add(post)
+        db.session.flush()
+        search_index.index_post(post)
+        assert _found('naruto') == []
+        db.session.rollback()
+        assert _found('naruto') == []
+
+        post = Post(title='Naruto tập cuối', content='...', author_id=author_id)
+        db.session.add(post)
+        db.session.flush()
+        search_index.index_post(post)
+        db.session.commit()
+        assert _found('naruto') == [post.id]
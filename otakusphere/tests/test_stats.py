@@ -0,0 +1,62 @@
+from datetime import date, datetime
+from app import db
+from app.models import Post, PostLike, Comment, EntityCount, DailyStat
+from app.services.stats import entity_counts, refresh_counts, roll_up_daily_stats, period_totals
+
+
+def _stored_counts():
+    return {row.name: row.value for row in EntityCount.query.all()}
+
+
+def test_counters_follow_orm_writes_and_ignore_rollbacks(app, client, make_user, make_posts, login):
+    author, fan = make_user('author'), make_user('fan')
+    post_ids = make_posts(author, 2)
+    with app.app_context():
+        assert entity_counts() == dict(users=2, posts=2, comments=0, genres=1, likes=0)
+
+    login('fan')
+    client.post(f'/post/{post_ids[0]}/like')
+    with app.app_context():
+        db.session.add(Comment(post_id=post_ids[0], author_id=fan, content='Hay'))
+        db.session.commit()
+        assert _stored_counts() == dict(users=2, posts=2, comments=1, genres=1, likes=1)
+
+        db.session.add(Post(title='Nháp', content='...', author_id=author))
+        db.session.flush()
+        assert _stored_counts()['posts'] == 3  # cùng transaction với INSERT
+        db.session.rollback()
+        assert _stored_counts()['posts'] == 2
+
+    client.post(f'/post/{post_ids[0]}/like')  # bỏ thích
+    with app.app_context():
+        assert _stored_counts()['likes'] == 0
+        # Xóa hàng loạt không qua ORM: chỉ lần đếm lại toàn bảng mới sửa được
+        PostLike.query.delete()
+        Post.query.filter(Post.id == post_ids[1]).delete()
+        db.session.commit()
+        assert _stored_counts()['posts'] == 2
+        assert refresh_counts()['posts'] == 1
+
+
+def test_daily_rollup_recomputes_from_last_day(app, make_user, make_posts):
+    author = make_user('author')
+    post_ids = make_posts(author, 3)
+    with app.app_context():
+        for post_id, day in zip(post_ids, (1, 1, 3)):
+            db.session.get(Post, post_id).created_at = datetime(2024, 1, day, 12)
+        db.session.commit()
+
+        roll_up_daily_stats(backfill_days=2, today=date(2024, 1, 3))
+        new_posts = {row.day: row.value for row in DailyStat.query.filter_by(metric='new_posts')}
+        assert new_posts == {date(2024, 1, 1): 2, date(2024, 1, 2): 0, date(2024, 1, 3): 1}
+
+        # Lần sau chỉ tính lại từ ngày gần nhất đã có, không tạo dòng trùng
+        db.session.get(Post, post_ids[0]).created_at = datetime(2024, 1, 3, 13)
+        db.session.commit()
+        roll_up_daily_stats(today=date(2024, 1, 4))
+        rows = {row.day: row.value for row in DailyStat.query.filter_by(metric='new_posts')}
+        assert rows == {date(2024, 1, 1): 2, date(2024, 1, 2): 0, date(2024, 1, 3): 2, date(2024, 1, 4): 0}
+
+        by_day = {row.day: {row.metric: row.value} for row in DailyStat.query.filter_by(metric='new_posts')}
+        totals = period_totals(by_day, 2, today=date(2024, 1, 4))['new_posts']
+        assert totals == dict(current=2, previous=2, change=0.0)
@@ -0,0 +1,147 @@
+import re
+from datetime import datetime
+import pytest
+from app import db
+from app.models import User, Post, Genre, Friendship, FeedEntry
+from app.services import timeline
+from app.services.pagination import encode_cursor
+
+pytestmark = pytest.mark.parametrize('app_config', [{'TIMELINE_FANOUT_THRESHOLD': 1}])
+
+
+def _befriend(app, user_id, friend_ids):
+    with app.app_context():
+        for friend_id in friend_ids:
+            db.session.add(Friendship(user_id=user_id, friend_id=friend_id, status='accepted'))
+        db.session.commit()
+
+
+def _timeline_post_ids(client):
+    response = client.get('/timeline')
+    assert response.status_code == 200
+    return {int(post_id) for post_id in re.findall(r'/post/(\d+)"', response.data.decode())}
+
+
+def _timeline_page(client, url):
+    html = client.get(url).data.decode()
+    next_cursor = re.search(r'cursor=([\w-]+)">Trang sau', html)
+    post_ids = list(dict.fromkeys(int(post_id) for post_id in re.findall(r'/post/(\d+)"', html)))
+    return post_ids, next_cursor and next_cursor.group(1)
+
+
+def _feed(app, user_id):
+    with app.app_context():
+        return {row.post_id for row in FeedEntry.query.filter_by(user_id=user_id)}
+
+
+def test_unfriend_backfills_author_who_drops_to_threshold(app, client, make_user, make_posts, login):
+    author, reader, other = make_user('author'), make_user('reader'), make_user('other')
+    _befriend(app, author, [reader, other])
+    with app.app_context():
+        User.query.filter(User.id == author).update({User.friend_count: 2})
+        User.query.filter(User.id.in_([reader, other])).update({User.friend_count: 1})
+        db.session.commit()
+    # Tác giả vượt ngưỡng: bài không được fan-out, người đọc thấy nhờ lấy lúc đọc
+    post_ids = make_posts(author, 3)
+    login('reader')
+    assert _timeline_post_ids(client) == set(post_ids)
+
+    client.get('/auth/logout')
+    login('author')
+    assert client.post('/friend/unfriend/other').status_code == 302
+    with app.app_context():
+        assert db.session.get(User, author).friend_count == 1
+        assert {row.post_id for row in FeedEntry.query.filter_by(user_id=reader)} == set(post_ids)
+        assert FeedEntry.query.filter_by(user_id=other).count() == 0
+
+    client.get('/auth/logout')
+    login('reader')
+    assert _timeline_post_ids(client) == set(post_ids)
+
+
+def test_recount_friend_counts_fixes_counts_and_backfills(app, client, make_user, make_posts, login):
+    author, reader = make_user('author'), make_user('reader')
+    _befriend(app, author, [reader])
+    # friend_count bị lệch (quan hệ có từ trước khi có cột): tác giả đang bị coi là vượt ngưỡng
+    with app.app_context():
+        User.query.filter(User.id == author).update({User.friend_count: 5})
+        db.session.commit()
+    post_ids = make_posts(author, 2)
+
+    result = app.test_cli_runner().invoke(args=['recount-friend-counts'])
+    assert result.exit_code == 0, result.output
+    with app.app_context():
+        assert {user.id: user.friend_count for user in User.query} == {author: 1, reader: 1}
+        assert {row.post_id for row in FeedEntry.query.filter_by(user_id=reader)} == set(post_ids)
+    login('reader')
+    assert _timeline_post_ids(client) == set(post_ids)
+
+
+def test_accept_backfills_new_posts_fan_out_and_unfriend_purges(app, client, make_user, make_posts, login):
+    author, reader = make_user('author'), make_user('reader')
+    old_post_ids = make_posts(author, 2)
+    login('reader')
+    client.post('/friend/send_request/author')
+    client.get('/auth/logout')
+    login('author')
+    client.post('/friend/accept_request/reader')
+    assert _feed(app, reader) == set(old_post_ids)
+
+    with app.app_context():
+        genre_id = Genre.query.filter_by(name='Shounen').one().id
+    client.post('/post/new', data={'title': 'Bài mới', 'content': 'Nội dung', 'genres': [genre_id]})
+    with app.app_context():
+        new_post_id = Post.query.filter_by(title='Bài mới').one().id
+    assert _feed(app, reader) == set(old_post_ids) | {new_post_id}
+    assert _feed(app, author) == set()
+
+    client.post('/friend/unfriend/reader')
+    assert _feed(app, reader) == set()
+
+
+def test_fan_out_trims_timeline_to_max_length(app, client, make_user, make_genre, login):
+    author, reader = make_user('author'), make_user('reader')
+    genre_id = make_genre('Shounen')
+    _befriend(app, author, [reader])
+    app.config.update(TIMELINE_MAX_LENGTH=2, TIMELINE_TRIM_PROBABILITY=1)
+    login('author')
+    for index in range(3):
+        client.post('/post/new', data={'title': f'Bài {index}', 'content': 'Nội dung', 'genres': [genre_id]})
+    with app.app_context():
+        assert Post.query.filter_by(author_id=author).count() == 3
+        newest = [post.id for post in Post.query.order_by(Post.id.desc()).limit(2)]
+    assert _feed(app, reader) == set(newest)
+
+
+def test_timeline_cursor_merges_pushed_and_pulled_posts(app, client, make_user, make_posts, login):
+    reader, other = make_user('reader'), make_user('other')
+    pushed, pulled = make_user('pushed'), make_user('pulled')
+    _befriend(app, pushed, [reader])
+    _befriend(app, pulled, [reader, other])
+    pushed_ids, pulled_ids = make_posts(pushed, 3), make_posts(pulled, 3)
+    with app.app_context():
+        for user_id, friend_count in ((reader, 2), (other, 1), (pushed, 1), (pulled, 2)):
+            db.session.get(User, user_id).friend_count = friend_count
+        # Bài của hai tác giả xen kẽ nhau theo thời gian, hai bài cuối cùng created_at
+        for day, post_id in zip((1, 2, 3, 4, 5, 5), (pushed_ids[0], pulled_ids[0], pushed_ids[1],
+                                                    pulled_ids[1], pushed_ids[2], pulled_ids[2])):
+            db.session.get(Post, post_id).created_at = datetime(2024, 1, day)
+        db.session.flush()
+        timeline.backfill_author(pushed)  # chỉ 'pushed' được fan-out khi ghi
+        db.session.commit()
+    assert _feed(app, reader) == set(pushed_ids)
+
+    app.config['POSTS_PER_PAGE'] = 2
+    login('reader')
+    seen, url = [], '/timeline'
+    while url:
+        post_ids, cursor = _timeline_page(client, url)
+        assert len(post_ids) <= 2
+        seen += post_ids
+        url = cursor and f'/timeline?cursor={cursor}'
+    assert seen == [pulled_ids[2], pushed_ids[2], pulled_ids[1], pushed_ids[1], pulled_ids[0], pushed_ids[0]]
+
+    # Bảng tin chỉ phân trang theo chiều tiến: cursor 'prev' được coi như trang đầu
+    with app.app_context():
+        prev_cursor = encode_cursor(db.session.get(Post, pushed_ids[0]), 'prev')
+    assert _timeline_page(client, f'/timeline?cursor={prev_cursor}')[0] == seen[:2]